@@ -2,6 +2,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 import torch
 import numpy as np
+import torch.utils.checkpoint
 from magic import cudafy
 
 def _print_layer_output_shape(layer_name, output_shape):
@@ -46,12 +47,14 @@ class HALNetResBlockIDSkip(nn.Module):
                                                first_in_channels=
                                                filters2)
         self.relu = nn.ReLU()
+        # a module (instead of +) so the sum can be quantized; behaves as + in float
+        self.skip_add = nn.quantized.FloatFunctional()
 
     def forward(self, input):
         left_res = input
         right_res = self.right_res(input)
         # element-wise sum
-        out = left_res + right_res
+        out = self.skip_add.add(left_res, right_res)
         out = self.relu(out)
         return out
 
@@ -76,12 +79,14 @@ class HALNetResBlockConv(nn.Module):
                                                first_in_channels=
                                                first_in_channels)
         self.relu = nn.ReLU()
+        # a module (instead of +) so the sum can be quantized; behaves as + in float
+        self.skip_add = nn.quantized.FloatFunctional()
 
     def forward(self, input):
         left_res = self.left_res(input)
         right_res = self.right_res(input)
         # element-wise sum
-        out = left_res + right_res
+        out = self.skip_add.add(left_res, right_res)
         out = self.relu(out)
         return out
 
@@ -109,15 +114,71 @@ class SoftmaxLogProbability2D(torch.nn.Module):
         super(SoftmaxLogProbability2D, self).__init__()
 
     def forward(self, x):
-        orig_shape = x.data.shape
-        seq_x = []
-        for channel_ix in range(orig_shape[1]):
-            softmax_ = F.softmax(x[:, channel_ix, :, :].contiguous()
-                                 .view((orig_shape[0], orig_shape[2] * orig_shape[3])), dim=1)\
-                .view((orig_shape[0], orig_shape[2], orig_shape[3]))
-            seq_x.append(softmax_.log())
-        x = torch.stack(seq_x, dim=1)
-        return x
+        # log-softmax of each channel over its whole 2D map
+        # (no hard-coded batch size, so traced/exported graphs keep a dynamic batch)
+        return F.log_softmax(x.flatten(start_dim=2), dim=2).view_as(x)
+
+def heatmap_confidence(heatmaps, measure='peak', log_probs=False):
+    '''
+    Per-frame confidence of a batch of heatmaps, for early exit
+    Each joint's heatmap is turned into a spatial distribution: a softmax of
+    log-probabilities, or the positive part of a regressed heatmap, normalised
+    :param measure: 'peak' (highest probability) or 'entropy' (1 - entropy / log(num pixels))
+    :return: batch tensor with the confidence of the least confident joint of each frame
+    '''
+    flat = heatmaps.flatten(start_dim=2)
+    if log_probs:
+        probs = F.softmax(flat, dim=2)
+    else:
+        probs = flat.clamp(min=0)
+        probs = probs / probs.sum(dim=2, keepdim=True).clamp(min=1e-12)
+    if measure == 'peak':
+        joint_confidences = probs.max(dim=2)[0]
+    elif measure == 'entropy':
+        entropy = -(probs * torch.log(probs.clamp(min=1e-12))).sum(dim=2)
+        joint_confidences = 1 - entropy / np.log(flat.shape[2])
+    else:
+        raise ValueError('Confidence measure ' + str(measure) + ' does not exist. Valid measures are: peak, entropy')
+    # a heatmap with no positive value has no confidence at all
+    joint_confidences = joint_confidences * (probs.sum(dim=2) > 0).to(joint_confidences.dtype)
+    return joint_confidences.min(dim=1)[0]
+
+class _CheckpointedStage:
+    '''
+    Runs a stage of blocks under activation checkpointing: only the stage input is kept
+    for backward, and the stage forward is run again to rebuild its activations
+    The rerun does not update the batch norm running statistics a second time
+    '''
+    def __init__(self, blocks, return_first):
+        self.blocks = blocks
+        self.return_first = return_first
+        self.num_calls = 0
+
+    def __call__(self, x):
+        self.num_calls += 1
+        if self.num_calls == 1:
+            return self._forward(x)
+        batch_norms = [module for block in self.blocks for module in block.modules()
+                       if isinstance(module, nn.modules.batchnorm._BatchNorm)]
+        momentums = [batch_norm.momentum for batch_norm in batch_norms]
+        nums_batches_tracked = [batch_norm.num_batches_tracked.clone() for batch_norm in batch_norms]
+        for batch_norm in batch_norms:
+            batch_norm.momentum = 0.
+        try:
+            return self._forward(x)
+        finally:
+            for batch_norm, momentum, num_batches_tracked in zip(batch_norms, momentums, nums_batches_tracked):
+                batch_norm.momentum = momentum
+                batch_norm.num_batches_tracked.copy_(num_batches_tracked)
+
+    def _forward(self, x):
+        first_out = self.blocks[0](x)
+        out = first_out
+        for block in self.blocks[1:]:
+            out = block(out)
+        if self.return_first:
+            return first_out, out
+        return out
 
 def parse_model_param(params_dict, key, default_value):
     try:
@@ -138,6 +199,15 @@ class HALNet(nn.Module):
     WEIGHT_LOSS_INTERMED2 = 0.5
     WEIGHT_LOSS_INTERMED3 = 0.5
     WEIGHT_LOSS_MAIN = 1
+    # early exits of forward_early_exit: (head, trunk blocks run before it)
+    EARLY_EXITS = [('interm_loss1', ['conv1', 'mp1', 'res2a', 'res2b', 'res2c', 'res3a']),
+                   ('interm_loss2', ['res3b', 'res3c', 'res4a']),
+                   ('interm_loss3', ['res4b', 'res4c', 'res4d', 'conv4e']),
+                   ('main_loss_conv', ['conv4f'])]
+    # stages of forward_common_net that can be run under activation checkpointing
+    CHECKPOINT_STAGES = {'res2': ['res2a', 'res2b', 'res2c'],
+                         'res3': ['res3a', 'res3b', 'res3c'],
+                         'res4': ['res4a', 'res4b', 'res4c', 'res4d']}
 
     def __init__(self, params_dict):
         super(HALNet, self).__init__()
@@ -146,6 +216,12 @@ class HALNet(nn.Module):
         self.use_cuda = parse_model_param(params_dict, 'use_cuda', default_value=False)
         self.num_joints = len(self.joint_ixs)
         self.cross_entropy = parse_model_param(params_dict, 'cross_entropy', default_value=False)
+        # trade compute for memory in training: these stages keep only their input for backward
+        self.checkpoint_stages = list(parse_model_param(params_dict, 'checkpoint_stages', default_value=[]))
+        for stage_name in self.checkpoint_stages:
+            if not stage_name in self.CHECKPOINT_STAGES:
+                raise ValueError('Checkpoint stage ' + str(stage_name) + ' does not exist. Valid stages are: ' +
+                                 str(list(self.CHECKPOINT_STAGES.keys())))
         # build network
         self.conv1 = cudafy(HALNetConvBlock(kernel_size=7, stride=1, filters=64,
                                      in_channels=4, padding=3), self.use_cuda)
@@ -189,19 +265,34 @@ class HALNet(nn.Module):
         if self.cross_entropy:
             self.softmax_final = cudafy(SoftmaxLogProbability2D(), self.use_cuda)
 
+    def _forward_checkpointed(self, stage_name, x, return_first=False):
+        stage = _CheckpointedStage([getattr(self, block_name) for block_name in self.CHECKPOINT_STAGES[stage_name]],
+                                   return_first)
+        return torch.utils.checkpoint.checkpoint(stage, x, use_reentrant=False)
+
     def forward_common_net(self, x):
+        checkpoint_stages = self.checkpoint_stages if self.training and torch.is_grad_enabled() else []
         out = self.conv1(x)
         out = self.mp1(out)
-        out = self.res2a(out)
-        out = self.res2b(out)
-        out = self.res2c(out)
-        res3aout = self.res3a(out)
-        out = self.res3b(res3aout)
-        out = self.res3c(out)
-        res4aout = self.res4a(out)
-        out = self.res4b(res4aout)
-        out = self.res4c(out)
-        out = self.res4d(out)
+        if 'res2' in checkpoint_stages:
+            out = self._forward_checkpointed('res2', out)
+        else:
+            out = self.res2a(out)
+            out = self.res2b(out)
+            out = self.res2c(out)
+        if 'res3' in checkpoint_stages:
+            res3aout, out = self._forward_checkpointed('res3', out, return_first=True)
+        else:
+            res3aout = self.res3a(out)
+            out = self.res3b(res3aout)
+            out = self.res3c(out)
+        if 'res4' in checkpoint_stages:
+            res4aout, out = self._forward_checkpointed('res4', out, return_first=True)
+        else:
+            res4aout = self.res4a(out)
+            out = self.res4b(res4aout)
+            out = self.res4c(out)
+            out = self.res4d(out)
         conv4eout = self.conv4e(out)
         conv4fout = self.conv4f(conv4eout)
         return res3aout, res4aout, conv4eout, conv4fout
@@ -241,4 +332,62 @@ class HALNet(nn.Module):
         out_intermed1, out_intermed2, out_intermed3, conv4fout, _, _, _ = self.forward_subnet(x)
         # out to main loss of halnet
         out_main = self.forward_main_loss(conv4fout)
-        return out_intermed1, out_intermed2, out_intermed3, out_main
\ No newline at end of file
+        return out_intermed1, out_intermed2, out_intermed3, out_main
+
+    def forward_inference(self, x):
+        '''
+        Inference-only forward pass, without autograd and without the intermediate loss heads
+        :return: main heatmaps (same as forward(x)[3])
+        '''
+        with torch.no_grad():
+            _, _, _, conv4fout = self.forward_common_net(x)
+            return self.forward_main_loss(conv4fout)
+
+    def _forward_head(self, head_name, x):
+        if head_name == 'main_loss_conv':
+            # the last exit is always taken, so its confidence (head output) is not needed
+            return None, self.forward_main_loss(x)
+        out = getattr(self, head_name)(x)
+        out_up = getattr(self, head_name + '_deconv')(out)
+        if self.cross_entropy:
+            out_up = getattr(self, head_name + '_softmax')(out_up)
+        return out, out_up
+
+    def forward_early_exit(self, x, thresholds, measure='peak'):
+        '''
+        Adaptive inference: after each intermediate head, the frames whose heatmaps are
+        confident enough (see heatmap_confidence) stop; the rest go on through the deeper blocks
+        :param thresholds: confidence threshold of each intermediate head (a list of 3, or one for all);
+            None skips a head
+        :return: main-resolution heatmaps (as forward_inference) and, per frame, the index of the
+            exit taken (0-2 for the intermediate heads, 3 for the main head)
+        '''
+        num_interm_heads = len(self.EARLY_EXITS) - 1
+        if not isinstance(thresholds, (list, tuple)):
+            thresholds = [thresholds] * num_interm_heads
+        with torch.no_grad():
+            frame_ixs = torch.arange(x.shape[0], device=x.device)
+            exit_ixs = torch.full((x.shape[0],), num_interm_heads, dtype=torch.long, device=x.device)
+            heatmaps = None
+            out = x
+            for exit_ix, (head_name, block_names) in enumerate(self.EARLY_EXITS):
+                for block_name in block_names:
+                    out = getattr(self, block_name)(out)
+                if exit_ix < num_interm_heads and thresholds[exit_ix] is None:
+                    continue
+                head_out, head_heatmaps = self._forward_head(head_name, out)
+                if heatmaps is None:
+                    heatmaps = torch.empty((x.shape[0],) + head_heatmaps.shape[1:],
+                                           dtype=head_heatmaps.dtype, device=x.device)
+                if exit_ix == num_interm_heads:
+                    heatmaps[frame_ixs] = head_heatmaps
+                    break
+                exiting = heatmap_confidence(head_out, measure=measure,
+                                             log_probs=self.cross_entropy) >= thresholds[exit_ix]
+                heatmaps[frame_ixs[exiting]] = head_heatmaps[exiting]
+                exit_ixs[frame_ixs[exiting]] = exit_ix
+                frame_ixs = frame_ixs[~exiting]
+                out = out[~exiting]
+                if frame_ixs.shape[0] == 0:
+                    break
+        return heatmaps, exit_ixs
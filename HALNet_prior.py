@@ -11,15 +11,8 @@ class SoftmaxLogProbability1D(torch.nn.Module):
         super(SoftmaxLogProbability1D, self).__init__()
 
     def forward(self, x):
-        orig_shape = x.data.shape
-        seq_x = []
-        for channel_ix in range(orig_shape[1]):
-            softmax_ = F.softmax(x[:, channel_ix, :].contiguous()
-                                 .view((orig_shape[0], orig_shape[2])), dim=1) \
-                .view((orig_shape[0], orig_shape[2]))
-            seq_x.append(softmax_.log())
-        x = torch.stack(seq_x, dim=1)
-        return x
+        # log-softmax of each channel over its last dimension
+        return F.log_softmax(x, dim=2)
 
 class HALNet_prior(HALNet_class):
     prior_size = (210, 300)
@@ -51,7 +44,7 @@ class HALNet_prior(HALNet_class):
 
     def forward(self, x):
         # get subhalnet outputs (common to JORNet)
-        out_intermed1, out_intermed2, out_intermed3, conv4fout = self.forward_subnet(x)
+        out_intermed1, out_intermed2, out_intermed3, conv4fout, _, _, _ = self.forward_subnet(x)
         # out to main loss of halnet
         out_main = self.forward_main_loss(conv4fout)
         # out to prior
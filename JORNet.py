@@ -1,5 +1,6 @@
 import HALNet as HALNet
 from HALNet import HALNet as HALNet_class
+import torch
 import torch.nn as nn
 from magic import cudafy
 import numpy as np
@@ -69,10 +70,26 @@ class JORNet(HALNet_class):
         out_intermed_j3 = self.innerproduct1_joint3(out_intermed_j3)
         out_intermed_j3 = self.innerproduct2_joint3(out_intermed_j3)
 
-        innerprod1_size = conv4fout.shape[1] * conv4fout.shape[2] * conv4fout.shape[3]
-        out_intermed_j_main = conv4fout.view(-1, innerprod1_size)
-        out_intermed_j_main = self.innerproduct1_joint_main(out_intermed_j_main)
-        out_intermed_j_main = self.innerproduct2_join_main(out_intermed_j_main)
+        out_intermed_j_main = self.forward_main_joints(conv4fout)
 
         return out_intermed_hm1, out_intermed_hm2, out_intermed_hm3, out_intermed_hm_main,\
                out_intermed_j1, out_intermed_j2, out_intermed_j3, out_intermed_j_main
+
+    def forward_main_joints(self, conv4fout):
+        innerprod1_size = conv4fout.shape[1] * conv4fout.shape[2] * conv4fout.shape[3]
+        out_j_main = conv4fout.view(-1, innerprod1_size)
+        out_j_main = self.innerproduct1_joint_main(out_j_main)
+        out_j_main = self.innerproduct2_join_main(out_j_main)
+        return out_j_main
+
+    def forward_inference(self, x):
+        '''
+        Inference-only forward pass, without autograd and without the intermediate
+        heatmap and joint heads
+        :return: main heatmaps and main joints (same as forward(x)[3] and forward(x)[7])
+        '''
+        with torch.no_grad():
+            _, _, _, conv4fout = self.forward_common_net(x)
+            out_hm_main = self.forward_main_loss(conv4fout)
+            out_j_main = self.forward_main_joints(conv4fout)
+        return out_hm_main, out_j_main
@@ -0,0 +1,157 @@
+import argparse
+import os
+import benchmarker
+import benchmark_checkpointing
+
+
+def get_available_memory_mb():
+    '''
+    :return: RAM available to new processes in MB (MemAvailable on Linux, physical RAM elsewhere)
+    '''
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 2**10
+    except IOError:
+        pass
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 2**20
+
+
+def get_memory_budget_mb(use_cuda=False, fraction=0.8, num_processes=1):
+    '''
+    :param num_processes: training processes sharing the machine's RAM
+    :return: memory one training process may use: a fraction of the GPU's memory,
+        or of the available RAM split between the processes
+    '''
+    if use_cuda:
+        import torch
+        return torch.cuda.get_device_properties(torch.cuda.current_device()).total_memory / 2**20 * fraction
+    return get_available_memory_mb() * fraction / num_processes
+
+
+def probe_batch_size(model_name, batch_size, memory_budget_mb, checkpoint_stages=[], use_cuda=False, num_threads=0):
+    '''
+    Runs training steps (forward and backward of synthetic inputs of the model's input shape)
+    at a batch size, in a fresh process
+    :return: whether the batch fits the memory budget, and the measurements (None if the process failed)
+    '''
+    setting = ','.join(checkpoint_stages) if len(checkpoint_stages) > 0 else 'none'
+    ok, result = benchmarker.try_in_subprocess(benchmark_checkpointing.benchmark_train_step, model_name, setting,
+                                               batch_size, 1, 1, num_threads, use_cuda)
+    if not ok:
+        return False, None
+    return result['peak_mb'] <= memory_budget_mb, result
+
+
+def search_max_batch_size(model_name, max_batch_size, memory_budget_mb, checkpoint_stages=[], use_cuda=False,
+                          num_threads=0, verbose=True):
+    '''
+    Doubles the batch size until it no longer fits the memory budget (or reaches max_batch_size),
+    then binary-searches between the last fitting and the first failing size
+    :return: largest fitting batch size (0 if not even 1 fits) and its measurements
+    '''
+    probes = {}
+
+    def fits(batch_size):
+        if not batch_size in probes:
+            batch_fits, result = probe_batch_size(model_name, batch_size, memory_budget_mb,
+                                                  checkpoint_stages=checkpoint_stages, use_cuda=use_cuda,
+                                                  num_threads=num_threads)
+            probes[batch_size] = (batch_fits, result)
+            if verbose:
+                print("\tBatch size " + str(batch_size) + ": " +
+                      ("failed" if result is None else str(round(result['peak_mb'])) + " MB, " +
+                       str(round(1000. / result['ms_per_example'], 2)) + " examples/s") +
+                      ("" if batch_fits else " (does not fit)"))
+        return probes[batch_size][0]
+
+    low = 0
+    high = 1
+    while high <= max_batch_size and fits(high):
+        low = high
+        high *= 2
+    high = min(high, max_batch_size + 1)
+    # low fits, high does not (or is past max_batch_size)
+    while high - low > 1:
+        mid = (low + high) // 2
+        if fits(mid):
+            low = mid
+        else:
+            high = mid
+    if low == 0:
+        return 0, None
+    return low, probes[low][1]
+
+
+def get_consistent_max_mem_batch(max_batch_size, batch_size, world_size=1):
+    '''
+    :return: largest max_mem_batch up to max_batch_size with which batch_size is an exact number
+        of accumulation steps on every process (no truncation of iter_size); max_batch_size
+        if there is none
+    '''
+    for max_mem_batch in range(min(max_batch_size, batch_size // world_size), 0, -1):
+        if batch_size % (max_mem_batch * world_size) == 0:
+            return max_mem_batch
+    return max_batch_size
+
+
+def autotune_max_mem_batch(model_name, batch_size, memory_budget_mb=0., checkpoint_stages=[], use_cuda=False,
+                           world_size=1, num_threads=0, verbose=True):
+    '''
+    :param memory_budget_mb: 0 for the default (see get_memory_budget_mb)
+    :return: max_mem_batch and dict of what the choice was based on
+    '''
+    if memory_budget_mb <= 0:
+        num_processes = int(os.environ.get('LOCAL_WORLD_SIZE', world_size))
+        memory_budget_mb = get_memory_budget_mb(use_cuda=use_cuda, num_processes=num_processes)
+    if verbose:
+        print("Probing the largest " + model_name + " training batch within " + str(round(memory_budget_mb)) +
+              " MB...")
+    max_batch_size, result = search_max_batch_size(model_name, max(batch_size // world_size, 1), memory_budget_mb,
+                                                   checkpoint_stages=checkpoint_stages, use_cuda=use_cuda,
+                                                   num_threads=num_threads, verbose=verbose)
+    if max_batch_size == 0:
+        raise ValueError('Not even a batch of one ' + model_name + ' example fits in ' +
+                         str(round(memory_budget_mb)) + ' MB')
+    max_mem_batch = get_consistent_max_mem_batch(max_batch_size, batch_size, world_size)
+    return max_mem_batch, {
+        'memory_budget_mb': memory_budget_mb,
+        'max_batch_size': max_batch_size,
+        'max_mem_batch': max_mem_batch,
+        'peak_mb': result['peak_mb'],
+        'examples_per_s': 1000. / result['ms_per_example'],
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Find the largest training batch that fits a memory budget '
+                                                 '(the --autotune_batch of the train scripts)')
+    parser.add_argument('--model', dest='model_name', default='halnet',
+                        choices=list(benchmark_checkpointing.MODELS.keys()),
+                        help='Network to probe (default halnet)')
+    parser.add_argument('--batch_size', type=int, dest='batch_size', default=16,
+                        help='Training batch size; max_mem_batch is chosen to divide it (default 16)')
+    parser.add_argument('--memory_budget_mb', dest='memory_budget_mb', type=float, default=0.,
+                        help='Memory budget in MB (default 0: 80%% of available RAM, or of GPU memory with --cuda)')
+    parser.add_argument('--checkpoint_stages', dest='checkpoint_stages', nargs='*', default=[],
+                        choices=['res2', 'res3', 'res4'],
+                        help='Stages of the network backbone run under activation checkpointing (default: none)')
+    parser.add_argument('--cuda', dest='use_cuda', action='store_true', default=False,
+                        help='Whether to probe on GPU')
+    parser.add_argument('--num_threads', dest='num_threads', type=int, default=0,
+                        help='Number of torch CPU threads (default 0: torch default)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    max_mem_batch, autotune_info = autotune_max_mem_batch(
+        args.model_name, args.batch_size, memory_budget_mb=args.memory_budget_mb,
+        checkpoint_stages=args.checkpoint_stages, use_cuda=args.use_cuda, num_threads=args.num_threads)
+    benchmarker.print_table([autotune_info], ['memory_budget_mb', 'max_batch_size', 'max_mem_batch', 'peak_mb',
+                                              'examples_per_s'], title='Batch autotuning (' + args.model_name + ')')
+
+
+if __name__ == '__main__':
+    main()
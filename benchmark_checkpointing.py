@@ -0,0 +1,136 @@
+import argparse
+import time
+import torch
+import benchmarker
+from HALNet import HALNet
+from JORNet import JORNet
+
+MODELS = {
+    'halnet': (HALNet, (4, 320, 240)),
+    'jornet': (JORNet, (4, 128, 128)),
+}
+# activation checkpointing settings, as --checkpoint_stages of the train scripts
+SETTINGS = ['none', 'res2', 'res3', 'res4', 'res2,res3,res4']
+
+
+def get_checkpoint_stages(setting):
+    return [] if setting == 'none' else setting.split(',')
+
+
+def build_model(model_name, checkpoint_stages, use_cuda=False, cross_entropy=False):
+    model_class, input_shape = MODELS[model_name]
+    params_dict = {}
+    params_dict['joint_ixs'] = list(range(21))
+    params_dict['use_cuda'] = use_cuda
+    params_dict['cross_entropy'] = cross_entropy
+    params_dict['checkpoint_stages'] = checkpoint_stages
+    model = model_class(params_dict)
+    model.train()
+    return model, input_shape
+
+
+def get_peak_memory_mb(use_cuda):
+    if use_cuda:
+        return torch.cuda.max_memory_allocated() / 2**20
+    return benchmarker.get_peak_rss_mb()
+
+
+def benchmark_train_step(model_name, setting, batch_size, num_iter, num_warmup, num_threads, use_cuda=False):
+    '''
+    Times a training step (forward of all heads, backward, optimiser step) and measures how much
+    it raises peak memory (RSS on CPU, allocated memory on GPU)
+    Meant to be run in a fresh process (see benchmarker.run_in_subprocess)
+    '''
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    model, input_shape = build_model(model_name, get_checkpoint_stages(setting), use_cuda=use_cuda)
+    optimizer = torch.optim.Adadelta(model.parameters())
+    batch = torch.rand((batch_size,) + input_shape)
+    if use_cuda:
+        batch = batch.cuda()
+
+    def train_step():
+        optimizer.zero_grad()
+        outputs = model(batch)
+        # stands in for the training losses: every head contributes to the gradient
+        loss = sum((output ** 2).mean() for output in outputs)
+        loss.backward()
+        optimizer.step()
+        if use_cuda:
+            torch.cuda.synchronize()
+
+    memory_before_mb = get_peak_memory_mb(use_cuda)
+    result = benchmarker.time_func(train_step, num_iter=num_iter, num_warmup=num_warmup)
+    result['model'] = model_name
+    result['setting'] = setting
+    result['batch_size'] = batch_size
+    result['ms_per_example'] = result['mean_ms'] / batch_size
+    result['peak_mb'] = get_peak_memory_mb(use_cuda)
+    # activations, gradients and optimiser state
+    result['step_peak_mb'] = result['peak_mb'] - memory_before_mb
+    return result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Memory versus time of training steps with activation checkpointing '
+                                                 'of the network backbone stages, and the largest batch that fits '
+                                                 'a memory budget for each setting')
+    parser.add_argument('--model', dest='model_name', default='halnet', choices=list(MODELS.keys()),
+                        help='Network to benchmark (default halnet)')
+    parser.add_argument('--settings', dest='settings', nargs='+', default=SETTINGS,
+                        help='Checkpointed stages, comma separated, or none (default: ' + ' '.join(SETTINGS) + ')')
+    parser.add_argument('--batch_sizes', dest='batch_sizes', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help='Batch sizes to try, in increasing order (default 1 2 4 8 16)')
+    parser.add_argument('--memory_budget_mb', dest='memory_budget_mb', type=float, default=8000.,
+                        help='Peak memory a trainable batch must fit in (default 8000 MB); larger batch sizes '
+                             'of a setting are not tried once one exceeds it')
+    parser.add_argument('--num_iter', dest='num_iter', type=int, default=3,
+                        help='Number of timed iterations (default 3)')
+    parser.add_argument('--num_warmup', dest='num_warmup', type=int, default=1,
+                        help='Number of untimed warmup iterations (default 1)')
+    parser.add_argument('--num_threads', dest='num_threads', type=int, default=0,
+                        help='Number of torch CPU threads (default 0: torch default)')
+    parser.add_argument('--cuda', dest='use_cuda', action='store_true', default=False,
+                        help='Whether to benchmark on GPU (peak allocated memory instead of RSS)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = []
+    summary = []
+    for setting in args.settings:
+        max_batch_result = None
+        for batch_size in args.batch_sizes:
+            print('Benchmarking ' + args.model_name + ' training step, checkpointing ' + setting +
+                  ' (batch size ' + str(batch_size) + ')...')
+            start = time.time()
+            # one fresh process per configuration, so peak memory is not carried over
+            try:
+                result = benchmarker.run_in_subprocess(
+                    benchmark_train_step, args.model_name, setting, batch_size,
+                    args.num_iter, args.num_warmup, args.num_threads, args.use_cuda)
+            except RuntimeError as e:
+                if not 'out of memory' in str(e):
+                    raise
+                print('\tOut of memory')
+                break
+            print('\tDone in ' + str(round(time.time() - start, 1)) + ' s')
+            results.append(result)
+            if result['peak_mb'] > args.memory_budget_mb:
+                break
+            max_batch_result = result
+        summary.append({'setting': setting,
+                        'max_batch_size': max_batch_result['batch_size'] if max_batch_result else 0,
+                        'peak_mb': max_batch_result['peak_mb'] if max_batch_result else '',
+                        'ms_per_example': max_batch_result['ms_per_example'] if max_batch_result else ''})
+    benchmarker.print_table(results, ['setting', 'batch_size', 'mean_ms', 'ms_per_example',
+                                      'step_peak_mb', 'peak_mb'],
+                            title='Training step with activation checkpointing (' + args.model_name + ')')
+    print('')
+    benchmarker.print_table(summary, ['setting', 'max_batch_size', 'peak_mb', 'ms_per_example'],
+                            title='Largest trainable batch within ' + str(args.memory_budget_mb) + ' MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+import benchmarker
+
+# modules a headless inference process imports
+HEADLESS_MODULES = ['HALNet', 'JORNet', 'camera', 'converter', 'synthhands_handler', 'egodexter_handler',
+                    'model_io', 'inference_backends', 'tracking_demo', 'predict']
+# modules that must not be pulled in by importing the above
+FORBIDDEN_MODULES = ['matplotlib', 'pylab', 'scipy', 'autograd', 'cv2', 'visualize']
+# scripts whose --help startup is timed
+CLI_SCRIPTS = ['tracking_demo.py', 'predict.py', 'model_io.py', 'exporter.py', 'quantizer.py']
+
+
+def get_repo_folder():
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_importtime(importtime_output):
+    '''
+    Parses the stderr of python -X importtime
+    :return: dict of module name to (self us, cumulative us)
+    '''
+    import_times = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module_name = line[len('import time:'):].split('|')
+        import_times[module_name.strip()] = (int(self_us), int(cumulative_us))
+    return import_times
+
+
+def measure_import(module_name):
+    '''
+    Imports a module in a fresh interpreter with -X importtime
+    :return: cumulative import time in ms and names of all modules imported
+    '''
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module_name],
+                               cwd=get_repo_folder(), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    if not completed.returncode == 0:
+        raise RuntimeError('Could not import ' + module_name + ':\n' + completed.stderr)
+    import_times = parse_importtime(completed.stderr)
+    return import_times[module_name][1] / 1000, list(import_times.keys())
+
+
+def measure_cli_startup(script_name):
+    '''
+    :return: wall time in ms of running a script with --help
+    '''
+    start = time.perf_counter()
+    subprocess.run([sys.executable, script_name, '--help'], cwd=get_repo_folder(),
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def get_forbidden_imports(imported_modules, forbidden_modules):
+    return sorted(set(module_name.split('.')[0] for module_name in imported_modules) &
+                  set(forbidden_modules))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Import-time regression benchmark (python -X importtime): '
+                                                 'checks that headless modules stay within a time budget '
+                                                 'and do not import plotting/fitting dependencies')
+    parser.add_argument('--modules', dest='modules', nargs='+', default=HEADLESS_MODULES,
+                        help='Modules to import (default: ' + ' '.join(HEADLESS_MODULES) + ')')
+    parser.add_argument('--forbidden', dest='forbidden_modules', nargs='+', default=FORBIDDEN_MODULES,
+                        help='Modules that must not be imported (default: ' + ' '.join(FORBIDDEN_MODULES) + ')')
+    parser.add_argument('--scripts', dest='scripts', nargs='*', default=CLI_SCRIPTS,
+                        help='Scripts whose --help startup time is measured (default: ' +
+                             ' '.join(CLI_SCRIPTS) + ')')
+    parser.add_argument('--budget_ms', dest='budget_ms', type=float, default=3000.,
+                        help='Maximum cumulative import time (and CLI startup time) in ms (default 3000)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    rows = []
+    num_failures = 0
+    for module_name in args.modules:
+        import_ms, imported_modules = measure_import(module_name)
+        forbidden_imports = get_forbidden_imports(imported_modules, args.forbidden_modules)
+        failed = import_ms > args.budget_ms or len(forbidden_imports) > 0
+        num_failures += int(failed)
+        rows.append({'name': module_name, 'time_ms': import_ms, 'forbidden': ' '.join(forbidden_imports),
+                     'status': 'FAIL' if failed else 'ok'})
+    for script_name in args.scripts:
+        startup_ms = measure_cli_startup(script_name)
+        failed = startup_ms > args.budget_ms
+        num_failures += int(failed)
+        rows.append({'name': script_name + ' --help', 'time_ms': startup_ms, 'forbidden': '',
+                     'status': 'FAIL' if failed else 'ok'})
+    benchmarker.print_table(rows, ['name', 'time_ms', 'forbidden', 'status'],
+                            title='Import time (budget ' + str(args.budget_ms) + ' ms)')
+    if num_failures > 0:
+        print(str(num_failures) + ' import-time check(s) failed')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
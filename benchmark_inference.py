@@ -0,0 +1,85 @@
+import argparse
+import torch
+import benchmarker
+from HALNet import HALNet
+from JORNet import JORNet
+
+MODELS = {
+    'halnet': (HALNet, (4, 320, 240)),
+    'jornet': (JORNet, (4, 128, 128)),
+}
+MODES = ['forward', 'forward_inference']
+
+
+def build_model(model_name):
+    model_class, input_shape = MODELS[model_name]
+    params_dict = {}
+    params_dict['joint_ixs'] = list(range(21))
+    params_dict['use_cuda'] = False
+    params_dict['cross_entropy'] = True
+    model = model_class(params_dict)
+    model.eval()
+    return model, input_shape
+
+
+def benchmark_model(model_name, mode, batch_size, num_iter, num_warmup, num_threads):
+    '''
+    Times one forward mode of a model on CPU and measures how much it raises peak memory
+    Meant to be run in a fresh process (see benchmarker.run_in_subprocess)
+    '''
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    model, input_shape = build_model(model_name)
+    batch = torch.rand((batch_size,) + input_shape)
+    if mode == 'forward':
+        # what inference callers ran before forward_inference: all heads, with autograd
+        func = lambda: model(batch)
+    else:
+        func = lambda: model.forward_inference(batch)
+    rss_before_mb = benchmarker.get_peak_rss_mb()
+    result = benchmarker.time_func(func, num_iter=num_iter, num_warmup=num_warmup)
+    result['model'] = model_name
+    result['mode'] = mode
+    result['batch_size'] = batch_size
+    result['ms_per_frame'] = result['mean_ms'] / batch_size
+    result['peak_rss_mb'] = benchmarker.get_peak_rss_mb()
+    result['forward_peak_mb'] = result['peak_rss_mb'] - rss_before_mb
+    return result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark CPU latency and memory of the full and '
+                                                 'inference-only forward passes of HALNet and JORNet')
+    parser.add_argument('--models', dest='models', nargs='+', default=list(MODELS.keys()),
+                        help='Models to benchmark (default: ' + ' '.join(MODELS.keys()) + ')')
+    parser.add_argument('--modes', dest='modes', nargs='+', default=MODES,
+                        help='Forward modes to benchmark (default: ' + ' '.join(MODES) + ')')
+    parser.add_argument('--batch_sizes', dest='batch_sizes', type=int, nargs='+', default=[1, 16],
+                        help='Batch sizes to benchmark (default 1 16)')
+    parser.add_argument('--num_iter', dest='num_iter', type=int, default=10,
+                        help='Number of timed iterations (default 10)')
+    parser.add_argument('--num_warmup', dest='num_warmup', type=int, default=2,
+                        help='Number of untimed warmup iterations (default 2)')
+    parser.add_argument('--num_threads', dest='num_threads', type=int, default=0,
+                        help='Number of torch CPU threads (default 0: torch default)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = []
+    for model_name in args.models:
+        for batch_size in args.batch_sizes:
+            for mode in args.modes:
+                print('Benchmarking ' + model_name + ' ' + mode + ' (batch size ' + str(batch_size) + ')...')
+                # one fresh process per configuration, so peak memory is not carried over
+                results.append(benchmarker.run_in_subprocess(
+                    benchmark_model, model_name, mode, batch_size,
+                    args.num_iter, args.num_warmup, args.num_threads))
+    benchmarker.print_table(results, ['model', 'mode', 'batch_size', 'mean_ms', 'std_ms', 'p95_ms',
+                                      'ms_per_frame', 'forward_peak_mb', 'peak_rss_mb'],
+                            title='CPU inference benchmark')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+import torch
+import benchmarker
+import hand_tracker
+import losses as my_losses
+import synthetic_dataset
+import synthhands_handler
+from HALNet import HALNet, SoftmaxLogProbability2D
+from JORNet import JORNet
+
+HALNET_RES = (320, 240)
+JORNET_RES = (128, 128)
+# fraction a benchmark's median may grow by before compare flags it as a regression
+DEFAULT_THRESHOLD = 0.1
+
+
+class BenchmarkContext:
+    '''
+    What the benchmarks share: the synthetic dataset, the batch size and networks built on first use
+    '''
+    def __init__(self, root_folder, filenamebases, batch_size):
+        self.root_folder = root_folder
+        self.filenamebases = filenamebases
+        self.batch_size = batch_size
+        self.joint_ixs = list(range(21))
+        self.models = {}
+
+    def get_model(self, model_class):
+        if not model_class in self.models:
+            params_dict = {'joint_ixs': self.joint_ixs, 'use_cuda': False, 'cross_entropy': False}
+            self.models[model_class] = model_class(params_dict)
+        return self.models[model_class]
+
+    def get_labels(self, idx=0):
+        return synthhands_handler.get_labels_depth_and_color(self.root_folder, self.filenamebases[idx])
+
+
+def _cycle_indices(num_items):
+    '''
+    :return: function returning 0, 1, ..., num_items - 1, 0, 1... on successive calls
+    '''
+    counter = [0]
+
+    def next_idx():
+        idx = counter[0] % num_items
+        counter[0] += 1
+        return idx
+    return next_idx
+
+
+def setup_data_labels(ctx):
+    next_idx = _cycle_indices(len(ctx.filenamebases))
+    return lambda: synthhands_handler._get_data_labels(ctx.root_folder, next_idx(), ctx.filenamebases,
+                                                        HALNET_RES, ctx.joint_ixs), 1
+
+
+def setup_data_labels_crop(ctx):
+    next_idx = _cycle_indices(len(ctx.filenamebases))
+    return lambda: synthhands_handler._get_data_labels(ctx.root_folder, next_idx(), ctx.filenamebases,
+                                                        JORNET_RES, ctx.joint_ixs, flag_crop_hand=True), 1
+
+
+def setup_heatmap_targets(ctx):
+    labels_jointspace, labels_colorspace, _ = ctx.get_labels()
+    return lambda: synthhands_handler.get_labels_heatmaps_and_jointvec(labels_jointspace, labels_colorspace,
+                                                                        ctx.joint_ixs, HALNET_RES), 1
+
+
+def setup_softmax_log_prob_2d(ctx):
+    softmax = SoftmaxLogProbability2D()
+    heatmaps = torch.rand((ctx.batch_size, len(ctx.joint_ixs)) + HALNET_RES)
+    return lambda: softmax(heatmaps), ctx.batch_size
+
+
+def _get_outputs_and_targets(ctx, model_class, input_res):
+    model = ctx.get_model(model_class)
+    with torch.no_grad():
+        outputs = [output.detach() for output in model(torch.rand((ctx.batch_size, 4) + input_res))]
+    target_heatmaps = torch.rand((ctx.batch_size, len(ctx.joint_ixs)) + input_res)
+    return model, outputs, target_heatmaps
+
+
+def setup_loss_halnet(ctx):
+    model, outputs, target_heatmaps = _get_outputs_and_targets(ctx, HALNet, HALNET_RES)
+    return lambda: my_losses.calculate_loss_HALNet(
+        my_losses.euclidean_loss, outputs, target_heatmaps, model.joint_ixs, model.WEIGHT_LOSS_INTERMED1,
+        model.WEIGHT_LOSS_INTERMED2, model.WEIGHT_LOSS_INTERMED3, model.WEIGHT_LOSS_MAIN, 1), ctx.batch_size
+
+
+def setup_loss_jornet(ctx):
+    model, outputs, target_heatmaps = _get_outputs_and_targets(ctx, JORNet, JORNET_RES)
+    target_joints = torch.rand(outputs[7].shape)
+    return lambda: my_losses.calculate_loss_JORNet(
+        my_losses.euclidean_loss, outputs, target_heatmaps, target_joints, model.joint_ixs,
+        [0.5, 0.5, 0.5, 1.0], [1250, 1250, 1250, 2500], 1), ctx.batch_size
+
+
+def setup_pixel_dist_loss(ctx):
+    output_heatmaps = torch.rand((ctx.batch_size, len(ctx.joint_ixs)) + HALNET_RES)
+    target_heatmaps = torch.rand((ctx.batch_size, len(ctx.joint_ixs)) + HALNET_RES)
+    return lambda: my_losses.accumulate_pixel_dist_loss_multiple(
+        [0] * len(ctx.joint_ixs), output_heatmaps, target_heatmaps, ctx.batch_size), ctx.batch_size
+
+
+def _setup_forward(ctx, model_class, input_res, backward):
+    model = ctx.get_model(model_class)
+    model.train()
+    batch = torch.rand((ctx.batch_size, 4) + input_res)
+
+    def step():
+        outputs = model(batch)
+        if backward:
+            model.zero_grad()
+            # stands in for the training losses: every head contributes to the gradient
+            sum((output ** 2).mean() for output in outputs).backward()
+    return step, ctx.batch_size
+
+
+def setup_halnet_forward(ctx):
+    return _setup_forward(ctx, HALNet, HALNET_RES, backward=False)
+
+
+def setup_halnet_forward_backward(ctx):
+    return _setup_forward(ctx, HALNet, HALNET_RES, backward=True)
+
+
+def setup_jornet_forward(ctx):
+    return _setup_forward(ctx, JORNet, JORNET_RES, backward=False)
+
+
+def setup_jornet_forward_backward(ctx):
+    return _setup_forward(ctx, JORNet, JORNET_RES, backward=True)
+
+
+def setup_cascade(ctx):
+    halnet = ctx.get_model(HALNet)
+    jornet = ctx.get_model(JORNet)
+    halnet.eval()
+    jornet.eval()
+    # frames are SynthHands'
+    tracker = hand_tracker.HandTracker(halnet, jornet, *hand_tracker.get_depth_intrinsics('synthhands'))
+    images = np.stack([synthhands_handler._get_data(ctx.root_folder, ctx.filenamebases[i % len(ctx.filenamebases)],
+                                                    HALNET_RES, as_torch=False)
+                       for i in range(ctx.batch_size)])
+    return lambda: tracker.track_batch(images), ctx.batch_size
+
+
+# name: setup(ctx) returning the function to time and how many items (frames) one call processes
+BENCHMARKS = {
+    'data_labels': setup_data_labels,
+    'data_labels_crop': setup_data_labels_crop,
+    'heatmap_targets': setup_heatmap_targets,
+    'softmax_log_prob_2d': setup_softmax_log_prob_2d,
+    'loss_halnet': setup_loss_halnet,
+    'loss_jornet': setup_loss_jornet,
+    'pixel_dist_loss': setup_pixel_dist_loss,
+    'halnet_forward': setup_halnet_forward,
+    'halnet_forward_backward': setup_halnet_forward_backward,
+    'jornet_forward': setup_jornet_forward,
+    'jornet_forward_backward': setup_jornet_forward_backward,
+    'cascade': setup_cascade,
+}
+
+
+def run_benchmark(ctx, name, num_iter, num_warmup):
+    func, num_items = BENCHMARKS[name](ctx)
+    # some hot paths print (e.g. calculate_loss_HALNet); keep the output readable
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result = benchmarker.time_func(func, num_iter=num_iter, num_warmup=num_warmup)
+    result['name'] = name
+    result['num_items'] = num_items
+    result['ms_per_item'] = result['median_ms'] / num_items
+    return result
+
+
+def run_suite(benchmark_names, batch_size=4, num_iter=10, num_warmup=2, num_frames=8, seed=0, verbose=True):
+    '''
+    Runs benchmarks on a synthetic SynthHands-layout dataset written to a temporary folder
+    :return: dict of the run's configuration, machine info and results by benchmark name
+    '''
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    root_folder = tempfile.mkdtemp(prefix='handtracking_benchmark_')
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            filenamebases = synthetic_dataset.make_synthhands_dataset(root_folder, num_frames=num_frames, seed=seed)
+        ctx = BenchmarkContext(os.path.join(root_folder, ''), filenamebases, batch_size)
+        results = {}
+        for name in benchmark_names:
+            if verbose:
+                print('Benchmarking ' + name + '...')
+            results[name] = run_benchmark(ctx, name, num_iter, num_warmup)
+    finally:
+        shutil.rmtree(root_folder, ignore_errors=True)
+    return {
+        'date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'config': {'batch_size': batch_size, 'num_iter': num_iter, 'num_warmup': num_warmup,
+                   'num_frames': num_frames, 'seed': seed},
+        'machine': benchmarker.get_machine_info(),
+        'results': results,
+    }
+
+
+def compare_runs(base_run, new_run, threshold=DEFAULT_THRESHOLD):
+    '''
+    :param threshold: relative change of the median time over which a benchmark is flagged
+    :return: list of dicts comparing the medians of the benchmarks of both runs
+    '''
+    rows = []
+    for name, base_result in base_run['results'].items():
+        if not name in new_run['results']:
+            continue
+        new_result = new_run['results'][name]
+        change = new_result['median_ms'] / base_result['median_ms'] - 1.
+        flag = ''
+        if change > threshold:
+            flag = 'REGRESSION'
+        elif change < -threshold:
+            flag = 'improvement'
+        rows.append({'name': name, 'base_ms': base_result['median_ms'], 'new_ms': new_result['median_ms'],
+                     'change': '{:+.1%}'.format(change), 'flag': flag})
+    return rows
+
+
+def get_machine_differences(base_run, new_run):
+    '''
+    :return: machine info keys (and config keys) that differ between the runs, which make timings
+        not directly comparable
+    '''
+    differences = []
+    for key in ['machine', 'config']:
+        for info_key, value in base_run[key].items():
+            # comparing commits is the point
+            if info_key == 'git_commit':
+                continue
+            if not new_run[key].get(info_key) == value:
+                differences.append(info_key + ': ' + str(value) + ' -> ' + str(new_run[key].get(info_key)))
+    return differences
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the data, model and pipeline hot paths on CPU with '
+                                                 'a synthetic dataset, or compare two benchmark runs')
+    parser.add_argument('-o', dest='output_filepath', default='',
+                        help='JSON file to write the results to (default: none)')
+    parser.add_argument('--benchmarks', dest='benchmarks', nargs='+', default=list(BENCHMARKS.keys()),
+                        choices=list(BENCHMARKS.keys()), help='Benchmarks to run (default: all)')
+    parser.add_argument('--batch_size', dest='batch_size', type=int, default=4,
+                        help='Batch size of the batched benchmarks (default 4)')
+    parser.add_argument('--num_iter', dest='num_iter', type=int, default=10,
+                        help='Number of timed iterations (default 10)')
+    parser.add_argument('--num_warmup', dest='num_warmup', type=int, default=2,
+                        help='Number of untimed warmup iterations (default 2)')
+    parser.add_argument('--num_frames', dest='num_frames', type=int, default=8,
+                        help='Number of frames of the synthetic dataset (default 8)')
+    parser.add_argument('--seed', dest='seed', type=int, default=0, help='Random seed (default 0)')
+    parser.add_argument('--num_threads', dest='num_threads', type=int, default=0,
+                        help='Number of torch CPU threads (default 0: torch default)')
+    parser.add_argument('--compare', dest='compare_filepaths', nargs=2, default=None,
+                        metavar=('BASE', 'NEW'),
+                        help='Compare two result files instead of running benchmarks; exits with 1 '
+                             'on regressions')
+    parser.add_argument('--threshold', dest='threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Relative change of median time flagged by --compare (default ' +
+                             str(DEFAULT_THRESHOLD) + ')')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.compare_filepaths is not None:
+        with open(args.compare_filepaths[0]) as f:
+            base_run = json.load(f)
+        with open(args.compare_filepaths[1]) as f:
+            new_run = json.load(f)
+        for difference in get_machine_differences(base_run, new_run):
+            print('Warning: runs differ in ' + difference)
+        rows = compare_runs(base_run, new_run, threshold=args.threshold)
+        benchmarker.print_table(rows, ['name', 'base_ms', 'new_ms', 'change', 'flag'],
+                                title='Median ms: ' + args.compare_filepaths[0] + ' -> ' + args.compare_filepaths[1])
+        if any(row['flag'] == 'REGRESSION' for row in rows):
+            sys.exit(1)
+        return
+    if args.num_threads > 0:
+        torch.set_num_threads(args.num_threads)
+    run = run_suite(args.benchmarks, batch_size=args.batch_size, num_iter=args.num_iter,
+                    num_warmup=args.num_warmup, num_frames=args.num_frames, seed=args.seed)
+    benchmarker.print_table(list(run['results'].values()),
+                            ['name', 'num_items', 'median_ms', 'mean_ms', 'std_ms', 'p95_ms', 'ms_per_item'],
+                            title='Benchmark suite (batch size ' + str(args.batch_size) + ')')
+    if not args.output_filepath == '':
+        with open(args.output_filepath, 'w') as f:
+            json.dump(run, f, indent=2)
+        print('Wrote results to: ' + args.output_filepath)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+import multiprocessing as mp
+import resource
+import sys
+import threading
+import time
+import numpy as np
+
+
+def get_peak_rss_mb():
+    '''
+    :return: peak resident set size of this process so far, in MB
+    '''
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    if sys.platform == 'darwin':
+        return peak_rss / 2**20
+    return peak_rss / 2**10
+
+
+def get_machine_info():
+    '''
+    :return: dict describing the machine and software a benchmark ran on
+    '''
+    import os
+    import platform
+    import subprocess
+    import torch
+    try:
+        git_commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                             cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        git_commit = ''
+    return {
+        'hostname': platform.node(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'torch': torch.__version__,
+        'torch_num_threads': torch.get_num_threads(),
+        'cuda': torch.cuda.get_device_name(0) if torch.cuda.is_available() else '',
+        'git_commit': git_commit,
+    }
+
+
+def get_timing_stats(times):
+    '''
+    :param times: list of elapsed times in seconds
+    :return: dict of timing statistics in ms
+    '''
+    times_ms = np.array(times) * 1000
+    return {
+        'mean_ms': float(np.mean(times_ms)),
+        'std_ms': float(np.std(times_ms)),
+        'min_ms': float(np.min(times_ms)),
+        'median_ms': float(np.median(times_ms)),
+        'p95_ms': float(np.percentile(times_ms, 95)),
+        'p99_ms': float(np.percentile(times_ms, 99)),
+        'num_iter': len(times),
+    }
+
+
+def time_func(func, num_iter=10, num_warmup=2):
+    '''
+    Times func() after num_warmup untimed calls
+    :return: dict of timing statistics in ms
+    '''
+    for _ in range(num_warmup):
+        func()
+    times = []
+    for _ in range(num_iter):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return get_timing_stats(times)
+
+
+def run_in_subprocess(func, *args):
+    '''
+    Runs func(*args) in a fresh (spawned) process, so peak memory measurements
+    are not polluted by earlier runs
+    func must be a module-level (picklable) function
+    :return: func's return value
+    '''
+    pool = mp.get_context('spawn').Pool(processes=1)
+    try:
+        return pool.apply(func, args)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _send_result(conn, func, args):
+    try:
+        conn.send((True, func(*args)))
+    except Exception as e:
+        conn.send((False, repr(e)))
+    finally:
+        conn.close()
+
+
+def try_in_subprocess(func, *args):
+    '''
+    Like run_in_subprocess, but survives the process dying (e.g. killed when out of memory)
+    :return: whether func returned, and its return value (or the error as a string)
+    '''
+    context = mp.get_context('spawn')
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_send_result, args=(child_conn, func, args))
+    process.start()
+    child_conn.close()
+    try:
+        ok, result = parent_conn.recv()
+    except EOFError:
+        ok, result = False, None
+    process.join()
+    if not ok and result is None:
+        result = 'Process exited with code ' + str(process.exitcode)
+    return ok, result
+
+
+def get_layer_macs(module, output):
+    '''
+    :return: multiply-accumulates of a forward pass of a Conv2d, ConvTranspose2d or Linear layer
+        producing output (0 for other layers)
+    '''
+    import torch.nn as nn
+    if isinstance(module, nn.Conv2d):
+        return output.numel() * (module.in_channels // module.groups) * \
+            module.kernel_size[0] * module.kernel_size[1]
+    if isinstance(module, nn.ConvTranspose2d):
+        # each input element is scattered to out_channels / groups * kernel size outputs
+        num_inputs = output.numel() // module.out_channels * module.in_channels // \
+            (module.stride[0] * module.stride[1])
+        return num_inputs * (module.out_channels // module.groups) * \
+            module.kernel_size[0] * module.kernel_size[1]
+    if isinstance(module, nn.Linear):
+        return output.numel() * module.in_features
+    return 0
+
+
+def get_module_flops(model, input_shape):
+    '''
+    Estimates the multiply-accumulates of a forward pass of one input, from the
+    Conv2d and Linear layers (batch norm, activations and pooling are ignored)
+    :param input_shape: input shape without the batch dimension
+    :return: dict of top-level child module name to MACs
+    '''
+    import torch
+    import torch.nn as nn
+    flops = {}
+    handles = []
+
+    def add_flops(child_name):
+        def hook(module, inputs, output):
+            flops[child_name] = flops.get(child_name, 0) + int(get_layer_macs(module, output))
+        return hook
+
+    for child_name, child in model.named_children():
+        flops[child_name] = 0
+        for module in child.modules():
+            if isinstance(module, (nn.Conv2d, nn.Linear)):
+                handles.append(module.register_forward_hook(add_flops(child_name)))
+    try:
+        with torch.no_grad():
+            model(torch.zeros((1,) + tuple(input_shape)))
+    finally:
+        for handle in handles:
+            handle.remove()
+    return flops
+
+
+class LatencyHistogram:
+    '''
+    Thread-safe histogram of latencies with log-spaced buckets, for long-running
+    processes where keeping every sample is not an option
+    Percentiles are given as the upper bound of the bucket they fall in
+    '''
+    def __init__(self, min_ms=0.1, max_ms=60000., buckets_per_decade=10):
+        num_buckets = int(np.ceil(np.log10(max_ms / min_ms) * buckets_per_decade)) + 1
+        self.bucket_bounds_ms = min_ms * 10 ** (np.arange(num_buckets) / buckets_per_decade)
+        # last bucket counts everything above max_ms
+        self.counts = np.zeros(num_buckets + 1, dtype=np.int64)
+        self.sum_ms = 0.
+        self.max_ms = 0.
+        self.lock = threading.Lock()
+
+    def add(self, latency_ms):
+        latency_ms = float(latency_ms)
+        bucket_ix = np.searchsorted(self.bucket_bounds_ms, latency_ms)
+        with self.lock:
+            self.counts[bucket_ix] += 1
+            self.sum_ms += latency_ms
+            self.max_ms = max(self.max_ms, latency_ms)
+
+    def get_percentile(self, percentile):
+        with self.lock:
+            counts = self.counts.copy()
+        if counts.sum() == 0:
+            return 0.
+        bucket_ix = np.searchsorted(np.cumsum(counts), counts.sum() * percentile / 100.)
+        if bucket_ix >= len(self.bucket_bounds_ms):
+            return self.max_ms
+        return min(float(self.bucket_bounds_ms[bucket_ix]), self.max_ms)
+
+    def to_dict(self):
+        with self.lock:
+            count = int(self.counts.sum())
+            buckets = {'{:.3g}'.format(bound_ms): int(bucket_count)
+                       for bound_ms, bucket_count in zip(self.bucket_bounds_ms, self.counts) if bucket_count > 0}
+            if self.counts[-1] > 0:
+                buckets['inf'] = int(self.counts[-1])
+            mean_ms = self.sum_ms / count if count > 0 else 0.
+            max_ms = self.max_ms
+        return {
+            'count': count,
+            'mean_ms': mean_ms,
+            'p50_ms': self.get_percentile(50),
+            'p95_ms': self.get_percentile(95),
+            'p99_ms': self.get_percentile(99),
+            'max_ms': max_ms,
+            'buckets_ms': buckets,
+        }
+
+
+def format_table(rows, columns, float_precision=2):
+    '''
+    :param rows: list of dicts
+    :param columns: list of keys (column names) to show, in order
+    :return: table as a string with aligned columns
+    '''
+    def format_value(value):
+        if isinstance(value, float):
+            return str(round(value, float_precision))
+        return str(value)
+    cells = [[str(column) for column in columns]] +\
+            [[format_value(row.get(column, '')) for column in columns] for row in rows]
+    widths = [max(len(row_cells[i]) for row_cells in cells) for i in range(len(columns))]
+    lines = []
+    for row_ix, row_cells in enumerate(cells):
+        lines.append('  '.join(cell.rjust(widths[i]) for i, cell in enumerate(row_cells)))
+        if row_ix == 0:
+            lines.append('  '.join('-' * width for width in widths))
+    return '\n'.join(lines)
+
+
+def print_table(rows, columns, title='', float_precision=2):
+    if not title == '':
+        print(title)
+    print(format_table(rows, columns, float_precision))
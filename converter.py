@@ -12,7 +12,14 @@ def numpy_swap_cols(np_array, col_from, col_to):
     np_array[:, [col_from, col_to]] = np_array[:, [col_to, col_from]]
     return np_array
 
+def _as_numpy(data):
+    # zero-copy view of (CPU) torch tensors, e.g. the uint8 RGB-D data from the loaders
+    if isinstance(data, torch.Tensor):
+        return data.detach().cpu().numpy()
+    return data
+
 def numpy_to_plottable_rgb(numpy_img):
+    numpy_img = _as_numpy(numpy_img)
     img = numpy_img
     if len(numpy_img.shape) == 3:
         channel_axis = 0
@@ -71,6 +78,16 @@ def heatmaps_to_joints_colorspace(heatmaps):
         joints_colorspace[joint_ix, :] = np.unravel_index(np.argmax(heatmap), heatmap.shape)
     return joints_colorspace
 
+def batch_heatmaps_to_joints_colorspace(batch_heatmaps):
+    '''
+    Batched heatmaps_to_joints_colorspace
+    :param batch_heatmaps: (N, J, U, V) numpy array
+    :return: (N, J, 2) array of the (u, v) maximum of each heatmap
+    '''
+    batch_heatmaps = _as_numpy(batch_heatmaps)
+    heatmap_ixs = batch_heatmaps.reshape(batch_heatmaps.shape[0], batch_heatmaps.shape[1], -1).argmax(axis=2)
+    return np.stack(np.unravel_index(heatmap_ixs, batch_heatmaps.shape[2:]), axis=2).astype(float)
+
 
 def normalize_output(output):
     output_positive = output + abs(np.min(output, axis=(0, 1)))
@@ -85,6 +102,7 @@ def convert_torch_targetheatmap_to_canonical(target_heatmap, res=(640, 480)):
 
 
 def convert_torch_dataoutput_to_canonical(data, res=(640, 480)):
+    data = _as_numpy(data)
     if len(data.shape) < 3:
         image = data
     else:
@@ -97,6 +115,7 @@ def convert_torch_dataoutput_to_canonical(data, res=(640, 480)):
 
 
 def convert_torch_dataimage_to_canonical(data, res=(640, 480)):
+    data = _as_numpy(data)
     image = data[0:3, :, :]
     # put channels at the end
     image = image.astype(np.uint8)
@@ -130,9 +149,31 @@ def color_space_label_to_heatmap(color_space_label, heatmap_res, orig_img_res=(6
     return heatmap
 
 
+def batch_to_device_float(batch, use_cuda=False, mean=None, std=None):
+    '''
+    Converts a collated batch of RGB-D data into a float batch on the target device
+    The loaders return uint8 (N, 4, U, V) batches; the upcast and the optional
+    per-channel normalization are done here, once per batch and after the
+    (4x smaller) uint8 transfer to the device
+    :param batch: torch tensor (N, 4, U, V) of any dtype
+    :param use_cuda: whether to move the batch to the GPU
+    :param mean: optional sequence of per-channel means to subtract
+    :param std: optional sequence of per-channel standard deviations to divide by
+    :return: float torch tensor (N, 4, U, V)
+    '''
+    if use_cuda:
+        batch = batch.cuda(non_blocking=True)
+    batch = batch.float()
+    if mean is not None:
+        batch = batch - torch.tensor(mean, dtype=batch.dtype, device=batch.device).view(1, -1, 1, 1)
+    if std is not None:
+        batch = batch / torch.tensor(std, dtype=batch.dtype, device=batch.device).view(1, -1, 1, 1)
+    return batch
+
+
 def data_to_batch(data):
     batch = np.zeros((1, data.shape[0], data.shape[1], data.shape[2]))
-    batch[0, :, :, :] = data
+    batch[0, :, :, :] = _as_numpy(data)
     batch = Variable(torch.from_numpy(batch).float())
     return batch
 
@@ -1,13 +1,7 @@
 import numpy as np
 import math
 import converter
-import visualize
 import probs
-try:
-    from matplotlib import pyplot as plt
-except ImportError:
-    print("WARNING: Ignoring matplotlib import error")
-    pass
 
 def print_verbose(str, verbose, n_tabs=0, erase_line=False):
     prefix = '\t' * n_tabs
@@ -20,6 +14,8 @@ def print_verbose(str, verbose, n_tabs=0, erase_line=False):
     return msg
 
 def show_target_and_output_to_image_info(data, target_heatmaps, output):
+    # plotting modules are imported on use, so print_verbose can be imported headless
+    from matplotlib import pyplot as plt
     batch_idxs = [0, 1]
     n_joints = target_heatmaps.data.shape[1]
     rows = math.ceil(math.sqrt(n_joints))
@@ -45,6 +41,7 @@ def show_target_and_output_to_image_info(data, target_heatmaps, output):
     plt.show()
 
 def show_target_and_prob_output_to_image_info(data, target, output, debug_visually=True):
+    import visualize
     BATCH_IDX = 0
     print("Showing info for first datum of batch and for every joint:")
     for joint_ix in range(target.data.shape[1]):
@@ -0,0 +1,190 @@
+import argparse
+import copy
+import torch
+import torch.nn as nn
+import benchmarker
+from HALNet import HALNet
+from JORNet import JORNet
+
+MODEL_CLASSES = {
+    'HALNet': HALNet,
+    'JORNet': JORNet,
+}
+MODEL_INPUT_SHAPES = {
+    'HALNet': (4, 320, 240),
+    'JORNet': (4, 128, 128),
+}
+
+
+def fold_conv_bn(conv, bn):
+    '''
+    Folds an eval-mode BatchNorm2d into the Conv2d preceding it
+    :return: new Conv2d (with bias) whose output equals bn(conv(x))
+    '''
+    folded_conv = nn.Conv2d(in_channels=conv.in_channels, out_channels=conv.out_channels,
+                            kernel_size=conv.kernel_size, stride=conv.stride,
+                            padding=conv.padding, dilation=conv.dilation,
+                            groups=conv.groups, bias=True)
+    with torch.no_grad():
+        bn_scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+        folded_conv.weight.copy_(conv.weight * bn_scale.view(-1, 1, 1, 1))
+        conv_bias = conv.bias if conv.bias is not None else torch.zeros_like(bn.running_mean)
+        folded_conv.bias.copy_((conv_bias - bn.running_mean) * bn_scale + bn.bias)
+    return folded_conv.to(conv.weight.device)
+
+
+def fold_model_conv_bn(model):
+    '''
+    Folds every BatchNorm2d that directly follows a Conv2d in an nn.Sequential
+    (i.e. every HALNetConvBlock) into the conv, replacing the BN with an Identity
+    Outputs are identical to the eval-mode outputs of the original model
+    :return: folded copy of the model, in eval mode
+    '''
+    model = copy.deepcopy(model)
+    model.eval()
+    for module in model.modules():
+        if not isinstance(module, nn.Sequential):
+            continue
+        child_names = list(module._modules.keys())
+        for child_name, next_child_name in zip(child_names[:-1], child_names[1:]):
+            conv = module._modules[child_name]
+            bn = module._modules[next_child_name]
+            if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+                module._modules[child_name] = fold_conv_bn(conv, bn)
+                module._modules[next_child_name] = nn.Identity()
+    return model
+
+
+def get_model_params_dict(model):
+    params_dict = {}
+    params_dict['joint_ixs'] = list(model.joint_ixs)
+    params_dict['use_cuda'] = False
+    params_dict['cross_entropy'] = model.cross_entropy
+    return params_dict
+
+
+def save_deployed_model(model, filepath):
+    '''
+    Saves a folded model as an inference artifact: weights and the parameters to
+    rebuild the model, without optimizer or training state
+    '''
+    model_class_name = type(model).__name__
+    if not model_class_name in MODEL_CLASSES:
+        raise ValueError('Cannot deploy model of class ' + model_class_name +
+                         '. Valid classes are: ' + str(list(MODEL_CLASSES.keys())))
+    deploy_dict = {
+        'model_class': model_class_name,
+        'params_dict': get_model_params_dict(model),
+        'folded_conv_bn': True,
+        'model_state_dict': model.state_dict(),
+    }
+    torch.save(deploy_dict, filepath)
+
+
+def load_deployed_model(filepath, use_cuda=False):
+    '''
+    Loads an inference artifact saved by save_deployed_model
+    :return: folded model in eval mode
+    '''
+    deploy_dict = torch.load(filepath, map_location=lambda storage, loc: storage)
+    model = MODEL_CLASSES[deploy_dict['model_class']](deploy_dict['params_dict'])
+    if deploy_dict['folded_conv_bn']:
+        # same module structure as the saved model; the weights are overwritten below
+        model = fold_model_conv_bn(model)
+    model.load_state_dict(deploy_dict['model_state_dict'])
+    model.eval()
+    if use_cuda:
+        model = model.cuda()
+    return model
+
+
+def load_model_weights(filepath, model_class):
+    '''
+    Loads only the model of a training checkpoint (the optimizer state is not built)
+    '''
+    import model_io
+    return model_io.load_model_for_inference(filepath, model_class=model_class)
+
+
+def randomize_bn_stats(model):
+    # untrained BNs are identities; give them non-trivial stats so the check is meaningful
+    with torch.no_grad():
+        for module in model.modules():
+            if isinstance(module, nn.BatchNorm2d):
+                module.running_mean.uniform_(-0.5, 0.5)
+                module.running_var.uniform_(0.5, 2.)
+                module.weight.uniform_(0.5, 1.5)
+                module.bias.uniform_(-0.5, 0.5)
+
+
+def compare_outputs(model, folded_model, batch):
+    '''
+    :return: max absolute difference between the inference outputs of both models
+    '''
+    outputs = model.forward_inference(batch)
+    folded_outputs = folded_model.forward_inference(batch)
+    if isinstance(outputs, torch.Tensor):
+        outputs, folded_outputs = (outputs,), (folded_outputs,)
+    return max(float((output - folded_output).abs().max())
+               for output, folded_output in zip(outputs, folded_outputs))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Fold Conv+BatchNorm of a trained network into '
+                                                 'an inference artifact')
+    parser.add_argument('-c', dest='checkpoint_filepath', default='',
+                        help='Training checkpoint to deploy (default: randomly initialised network)')
+    parser.add_argument('--model', dest='model_class', default='HALNet', choices=list(MODEL_CLASSES.keys()),
+                        help='Network class of the checkpoint (default HALNet)')
+    parser.add_argument('-o', dest='output_filepath', default='',
+                        help='Output file for the inference artifact (default: no output)')
+    parser.add_argument('--check', dest='check', action='store_true', default=False,
+                        help='Whether to check the folded outputs against the unfolded eval-mode outputs')
+    parser.add_argument('--benchmark', dest='benchmark', action='store_true', default=False,
+                        help='Whether to benchmark CPU latency of the unfolded and folded networks')
+    parser.add_argument('--batch_size', type=int, dest='batch_size', default=1,
+                        help='Batch size for checking and benchmarking (default 1)')
+    parser.add_argument('--num_iter', type=int, dest='num_iter', default=10,
+                        help='Number of timed iterations when benchmarking (default 10)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    model_class = MODEL_CLASSES[args.model_class]
+    if args.checkpoint_filepath == '':
+        print("No checkpoint given; deploying a randomly initialised " + args.model_class)
+        params_dict = {}
+        params_dict['joint_ixs'] = list(range(21))
+        params_dict['use_cuda'] = False
+        params_dict['cross_entropy'] = True
+        model = model_class(params_dict)
+        randomize_bn_stats(model)
+    else:
+        print("Loading model from checkpoint: " + args.checkpoint_filepath)
+        model = load_model_weights(args.checkpoint_filepath, model_class)
+    model.eval()
+    folded_model = fold_model_conv_bn(model)
+    num_bns = sum(1 for module in model.modules() if isinstance(module, nn.BatchNorm2d))
+    num_folded_bns = num_bns - sum(1 for module in folded_model.modules() if isinstance(module, nn.BatchNorm2d))
+    print("Folded " + str(num_folded_bns) + "/" + str(num_bns) + " BatchNorm layers into their convolutions")
+    if not args.output_filepath == '':
+        print("Saving inference artifact: " + args.output_filepath)
+        save_deployed_model(folded_model, args.output_filepath)
+        folded_model = load_deployed_model(args.output_filepath)
+    batch = torch.rand((args.batch_size,) + MODEL_INPUT_SHAPES[args.model_class])
+    if args.check:
+        print("Max absolute output difference (folded vs unfolded): " +
+              str(compare_outputs(model, folded_model, batch)))
+    if args.benchmark:
+        rows = []
+        for model_name, model_ in [('unfolded', model), ('folded', folded_model)]:
+            row = benchmarker.time_func(lambda: model_.forward_inference(batch), num_iter=args.num_iter)
+            row['model'] = model_name
+            rows.append(row)
+        benchmarker.print_table(rows, ['model', 'mean_ms', 'std_ms', 'median_ms', 'p95_ms'],
+                                title='CPU latency (' + args.model_class + ', batch size ' + str(args.batch_size) + ')')
+
+
+if __name__ == '__main__':
+    main()
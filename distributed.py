@@ -0,0 +1,117 @@
+import contextlib
+import os
+import torch
+import torch.distributed as dist
+
+BACKENDS = ['gloo', 'nccl']
+
+
+def init_distributed(backend='gloo', use_cuda=False):
+    '''
+    Joins the process group when launched with several processes, e.g.:
+        python -m torch.distributed.run --nproc_per_node 4 train_halnet.py ...
+    (the launcher sets RANK, WORLD_SIZE, LOCAL_RANK, MASTER_ADDR and MASTER_PORT)
+    :return: rank and world size of this process (0 and 1 when not distributed)
+    '''
+    world_size = int(os.environ.get('WORLD_SIZE', 1))
+    if world_size == 1:
+        return 0, 1
+    if use_cuda:
+        # one GPU per process; models built afterwards go to it
+        torch.cuda.set_device(int(os.environ.get('LOCAL_RANK', 0)))
+    if not dist.is_initialized():
+        dist.init_process_group(backend=backend)
+    return dist.get_rank(), dist.get_world_size()
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized() and dist.get_world_size() > 1
+
+
+def get_rank():
+    return dist.get_rank() if is_distributed() else 0
+
+
+def is_main_process():
+    '''
+    Only the main process (rank 0) saves checkpoints and logs
+    '''
+    return get_rank() == 0
+
+
+def get_iter_size(batch_size, max_mem_batch, world_size=1):
+    '''
+    :return: number of forward/backward passes of max_mem_batch examples each process
+        accumulates gradients over for one optimiser step of batch_size examples
+    '''
+    iter_size = int(batch_size / (max_mem_batch * world_size))
+    if iter_size < 1:
+        raise ValueError('Batch size ' + str(batch_size) + ' is smaller than max memory batch size (' +
+                         str(max_mem_batch) + ') times number of processes (' + str(world_size) + ')')
+    return iter_size
+
+
+def get_sampler(dataset, world_size, rank):
+    '''
+    Shards the dataset's examples (its filenamebases) across processes: process rank gets every
+    world_size-th example, in dataset order; the tail is dropped so all processes run the same
+    number of iterations
+    '''
+    return torch.utils.data.distributed.DistributedSampler(dataset, num_replicas=world_size, rank=rank,
+                                                           shuffle=False, drop_last=True)
+
+
+def wrap_model(model, sync_bn=False, use_cuda=False):
+    '''
+    :param sync_bn: whether to compute batch norm statistics over the examples of all processes
+        (needs cuda); the parameters are kept, so an optimizer already built on them still works
+    :return: model wrapped in DistributedDataParallel, for the forward and backward passes
+        (the unwrapped model keeps its attributes and state dict keys for checkpoints)
+    '''
+    if sync_bn:
+        if not use_cuda:
+            raise ValueError('Synchronized batch norm needs cuda (torch only supports it on GPU modules)')
+        model = torch.nn.SyncBatchNorm.convert_sync_batchnorm(model)
+    if use_cuda:
+        device_id = torch.cuda.current_device()
+        return torch.nn.parallel.DistributedDataParallel(model, device_ids=[device_id], output_device=device_id)
+    return torch.nn.parallel.DistributedDataParallel(model)
+
+
+def maybe_no_sync(model, sync):
+    '''
+    :param sync: whether gradients are to be all-reduced in this backward pass
+        (only on the last pass of an accumulated batch)
+    :return: context manager skipping the all-reduce otherwise
+    '''
+    if sync or not isinstance(model, torch.nn.parallel.DistributedDataParallel):
+        return contextlib.nullcontext()
+    return model.no_sync()
+
+
+def all_reduce_mean(value):
+    '''
+    :return: mean of a number over all processes (the number itself when not distributed)
+    '''
+    if not is_distributed():
+        return value
+    device = 'cuda' if dist.get_backend() == 'nccl' else 'cpu'
+    tensor = torch.tensor([float(value)], dtype=torch.float64, device=device)
+    dist.all_reduce(tensor)
+    return float(tensor[0]) / dist.get_world_size()
+
+
+def broadcast_object(obj, src=0):
+    '''
+    :return: the object of process src, on every process (obj itself when not distributed)
+    '''
+    if not is_distributed():
+        return obj
+    objects = [obj]
+    dist.broadcast_object_list(objects, src=src)
+    return objects[0]
+
+
+def cleanup():
+    if is_distributed():
+        dist.destroy_process_group()
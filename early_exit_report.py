@@ -0,0 +1,148 @@
+import argparse
+import time
+import numpy as np
+import torch
+import benchmarker
+import converter as conv
+import model_io
+import quantizer
+import HALNet
+
+
+def get_exit_flops(model, input_shape=(4, 320, 240)):
+    '''
+    :return: MACs of a frame taking each exit of HALNet.forward_early_exit (every head
+        before it evaluated too), and of forward_inference
+    '''
+    module_flops = benchmarker.get_module_flops(model, input_shape)
+    exit_flops = []
+    trunk_flops = 0
+    heads_flops = 0
+    for head_name, block_names in model.EARLY_EXITS:
+        trunk_flops += sum(module_flops[block_name] for block_name in block_names)
+        heads_flops += module_flops[head_name]
+        exit_flops.append(trunk_flops + heads_flops)
+    return exit_flops, trunk_flops + module_flops['main_loss_conv']
+
+
+def get_head_confidences(model, eval_loader, measure='peak'):
+    '''
+    :return: (num frames, num intermediate heads) confidences of every intermediate head
+    '''
+    confidences = []
+    num_interm_heads = len(model.EARLY_EXITS) - 1
+    with torch.no_grad():
+        for data, _ in eval_loader:
+            _, _, _, _, res3aout, res4aout, conv4eout = model.forward_subnet(conv.batch_to_device_float(data))
+            head_inputs = [res3aout, res4aout, conv4eout]
+            confidences.append(torch.stack(
+                [HALNet.heatmap_confidence(getattr(model, model.EARLY_EXITS[i][0])(head_inputs[i]),
+                                           measure=measure, log_probs=model.cross_entropy)
+                 for i in range(num_interm_heads)], dim=1))
+    return torch.cat(confidences).numpy()
+
+
+def evaluate_early_exit(model, eval_loader, thresholds, exit_flops, full_flops, measure='peak'):
+    '''
+    :param thresholds: thresholds for forward_early_exit; None for the full network (forward_inference)
+    :return: dict with the fraction of frames taking each exit, compute saved, pixel error and latency
+    '''
+    pixel_errors = []
+    exit_ixs = []
+    elapsed_time = 0.
+    for data, target in eval_loader:
+        target_heatmaps = target[2]
+        batch = conv.batch_to_device_float(data)
+        start = time.perf_counter()
+        if thresholds is None:
+            heatmaps = model.forward_inference(batch)
+            batch_exit_ixs = torch.full((batch.shape[0],), len(exit_flops) - 1, dtype=torch.long)
+        else:
+            heatmaps, batch_exit_ixs = model.forward_early_exit(batch, thresholds, measure=measure)
+        elapsed_time += time.perf_counter() - start
+        pixel_errors.append((quantizer.heatmaps_to_joints_colorspace_batch(heatmaps) -
+                             quantizer.heatmaps_to_joints_colorspace_batch(target_heatmaps)).norm(dim=2))
+        exit_ixs.append(batch_exit_ixs)
+    exit_ixs = torch.cat(exit_ixs).numpy()
+    num_frames = exit_ixs.shape[0]
+    row = {'threshold': 'full' if thresholds is None else thresholds[0] if len(set(thresholds)) == 1
+           else ' '.join(str(threshold) for threshold in thresholds)}
+    for exit_ix in range(len(exit_flops)):
+        row['exit' + str(exit_ix + 1) if exit_ix < len(exit_flops) - 1 else 'main'] = \
+            float(np.mean(exit_ixs == exit_ix))
+    if thresholds is None:
+        row['compute_saved'] = 0.
+    else:
+        row['compute_saved'] = 1 - float(np.mean(np.array(exit_flops)[exit_ixs])) / full_flops
+    row['pixel_error'] = float(torch.cat(pixel_errors).mean())
+    row['mean_ms'] = elapsed_time * 1000 / num_frames
+    return row
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Report compute saved and accuracy of early-exit HALNet '
+                                                 'inference (HALNet.forward_early_exit) over confidence thresholds')
+    parser.add_argument('-c', dest='checkpoint_filepath', required=True,
+                        help='HALNet checkpoint (training checkpoint or inference checkpoint)')
+    parser.add_argument('-r', dest='root_folder', required=True, help='Root folder for dataset')
+    parser.add_argument('--dataset', dest='dataset_name', default='synthhands', choices=['synthhands', 'egodexter'],
+                        help='Dataset of the evaluation frames (default synthhands)')
+    parser.add_argument('--split_filename', dest='split_filename', default='',
+                        help='Split filename for the file with dataset splits (default: dataset default)')
+    parser.add_argument('--type', dest='type_', default='valid',
+                        help='Dataset split of the evaluation frames (default valid)')
+    parser.add_argument('--num_eval', dest='num_eval', type=int, default=200,
+                        help='Number of evaluation frames (default 200)')
+    parser.add_argument('--batch_size', dest='batch_size', type=int, default=1,
+                        help='Batch size (default 1, as in live tracking)')
+    parser.add_argument('--measure', dest='measure', default='peak', choices=['peak', 'entropy'],
+                        help='Confidence measure (default peak)')
+    parser.add_argument('--thresholds', dest='thresholds', type=float, nargs='*', default=[],
+                        help='Confidence thresholds to evaluate, each used for all heads '
+                             '(default: percentiles of the heads\' confidences on the evaluation frames)')
+    parser.add_argument('--percentiles', dest='percentiles', type=float, nargs='+', default=[50, 75, 90, 99],
+                        help='Percentiles of the confidences used as default thresholds (default 50 75 90 99)')
+    parser.add_argument('--num_threads', dest='num_threads', type=int, default=0,
+                        help='Number of torch CPU threads (default 0: torch default)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.num_threads > 0:
+        torch.set_num_threads(args.num_threads)
+    print('Loading HALNet from: ' + args.checkpoint_filepath)
+    model = model_io.load_model_for_inference(args.checkpoint_filepath, model_class=HALNet.HALNet)
+    eval_dataset = quantizer.get_dataset(args.dataset_name, args.root_folder, args.type_, 'HALNet',
+                                         split_filename=args.split_filename)
+    eval_loader = quantizer.get_frames_loader(eval_dataset, args.num_eval, args.batch_size)
+    exit_flops, full_flops = get_exit_flops(model)
+    print('GMACs per frame: ' + ', '.join(head_name + ' exit ' + str(round(flops / 1e9, 2))
+                                          for (head_name, _), flops in zip(model.EARLY_EXITS, exit_flops)) +
+          ' (forward_inference ' + str(round(full_flops / 1e9, 2)) + ')')
+    print('Computing head confidences on ' + str(len(eval_loader.dataset)) + ' frames...')
+    confidences = get_head_confidences(model, eval_loader, measure=args.measure)
+    benchmarker.print_table([{'head': model.EARLY_EXITS[i][0],
+                              **{'p' + str(int(percentile)): float(np.percentile(confidences[:, i], percentile))
+                                 for percentile in args.percentiles}}
+                             for i in range(confidences.shape[1])],
+                            ['head'] + ['p' + str(int(percentile)) for percentile in args.percentiles],
+                            title='Head confidences (' + args.measure + ')', float_precision=4)
+    thresholds = args.thresholds
+    if len(thresholds) == 0:
+        thresholds = sorted(set(float(np.percentile(confidences, percentile)) for percentile in args.percentiles))
+    rows = [evaluate_early_exit(model, eval_loader, None, exit_flops, full_flops)]
+    for threshold in thresholds:
+        print('Evaluating threshold ' + str(threshold) + '...')
+        rows.append(evaluate_early_exit(model, eval_loader, [threshold] * (len(exit_flops) - 1),
+                                        exit_flops, full_flops, measure=args.measure))
+    for row in rows[1:]:
+        row['pixel_error_delta'] = row['pixel_error'] - rows[0]['pixel_error']
+    benchmarker.print_table(rows, ['threshold', 'exit1', 'exit2', 'exit3', 'main', 'compute_saved',
+                                   'pixel_error', 'pixel_error_delta', 'mean_ms'],
+                            title='Early exit (' + args.measure + ', ' + args.type_ + ' split, batch size ' +
+                                  str(args.batch_size) + ')', float_precision=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,8 @@ from dataset_handler import load_dataset_split
 import camera
 import torch
 from converter import convert_labels_2D_new_res, color_space_label_to_heatmap
-from io_image import read_RGB_image
+from io_image import read_RGBD_image
+from sample_cache import SharedSampleCache
 
 SPLIT_PREFIX_LENGTH = 11
 
@@ -31,23 +32,16 @@ PROJECT_MTX =       np.array([[1.0,         0.0,            0.0,        0.0],
 DATASET_SPLIT_FILENAME = 'dataset_split_egodexter.p'
 
 
-def get_data(root_folder, filenamebase, color_on_depth_suffix='_color_on_depth.png', depth_suffix='_depth.png', img_res=(320, 240), as_torch=True):
-    # load color
+def get_data(root_folder, filenamebase, color_on_depth_suffix='_color_on_depth.png', depth_suffix='_depth.png', img_res=(320, 240), as_torch=True, out=None):
     color_on_depth_image_filepath = root_folder + filenamebase + color_on_depth_suffix
-    color_on_depth_image = read_RGB_image(color_on_depth_image_filepath, new_res=img_res)
-    # load depth
     filenamebase_split = filenamebase.split('/')
-    depth_filenamebase = '/'.join(filenamebase_split[0:2]) + '/depth/' + filenamebase_split[-1]
+    depth_filenamebase = '/'.join(filenamebase_split[0:1]) + '/depth/' + filenamebase_split[-1]
     depth_image_filepath = root_folder + depth_filenamebase + depth_suffix
-    depth_image = read_RGB_image(depth_image_filepath, new_res=img_res)
-    depth_image = np.array(depth_image)
-    depth_image = np.reshape(depth_image, (depth_image.shape[0], depth_image.shape[1], 1))
-    # get data
-    RGBD_image = np.concatenate((color_on_depth_image, depth_image), axis=-1)
-    RGBD_image = RGBD_image.swapaxes(1, 2).swapaxes(0, 1)
-    img_data = RGBD_image
+    # decode color and depth into one contiguous (4, U, V) array
+    # float conversion is left to converter.batch_to_device_float
+    img_data = read_RGBD_image(color_on_depth_image_filepath, depth_image_filepath, new_res=img_res, out=out)
     if as_torch:
-        img_data = torch.from_numpy(RGBD_image).float()
+        img_data = torch.from_numpy(img_data)
     return img_data
 
 
@@ -67,8 +61,10 @@ class EgoDexterDataset(Dataset):
     files_annotations_3D = {}
     img_labels = {}
     img_labels_3D = {}
+    cache = None
 
-    def __init__(self, type_, root_folder, heatmap_res, split_ix=0, joint_ixs=range(21), splitfilename='egodexter_split_10.p'):
+    def __init__(self, type_, root_folder, heatmap_res, split_ix=0, joint_ixs=range(21), splitfilename='egodexter_split_10.p',
+                 cache_bytes=0):
         self.type = type_
         self.root_folder = root_folder
         self.img_res = heatmap_res
@@ -94,9 +90,21 @@ class EgoDexterDataset(Dataset):
         for idx in range(10):
             self.__getitem__(idx)
 
+        if cache_bytes > 0:
+            self.enable_cache(cache_bytes)
+
+    def enable_cache(self, max_bytes):
+        '''
+        Keeps up to max_bytes of decoded samples in shared memory
+        Must be called before the dataset is handed to a DataLoader
+        '''
+        self.cache = SharedSampleCache(max_bytes, self.get_image_and_labels(0), self.length)
+        return self.cache
 
     def __getitem__(self, idx):
-        return self.get_image_and_labels(idx)
+        if self.cache is None:
+            return self.get_image_and_labels(idx)
+        return self.cache.get_or_compute(idx, self.get_image_and_labels)
 
     def __len__(self):
         return self.length
@@ -112,27 +120,17 @@ class EgoDexterDataset(Dataset):
             img_labels_heatmaps = torch.from_numpy(img_labels_heatmaps).float()
         return (img_data, (img_labels_2D, img_labels_heatmaps, img_labels_3D))
 
-    def get_image(self, idx, as_torch=True, color_on_depth_suffix='_color_on_depth.png', depth_suffix='_depth.png'):
+    def get_image(self, idx, as_torch=True, color_on_depth_suffix='_color_on_depth.png', depth_suffix='_depth.png', out=None):
         filenamebase = self.filenamebases[idx]
-        # load color
         color_on_depth_image_filepath = self.root_folder + filenamebase + color_on_depth_suffix
-        color_on_depth_image = read_RGB_image(color_on_depth_image_filepath, new_res=self.img_res)
-        # load depth
         filenamebase_split = filenamebase.split('/')
         depth_filenamebase = '/'.join(filenamebase_split[0:1]) + '/depth/' + filenamebase_split[-1]
         depth_image_filepath = self.root_folder + depth_filenamebase + depth_suffix
-        depth_image = read_RGB_image(depth_image_filepath, new_res=self.img_res)
-        depth_image = np.array(depth_image)
-        depth_image = np.reshape(depth_image, (depth_image.shape[0], depth_image.shape[1], 1))
-        # get data
-        RGBD_image = np.concatenate((color_on_depth_image, depth_image), axis=-1)
-        RGBD_image = RGBD_image.swapaxes(1, 2).swapaxes(0, 1)
-        img_data = RGBD_image
+        # decode color and depth into one contiguous (4, U, V) array
+        img_data = read_RGBD_image(color_on_depth_image_filepath, depth_image_filepath,
+                                   new_res=self.img_res, out=out)
         if as_torch:
-            img_data = torch.from_numpy(RGBD_image).float()
-
-
-
+            img_data = torch.from_numpy(img_data)
         return img_data
 
     def get_labels(self, idx):
@@ -224,15 +222,16 @@ class EgoDexterDataset(Dataset):
         v = int(v * prop_res_v)
         return u, v
 
-def get_loader(type, root_folder, img_res=(320, 240), batch_size=16, verbose=False):
+def get_loader(type, root_folder, img_res=(320, 240), batch_size=16, verbose=False, cache_bytes=0, num_workers=0):
     list_of_types = ['train', 'test', 'valid', 'full']
     if verbose:
         print("Loading synthhands " + type + " dataset...")
     if not type in list_of_types:
         raise BaseException('Type ' + type + ' does not exist. Valid types are: ' + str(list_of_types))
-    dataset = EgoDexterDataset(type, root_folder, img_res)
+    dataset = EgoDexterDataset(type, root_folder, img_res, cache_bytes=cache_bytes)
     dataset_loader = torch.utils.data.DataLoader(
         dataset,
         batch_size=batch_size,
-        shuffle=False)
+        shuffle=False,
+        num_workers=num_workers)
     return dataset_loader
\ No newline at end of file
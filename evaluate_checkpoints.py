@@ -0,0 +1,300 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import time
+import numpy as np
+import torch
+import benchmarker
+import converter as conv
+import deploy
+import model_io
+import quantizer
+from debugger import print_verbose
+from magic import display_est_time_loop
+
+# training checkpoints saved for validation by the train scripts: <filenamebase>for_valid_<iter>.pth.tar
+CHECKPOINT_PREFIX = 'for_valid_'
+
+
+def get_checkpoint_iter(checkpoint_filepath):
+    return int(os.path.basename(checkpoint_filepath).split(CHECKPOINT_PREFIX)[-1].split('.')[0])
+
+
+def find_checkpoints(folder, prefix=CHECKPOINT_PREFIX):
+    '''
+    :return: paths of the checkpoints saved for validation in folder, sorted by training iteration
+    '''
+    filepaths = [os.path.join(folder, filename) for filename in os.listdir(folder)
+                 if prefix in filename and filename.endswith('.pth.tar')]
+    return sorted(filepaths, key=get_checkpoint_iter)
+
+
+class CheckpointsEvaluator:
+    '''
+    Per joint errors of several models over the same stream of batches: pixel distance between output and
+    target heatmap maxima and, for JORNet, distance (mm) between regressed and target joints
+    Models are loaded for inference (weights only, no optimizer)
+    '''
+    def __init__(self, checkpoint_filepaths, model_class_name, use_cuda=False):
+        self.checkpoint_filepaths = checkpoint_filepaths
+        self.use_cuda = use_cuda
+        self.models = [model_io.load_model_for_inference(filepath, deploy.MODEL_CLASSES[model_class_name],
+                                                         use_cuda=use_cuda)
+                       for filepath in checkpoint_filepaths]
+        self.regresses_joints = model_class_name == 'JORNet'
+        self.pixel_error_sums = None
+        self.mm_error_sums = None
+        self.num_examples = 0
+
+    def add_batch(self, data, target_joints, target_heatmaps):
+        '''
+        :param data: (N, 4, U, V) uint8 images, as given by the dataset loaders
+        '''
+        data = conv.batch_to_device_float(torch.as_tensor(data), self.use_cuda)
+        target_uv = quantizer.heatmaps_to_joints_colorspace_batch(torch.as_tensor(target_heatmaps))
+        if self.regresses_joints:
+            # joints regressed relative to the hand root, without the root itself
+            target_joints = torch.as_tensor(target_joints)[:, 3:].reshape((data.shape[0], -1, 3))
+        pixel_error_sums = []
+        mm_error_sums = []
+        for model in self.models:
+            # main heatmaps (and, for JORNet, main joints) only, without the intermediate heads
+            output = model.forward_inference(data)
+            output_heatmaps = output[0] if self.regresses_joints else output
+            output_uv = quantizer.heatmaps_to_joints_colorspace_batch(output_heatmaps.cpu())
+            pixel_error_sums.append((output_uv - target_uv).norm(dim=2).sum(dim=0).numpy())
+            if self.regresses_joints:
+                output_joints = output[1].cpu().reshape(target_joints.shape)
+                mm_error_sums.append((output_joints - target_joints).norm(dim=2).sum(dim=0).numpy())
+        if self.pixel_error_sums is None:
+            self.pixel_error_sums = np.zeros((len(self.models), len(pixel_error_sums[0])))
+            if self.regresses_joints:
+                self.mm_error_sums = np.zeros((len(self.models), len(mm_error_sums[0])))
+        self.pixel_error_sums += np.array(pixel_error_sums)
+        if self.regresses_joints:
+            self.mm_error_sums += np.array(mm_error_sums)
+        self.num_examples += data.shape[0]
+
+    def get_error_sums(self):
+        return self.pixel_error_sums, self.mm_error_sums, self.num_examples
+
+
+def _evaluate_in_process(checkpoint_filepaths, model_class_name, use_cuda, num_threads, batch_queue, result_queue):
+    torch.set_num_threads(num_threads)
+    evaluator = CheckpointsEvaluator(checkpoint_filepaths, model_class_name, use_cuda=use_cuda)
+    # signals that the models are loaded
+    result_queue.put(None)
+    while True:
+        batch = batch_queue.get()
+        if batch is None:
+            break
+        evaluator.add_batch(*batch)
+    result_queue.put((checkpoint_filepaths, evaluator.get_error_sums()))
+
+
+def _check_processes(processes):
+    for process in processes:
+        if process.exitcode is not None and not process.exitcode == 0:
+            raise RuntimeError('Evaluation process ' + str(process.pid) + ' died (exit code ' +
+                               str(process.exitcode) + ')')
+
+
+def _get_from_processes(result_queue, processes, timeout=1.):
+    # waits on the processes' results, raising if one of them dies instead of hanging
+    while True:
+        try:
+            return result_queue.get(timeout=timeout)
+        except queue.Empty:
+            _check_processes(processes)
+
+
+def _put_to_process(batch_queue, item, process, timeout=1.):
+    while True:
+        try:
+            batch_queue.put(item, timeout=timeout)
+            return
+        except queue.Full:
+            _check_processes([process])
+
+
+def get_results(checkpoint_filepaths, pixel_error_sums, mm_error_sums, num_examples):
+    '''
+    :return: list of dicts, one per checkpoint, of its iteration and mean errors, overall and per joint
+    '''
+    results = []
+    for i, filepath in enumerate(checkpoint_filepaths):
+        pixel_errors = pixel_error_sums[i] / max(num_examples, 1)
+        result = {
+            'checkpoint': filepath,
+            'iter': get_checkpoint_iter(filepath) if CHECKPOINT_PREFIX in os.path.basename(filepath) else -1,
+            'num_examples': num_examples,
+            'pixel_error': float(np.mean(pixel_errors)),
+            'pixel_errors': pixel_errors.tolist(),
+        }
+        if mm_error_sums is not None:
+            mm_errors = mm_error_sums[i] / max(num_examples, 1)
+            result['mm_error'] = float(np.mean(mm_errors))
+            result['mm_errors'] = mm_errors.tolist()
+        results.append(result)
+    return results
+
+
+def evaluate_checkpoints(checkpoint_filepaths, model_class_name, loader, num_batches=0, num_processes=0,
+                         use_cuda=False, verbose=True):
+    '''
+    Evaluates several checkpoints decoding the dataset once: every model runs on each batch
+    :param num_batches: number of batches to evaluate on (default 0: all)
+    :param num_processes: number of processes the models are split across (0: all evaluated in this process)
+    :return: list of the results of each checkpoint (as get_results), in the given order
+    '''
+    num_batches = len(loader) if num_batches <= 0 else min(num_batches, len(loader))
+    processes = []
+    if num_processes > 0:
+        num_processes = min(num_processes, len(checkpoint_filepaths))
+        ctx = mp.get_context('spawn')
+        result_queue = ctx.Queue()
+        batch_queues = []
+        num_threads = max(1, torch.get_num_threads() // num_processes)
+        for process_ix in range(num_processes):
+            # few batches in flight, so decoding does not run ahead of the slowest process
+            batch_queue = ctx.Queue(maxsize=2)
+            process = ctx.Process(target=_evaluate_in_process,
+                                  args=(checkpoint_filepaths[process_ix::num_processes], model_class_name,
+                                        use_cuda, num_threads, batch_queue, result_queue))
+            process.start()
+            processes.append(process)
+            batch_queues.append(batch_queue)
+    else:
+        evaluator = CheckpointsEvaluator(checkpoint_filepaths, model_class_name, use_cuda=use_cuda)
+    tot_toc = 0
+    try:
+        for _ in processes:
+            _get_from_processes(result_queue, processes)
+        print_verbose("Loaded " + str(len(checkpoint_filepaths)) + " checkpoints", verbose)
+        start = time.time()
+        for batch_idx, (data, target) in enumerate(loader):
+            if batch_idx >= num_batches:
+                break
+            target_joints, target_heatmaps = target[1], target[2]
+            if len(processes) > 0:
+                batch = (data.numpy(), target_joints.numpy(), target_heatmaps.numpy())
+                for batch_queue, process in zip(batch_queues, processes):
+                    _put_to_process(batch_queue, batch, process)
+            else:
+                evaluator.add_batch(data, target_joints, target_heatmaps)
+            if verbose:
+                tot_toc = display_est_time_loop(tot_toc + time.time() - start, batch_idx + 1, num_batches,
+                                                prefix='Evaluating batch ' + str(batch_idx + 1) + '/' +
+                                                       str(num_batches) + ': ')
+                start = time.time()
+        print_verbose("", verbose)
+        if len(processes) == 0:
+            return get_results(checkpoint_filepaths, *evaluator.get_error_sums())
+        for batch_queue, process in zip(batch_queues, processes):
+            _put_to_process(batch_queue, None, process)
+        results = {}
+        for _ in processes:
+            process_filepaths, error_sums = _get_from_processes(result_queue, processes)
+            for result in get_results(process_filepaths, *error_sums):
+                results[result['checkpoint']] = result
+        return [results[filepath] for filepath in checkpoint_filepaths]
+    finally:
+        for process in processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+
+def format_results(results, joint_errors_key='pixel_errors', first_joint_ix=0):
+    '''
+    :param first_joint_ix: index of the joint of the first error (1 for the regressed joints, without the root)
+    :return: table with a row per checkpoint: its iteration, mean errors and error of each joint
+    '''
+    rows = []
+    for result in results:
+        row = {'iter': result['iter'], 'pixel_error': result['pixel_error']}
+        if 'mm_error' in result:
+            row['mm_error'] = result['mm_error']
+        for joint_ix, joint_error in enumerate(result[joint_errors_key]):
+            row['j' + str(first_joint_ix + joint_ix)] = joint_error
+        rows.append(row)
+    return benchmarker.format_table(rows, list(rows[0].keys()))
+
+
+def get_best_result(results, error_key='pixel_error'):
+    return min(results, key=lambda result: result[error_key])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Evaluate many checkpoints of a training run decoding the '
+                                                 'validation set once, and tabulate their per joint errors')
+    parser.add_argument('-c', dest='checkpoint_filepaths', nargs='*', default=[],
+                        help='Checkpoints to evaluate')
+    parser.add_argument('-d', dest='checkpoints_folder', default='',
+                        help='Folder whose checkpoints saved for validation (' + CHECKPOINT_PREFIX +
+                             '<iter>.pth.tar) are evaluated, besides those given with -c')
+    parser.add_argument('--model', dest='model_class', default='HALNet', choices=list(deploy.MODEL_CLASSES.keys()),
+                        help='Network class of the checkpoints (default HALNet)')
+    parser.add_argument('-r', dest='root_folder', required=True, help='Root folder for dataset')
+    parser.add_argument('--split_filename', dest='split_filename', default='',
+                        help='Split filename for the file with dataset splits (default: dataset default)')
+    parser.add_argument('--type', dest='type_', default='valid',
+                        help='SynthHands split to evaluate on (default valid)')
+    parser.add_argument('--batch_size', dest='batch_size', type=int, default=8,
+                        help='Batch size (default 8)')
+    parser.add_argument('--num_batches', dest='num_batches', type=int, default=0,
+                        help='Number of batches to evaluate on (default 0: the whole split)')
+    parser.add_argument('--num_processes', dest='num_processes', type=int, default=0,
+                        help='Number of processes the models are split across, each getting every batch '
+                             '(default 0: all models in this process). All models are kept in memory')
+    parser.add_argument('--num_workers', type=int, dest='num_workers', default=0,
+                        help='Number of DataLoader worker processes (default 0)')
+    parser.add_argument('--sort', dest='sort_key', default='iter', choices=['iter', 'pixel_error', 'mm_error'],
+                        help='Column to sort the table by (default iter)')
+    parser.add_argument('-o', dest='output_filepath', default='',
+                        help='JSON file to write the errors of every checkpoint to (default: none)')
+    parser.add_argument('--cuda', dest='use_cuda', action='store_true', default=False,
+                        help='Whether to evaluate on GPU')
+    parser.add_argument('-v', '--verbose', dest='verbose', action='store_true', default=True,
+                        help='Verbose mode')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    checkpoint_filepaths = list(args.checkpoint_filepaths)
+    if not args.checkpoints_folder == '':
+        checkpoint_filepaths += find_checkpoints(args.checkpoints_folder)
+    if len(checkpoint_filepaths) == 0:
+        raise ValueError('No checkpoints to evaluate: give them with -c or a folder with -d')
+    dataset = quantizer.get_dataset('synthhands', args.root_folder, args.type_, args.model_class,
+                                    split_filename=args.split_filename)
+    loader = torch.utils.data.DataLoader(dataset, batch_size=args.batch_size, shuffle=False,
+                                         num_workers=args.num_workers)
+    print_verbose("Evaluating " + str(len(checkpoint_filepaths)) + " checkpoints on the " + args.type_ +
+                  " split (" + str(len(dataset)) + " examples)", args.verbose)
+    results = evaluate_checkpoints(checkpoint_filepaths, args.model_class, loader, num_batches=args.num_batches,
+                                   num_processes=args.num_processes, use_cuda=args.use_cuda, verbose=args.verbose)
+    if args.sort_key == 'mm_error' and not 'mm_error' in results[0]:
+        args.sort_key = 'pixel_error'
+    sorted_results = sorted(results, key=lambda result: result[args.sort_key])
+    print("Mean pixel error per joint:")
+    print(format_results(sorted_results))
+    if 'mm_error' in results[0]:
+        print("Mean error (mm) per joint:")
+        print(format_results(sorted_results, joint_errors_key='mm_errors', first_joint_ix=1))
+    best_result = get_best_result(results)
+    print("Best checkpoint: " + best_result['checkpoint'] + " (iteration " + str(best_result['iter']) +
+          ", mean pixel error " + str(round(best_result['pixel_error'], 2)) + ")")
+    if not args.output_filepath == '':
+        with open(args.output_filepath, 'w') as f:
+            json.dump({'info': {'model': args.model_class, 'root_folder': args.root_folder, 'type': args.type_,
+                                'num_examples': results[0]['num_examples']},
+                       'checkpoints': results}, f, indent=2)
+        print("Wrote errors of all checkpoints to: " + args.output_filepath)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import argparse
+import inspect
+import torch
+import benchmarker
+import deploy
+import inference_backends
+
+
+def get_output_names(model):
+    if type(model).__name__ == 'JORNet':
+        return ['heatmaps', 'joints']
+    return ['heatmaps']
+
+
+def export_torchscript(model, filepath, input_shape):
+    '''
+    Traces the inference-only forward pass of a network into a frozen TorchScript file
+    The traced graph keeps the batch size dynamic
+    '''
+    model.eval()
+    example_batch = torch.rand((2,) + tuple(input_shape))
+    with torch.no_grad():
+        traced_model = torch.jit.trace(inference_backends.InferenceWrapper(model).eval(), example_batch)
+    # inline the weights used by the graph as constants, dropping the unused heads' parameters
+    traced_model = torch.jit.freeze(traced_model)
+    traced_model.save(filepath)
+
+
+def export_onnx(model, filepath, input_shape, opset_version=17):
+    '''
+    Exports the inference-only forward pass of a network to an ONNX file with a dynamic batch axis
+    '''
+    model.eval()
+    example_batch = torch.rand((2,) + tuple(input_shape))
+    output_names = get_output_names(model)
+    dynamic_axes = {'input': {0: 'batch_size'}}
+    for output_name in output_names:
+        dynamic_axes[output_name] = {0: 'batch_size'}
+    export_kwargs = {}
+    # newer torch versions default to the dynamo exporter; keep the tracing one
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs['dynamo'] = False
+    with torch.no_grad():
+        torch.onnx.export(inference_backends.InferenceWrapper(model).eval(), example_batch, filepath,
+                          input_names=['input'], output_names=output_names,
+                          dynamic_axes=dynamic_axes, opset_version=opset_version, **export_kwargs)
+
+
+def get_max_abs_diff(outputs, ref_outputs):
+    if isinstance(ref_outputs, torch.Tensor):
+        outputs, ref_outputs = (outputs,), (ref_outputs,)
+    return max(float((output.cpu() - ref_output.cpu()).abs().max())
+               for output, ref_output in zip(outputs, ref_outputs))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Export a trained network to TorchScript and ONNX, '
+                                                 'check them against eager PyTorch and compare CPU latency')
+    parser.add_argument('-c', dest='checkpoint_filepath', default='',
+                        help='Training checkpoint to export (default: randomly initialised network)')
+    parser.add_argument('--model', dest='model_class', default='HALNet', choices=list(deploy.MODEL_CLASSES.keys()),
+                        help='Network class of the checkpoint (default HALNet)')
+    parser.add_argument('-o', dest='output_filebase', required=True,
+                        help='Output file base; writes <base>.pt (TorchScript) and <base>.onnx (ONNX)')
+    parser.add_argument('--fold_bn', dest='fold_bn', action='store_true', default=False,
+                        help='Whether to fold Conv+BatchNorm before exporting')
+    parser.add_argument('--opset', dest='opset_version', type=int, default=17,
+                        help='ONNX opset version (default 17)')
+    parser.add_argument('--batch_sizes', dest='batch_sizes', type=int, nargs='+', default=[1, 16],
+                        help='Batch sizes for checking and benchmarking (default 1 16)')
+    parser.add_argument('--num_iter', type=int, dest='num_iter', default=10,
+                        help='Number of timed iterations when benchmarking (default 10)')
+    parser.add_argument('--num_threads', dest='num_threads', type=int, default=0,
+                        help='Number of CPU threads for torch and ONNX Runtime (default 0: library default)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.num_threads > 0:
+        torch.set_num_threads(args.num_threads)
+    model_class = deploy.MODEL_CLASSES[args.model_class]
+    input_shape = deploy.MODEL_INPUT_SHAPES[args.model_class]
+    if args.checkpoint_filepath == '':
+        print("No checkpoint given; exporting a randomly initialised " + args.model_class)
+        params_dict = {}
+        params_dict['joint_ixs'] = list(range(21))
+        params_dict['use_cuda'] = False
+        params_dict['cross_entropy'] = True
+        model = model_class(params_dict)
+        deploy.randomize_bn_stats(model)
+    else:
+        print("Loading model from checkpoint: " + args.checkpoint_filepath)
+        model = deploy.load_model_weights(args.checkpoint_filepath, model_class)
+    model.eval()
+    if args.fold_bn:
+        model = deploy.fold_model_conv_bn(model)
+    torchscript_filepath = args.output_filebase + '.pt'
+    onnx_filepath = args.output_filebase + '.onnx'
+    print("Exporting TorchScript: " + torchscript_filepath)
+    export_torchscript(model, torchscript_filepath, input_shape)
+    print("Exporting ONNX: " + onnx_filepath)
+    export_onnx(model, onnx_filepath, input_shape, opset_version=args.opset_version)
+
+    backends = [inference_backends.EagerBackend(model),
+                inference_backends.TorchScriptBackend(torchscript_filepath)]
+    try:
+        backends.append(inference_backends.ONNXRuntimeBackend(onnx_filepath, num_threads=args.num_threads))
+    except ImportError as e:
+        print("WARNING: Skipping ONNX Runtime check: " + str(e))
+    rows = []
+    for batch_size in args.batch_sizes:
+        batch = torch.rand((batch_size,) + input_shape)
+        ref_outputs = backends[0].forward_inference(batch)
+        for backend in backends:
+            row = benchmarker.time_func(lambda: backend.forward_inference(batch), num_iter=args.num_iter)
+            row['backend'] = backend.name
+            row['batch_size'] = batch_size
+            row['max_abs_diff'] = '{:.2e}'.format(get_max_abs_diff(backend.forward_inference(batch), ref_outputs))
+            row['ms_per_frame'] = row['mean_ms'] / batch_size
+            rows.append(row)
+    benchmarker.print_table(rows, ['backend', 'batch_size', 'max_abs_diff', 'mean_ms', 'std_ms', 'p95_ms',
+                                   'ms_per_frame'],
+                            title='Accuracy (vs eager) and CPU latency (' + args.model_class + ')')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import os
+import time
+import frame_ring
+import synthhands_handler
+import egodexter_handler
+
+DATASETS = ['synthhands', 'egodexter']
+
+
+def get_sequence_filenamebases(root_folder, sequence_folder, dataset_name,
+                               color_on_depth_suffix='_color_on_depth.png'):
+    '''
+    :param sequence_folder: relative to root_folder, e.g. female_noobject/seq01/cam01/01/ for SynthHands
+        or Desk/ for EgoDexter
+    :return: sorted file name bases of the frames of a sequence, relative to root_folder
+    '''
+    sequence_folder = sequence_folder.rstrip('/') + '/'
+    if dataset_name == 'synthhands':
+        filenames = os.listdir(root_folder + sequence_folder)
+        return sorted(sequence_folder + filename[:-len(color_on_depth_suffix)]
+                      for filename in filenames if filename.endswith(color_on_depth_suffix))
+    elif dataset_name == 'egodexter':
+        # EgoDexter keeps the color on depth and depth images in separate subfolders
+        color_folder = sequence_folder + 'color_on_depth/'
+        filenames = os.listdir(root_folder + color_folder)
+        return sorted(color_folder + filename[:-len(color_on_depth_suffix)]
+                      for filename in filenames if filename.endswith(color_on_depth_suffix))
+    raise ValueError('Dataset ' + str(dataset_name) + ' does not exist. Valid datasets are: ' + str(DATASETS))
+
+
+def decode_frame(root_folder, filenamebase, dataset_name, img_res, out):
+    '''
+    Decodes a frame directly into a ring slot
+    '''
+    if dataset_name == 'synthhands':
+        synthhands_handler._get_data(root_folder, filenamebase, img_res, as_torch=False, out=out)
+    else:
+        egodexter_handler.get_data(root_folder, filenamebase, img_res=img_res, as_torch=False, out=out)
+
+
+def replay_sequence(ring, root_folder, filenamebases, dataset_name, fps=30., num_frames=0, loop=False,
+                    verbose=True):
+    '''
+    Writes the frames of a sequence to the ring at a target frame rate, as a camera would
+    Frames are timestamped when they are due, so decoding time counts towards tracking latency
+    :return: number of frames written and number of frames written late
+    '''
+    img_res = ring.frame_shape[1:]
+    frame_period = 1. / fps if fps > 0 else 0.
+    num_written = 0
+    num_late = 0
+    start = time.perf_counter()
+    start_time = time.time()
+    while True:
+        for filenamebase in filenamebases:
+            if 0 < num_frames <= num_written:
+                return num_written, num_late
+            due = start + num_written * frame_period
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            frame_number, slot = ring.begin_write()
+            decode_frame(root_folder, filenamebase, dataset_name, img_res, out=slot)
+            ring.end_write(frame_number, timestamp=start_time + (due - start))
+            if time.perf_counter() > due + frame_period:
+                num_late += 1
+            num_written += 1
+            if verbose and num_written % 100 == 0:
+                print('Written ' + str(num_written) + ' frames (' + str(num_late) + ' late)')
+        if not loop:
+            return num_written, num_late
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Replay a SynthHands/EgoDexter sequence into a shared-memory '
+                                                 'frame ring at a target frame rate, as a capture process '
+                                                 '(see tracking_demo.py --ring)')
+    parser.add_argument('-r', dest='root_folder', required=True, help='Root folder for dataset')
+    parser.add_argument('-s', dest='sequence_folder', required=True,
+                        help='Sequence folder, relative to the root folder '
+                             '(e.g. female_noobject/seq01/cam01/01/ or Desk/)')
+    parser.add_argument('--dataset', dest='dataset_name', default='synthhands', choices=DATASETS,
+                        help='Dataset of the sequence (default synthhands)')
+    parser.add_argument('--ring', dest='ring_name', default='handtracking_frames',
+                        help='Name of the shared-memory ring (default handtracking_frames)')
+    parser.add_argument('--num_slots', dest='num_slots', type=int, default=8,
+                        help='Number of frames the ring holds (default 8)')
+    parser.add_argument('--fps', dest='fps', type=float, default=30.,
+                        help='Target frame rate (default 30; 0 for as fast as possible)')
+    parser.add_argument('--num_frames', dest='num_frames', type=int, default=0,
+                        help='Number of frames to write (default 0: the whole sequence, or forever with --loop)')
+    parser.add_argument('--loop', dest='loop', action='store_true', default=False,
+                        help='Whether to replay the sequence in a loop')
+    parser.add_argument('--linger', dest='linger', type=float, default=2.,
+                        help='Seconds to keep the ring alive after the last frame, so readers can finish (default 2)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    filenamebases = get_sequence_filenamebases(args.root_folder, args.sequence_folder, args.dataset_name)
+    if len(filenamebases) == 0:
+        raise ValueError('No frames found in ' + args.root_folder + args.sequence_folder)
+    print('Replaying ' + str(len(filenamebases)) + ' frames at ' + str(args.fps) + ' fps into ring ' +
+          args.ring_name)
+    with frame_ring.FrameRing.create(args.ring_name, num_slots=args.num_slots) as ring:
+        try:
+            num_written, num_late = replay_sequence(ring, args.root_folder, filenamebases, args.dataset_name,
+                                                    fps=args.fps, num_frames=args.num_frames, loop=args.loop)
+            print('Written ' + str(num_written) + ' frames (' + str(num_late) + ' late)')
+            time.sleep(args.linger)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
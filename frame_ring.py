@@ -0,0 +1,234 @@
+import time
+import numpy as np
+from multiprocessing import shared_memory
+
+# header: magic, num_slots, C, U, V, number of frames written so far
+HEADER_FIELDS = 6
+RING_MAGIC = 0x52474244  # 'RGBD'
+# slot sequence number of a slot being written (seqlock)
+SLOT_WRITING = -1
+SLOT_EMPTY = -2
+
+
+def _attach_shared_memory(name):
+    '''
+    Attaches to an existing segment without registering it with this process's resource tracker,
+    which would otherwise unlink it (and warn about a leak) when the attaching process exits
+    Meant for processes other than the creator, which keeps the segment registered
+    '''
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13 has no track argument
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return shm
+
+
+def _get_layout(num_slots, frame_shape):
+    '''
+    :return: byte offsets of the slot sequence numbers, slot timestamps and frames, and the total size
+    '''
+    seqs_offset = HEADER_FIELDS * 8
+    timestamps_offset = seqs_offset + num_slots * 8
+    # frames start on a 64 byte boundary
+    frames_offset = int(np.ceil((timestamps_offset + num_slots * 8) / 64.) * 64)
+    size = frames_offset + num_slots * int(np.prod(frame_shape))
+    return seqs_offset, timestamps_offset, frames_offset, size
+
+
+class FrameRing:
+    '''
+    Shared-memory ring buffer of fixed-size (4, U, V) uint8 RGB-D frames, for one writer (the capture
+    process) and any number of readers (tracking processes)
+    Frame n is written to slot n % num_slots, overwriting the oldest frame (drop-oldest: the writer
+    never waits for readers)
+    Each slot has the number of the frame it holds, set to SLOT_WRITING while the frame is being
+    written (a seqlock): a reader can use a slot as a numpy/torch view without copying and check
+    with is_valid afterwards that the frame was not overwritten meanwhile
+    Create the ring in the writer with FrameRing.create and attach to it in readers with FrameRing.attach
+    '''
+    def __init__(self, shm, num_slots, frame_shape, owner=False):
+        self.shm = shm
+        self.name = shm.name
+        self.num_slots = num_slots
+        self.frame_shape = tuple(frame_shape)
+        self.owner = owner
+        seqs_offset, timestamps_offset, frames_offset, _ = _get_layout(num_slots, frame_shape)
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        self.slot_seqs = np.ndarray((num_slots,), dtype=np.int64, buffer=shm.buf, offset=seqs_offset)
+        self.slot_timestamps = np.ndarray((num_slots,), dtype=np.float64, buffer=shm.buf,
+                                          offset=timestamps_offset)
+        self.frames = np.ndarray((num_slots,) + self.frame_shape, dtype=np.uint8, buffer=shm.buf,
+                                 offset=frames_offset)
+
+    @classmethod
+    def create(cls, name=None, num_slots=8, frame_shape=(4, 320, 240)):
+        _, _, _, size = _get_layout(num_slots, frame_shape)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        ring = cls(shm, num_slots, frame_shape, owner=True)
+        ring.slot_seqs[:] = SLOT_EMPTY
+        ring.slot_timestamps[:] = 0.
+        ring.header[1:5] = (num_slots,) + tuple(frame_shape)
+        ring.header[5] = 0
+        # written last, so readers never see a half-initialised header
+        ring.header[0] = RING_MAGIC
+        return ring
+
+    @classmethod
+    def attach(cls, name, timeout=0.):
+        '''
+        :param timeout: seconds to wait for the writer to create the ring
+        '''
+        deadline = time.perf_counter() + timeout
+        while True:
+            try:
+                shm = _attach_shared_memory(name)
+                header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+                if header[0] == RING_MAGIC:
+                    num_slots = int(header[1])
+                    frame_shape = tuple(int(dim) for dim in header[2:5])
+                    del header
+                    return cls(shm, num_slots, frame_shape)
+                del header
+                shm.close()
+            except FileNotFoundError:
+                pass
+            if time.perf_counter() >= deadline:
+                raise FileNotFoundError('No frame ring named ' + str(name))
+            time.sleep(0.01)
+
+    def get_num_written(self):
+        return int(self.header[5])
+
+    def begin_write(self):
+        '''
+        Marks the slot of the next frame as being written
+        :return: frame number and the slot as a writable (4, U, V) view (e.g. to decode into)
+        '''
+        frame_number = self.get_num_written()
+        slot_ix = frame_number % self.num_slots
+        self.slot_seqs[slot_ix] = SLOT_WRITING
+        return frame_number, self.frames[slot_ix]
+
+    def end_write(self, frame_number, timestamp=None):
+        '''
+        Publishes a frame started with begin_write
+        :param timestamp: capture time (time.time()); default now
+        '''
+        slot_ix = frame_number % self.num_slots
+        self.slot_timestamps[slot_ix] = time.time() if timestamp is None else timestamp
+        self.slot_seqs[slot_ix] = frame_number
+        self.header[5] = frame_number + 1
+
+    def write(self, frame, timestamp=None):
+        '''
+        Copies a (4, U, V) frame into the next slot
+        :return: frame number
+        '''
+        frame_number, slot = self.begin_write()
+        slot[...] = frame
+        self.end_write(frame_number, timestamp)
+        return frame_number
+
+    def is_valid(self, frame_number):
+        '''
+        :return: whether the frame is (still) in its slot, i.e. was not overwritten
+        '''
+        return int(self.slot_seqs[frame_number % self.num_slots]) == frame_number
+
+    def get(self, frame_number, copy=False):
+        '''
+        :param copy: whether to return a copy instead of a view of the slot
+        :return: (4, U, V) frame and its timestamp, or (None, None) if the frame was not
+            written yet or was already overwritten
+            A view is only valid while is_valid(frame_number)
+        '''
+        if not self.is_valid(frame_number):
+            return None, None
+        slot_ix = frame_number % self.num_slots
+        timestamp = float(self.slot_timestamps[slot_ix])
+        frame = self.frames[slot_ix]
+        if copy:
+            frame = frame.copy()
+        if not self.is_valid(frame_number):
+            return None, None
+        return frame, timestamp
+
+    def get_torch(self, frame_number):
+        '''
+        :return: (4, U, V) uint8 torch tensor sharing the slot's memory, and its timestamp
+        '''
+        import torch
+        frame, timestamp = self.get(frame_number)
+        if frame is None:
+            return None, None
+        return torch.from_numpy(frame), timestamp
+
+    def close(self):
+        # views into the buffer must be dropped before the segment can be closed
+        self.header = self.slot_seqs = self.slot_timestamps = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class FrameReader:
+    '''
+    Follows the frames written to a ring, counting the frames it skipped
+    latest=True always returns the newest frame (lowest latency, for live tracking);
+    latest=False returns every frame still in the ring, skipping only those already overwritten
+    '''
+    def __init__(self, ring, latest=False, poll_interval=0.0005):
+        self.ring = ring
+        self.latest = latest
+        self.poll_interval = poll_interval
+        self.next_frame_number = 0
+        self.num_read = 0
+        self.num_dropped = 0
+
+    def read(self, timeout=None):
+        '''
+        Waits for the next frame
+        :return: frame number, (4, U, V) view of the frame and its timestamp;
+            (None, None, None) on timeout
+        '''
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            num_written = self.ring.get_num_written()
+            if num_written > self.next_frame_number:
+                if self.latest:
+                    frame_number = num_written - 1
+                else:
+                    frame_number = max(self.next_frame_number, num_written - self.ring.num_slots)
+                frame, timestamp = self.ring.get(frame_number)
+                if frame is not None:
+                    self.num_dropped += frame_number - self.next_frame_number
+                    self.num_read += 1
+                    self.next_frame_number = frame_number + 1
+                    return frame_number, frame, timestamp
+                # overwritten before it could be read: retry with the newer frames
+                continue
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None, None, None
+            time.sleep(self.poll_interval)
+
+    def __iter__(self):
+        '''
+        Yields (frame number, view, timestamp) until no frame arrives for a second
+        '''
+        while True:
+            frame_number, frame, timestamp = self.read(timeout=1.)
+            if frame is None:
+                return
+            yield frame_number, frame, timestamp
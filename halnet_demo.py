@@ -3,45 +3,37 @@
 # -i Fruits/color_on_depth/image_00000 -r /home/paulo/EgoDexter/data/ --halnet /home/paulo/muellericcv2017/trainednets/trained_HALNet_1493752625_.pth.tar --jornet /home/paulo/muellericcv2017/trainednets/trained_JORNet_1662451312_for_valid_30000.pth.tar
 # -i data/Desk/color_on_depth/image_00000 -r /home/paulo/EgoDexter/ --halnet /home/paulo/muellericcv2017/trainednets/trained_HALNet_1493752625_.pth.tar --jornet /home/paulo/muellericcv2017/trainednets/trained_JORNet_1662451312_for_valid_70000.pth.tar
 
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
 import numpy as np
-import trainer
+import model_io
 import synthhands_handler
 import egodexter_handler
 import argparse
 import converter as conv
-import HALNet, JORNet
+import HALNet
 import time
-import camera
-import visualize
-
-parser = argparse.ArgumentParser(description='Train a hand-tracking deep neural network')
-parser.add_argument('-i', dest='input_img_namebase', default='', type=str, required=False,
-                    help='Inpimport HALNet, JORNetut image file name base (e.g. female_noobject/seq01/cam01/01/00000000')
-parser.add_argument('-r', dest='dataset_folder', default='', type=str, required=True,
-                    help='Dataset folder')
-parser.add_argument('--halnet', dest='halnet_filepath', type=str, required=True,
-                    help='Filepath to trained HALNet checkpoint')
-parser.add_argument('--cuda', dest='use_cuda', action='store_true', default=False,
-                    help='Whether to use cuda for training')
-parser.add_argument('-o', dest='output_filepath', default='',
-                    help='Output file for logging')
-args = parser.parse_args()
-
-dataset_name = args.dataset_folder.split('/')[-2]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Train a hand-tracking deep neural network')
+    parser.add_argument('-i', dest='input_img_namebase', default='', type=str, required=False,
+                        help='Input image file name base (e.g. female_noobject/seq01/cam01/01/00000000')
+    parser.add_argument('-r', dest='dataset_folder', default='', type=str, required=True,
+                        help='Dataset folder')
+    parser.add_argument('--halnet', dest='halnet_filepath', type=str, required=True,
+                        help='Filepath to trained HALNet checkpoint')
+    parser.add_argument('--cuda', dest='use_cuda', action='store_true', default=False,
+                        help='Whether to use cuda for training')
+    parser.add_argument('-o', dest='output_filepath', default='',
+                        help='Output file for logging')
+    return parser.parse_args()
+
 
 def print_time(str_, time_diff):
     print(str_ + str(round(time_diff*1000)) + ' ms')
 
-# load nets
-start = time.time()
-halnet, _, _, _ = trainer.load_checkpoint(filename=args.halnet_filepath,
-                                          model_class=HALNet.HALNet,
-                                          use_cuda=args.use_cuda)
-print_time('HALNet loading: ', time.time() - start)
-
 def plot_joints(joints_colorspace, show_legend=True, linewidth=4):
+    from matplotlib import pyplot as plt
+    import matplotlib.patches as mpatches
     num_joints = joints_colorspace.shape[0]
     joints_colorspace = conv.numpy_swap_cols(joints_colorspace, 0, 1)
     plt.plot(joints_colorspace[0, 1], joints_colorspace[0, 0], 'ro', color='C0')
@@ -82,39 +74,55 @@ def get_image_as_data(dataset_folder, input_img_namebase, dataset_name, img_res)
         data = egodexter_handler.get_data(dataset_folder, input_img_namebase, img_res=img_res)
     return data
 
-joint_ix = 0
-for i in range(100):
-    print('--------------------------------------------------------------------------')
-    print(args.input_img_namebase)
 
-    start = time.time()
-    input_img_namebase = get_image_name(args.input_img_namebase, i, dataset_name)
-    print_time('Image reading: ', time.time() - start)
+def main():
+    args = parse_args()
+    # plotting only; imported here so the helpers above can be imported headless
+    from matplotlib import pyplot as plt
+    dataset_name = args.dataset_folder.split('/')[-2]
 
+    # load nets
     start = time.time()
-    data = get_image_as_data(args.dataset_folder, input_img_namebase, dataset_name, (320, 240))
-    img_numpy = data.data.numpy()
-    print_time('HALNet image conversion: ', time.time() - start)
+    halnet = model_io.load_model_for_inference(args.halnet_filepath,
+                                               model_class=HALNet.HALNet,
+                                               use_cuda=args.use_cuda)
+    print_time('HALNet loading: ', time.time() - start)
 
-    start = time.time()
-    output_halnet = halnet(conv.data_to_batch(data))
-    print_time('HALNet pass: ', time.time() - start)
+    joint_ix = 0
+    for i in range(100):
+        print('--------------------------------------------------------------------------')
+        print(args.input_img_namebase)
 
-    start = time.time()
-    halnet_main_out = output_halnet[3][0].data.numpy()
-    handroot_colorspace = np.unravel_index(np.argmax(halnet_main_out[joint_ix]), halnet_main_out[joint_ix].shape)
-    print('Handroot (colorspace):\t{}'.format(handroot_colorspace))
-    labels_colorspace = conv.heatmaps_to_joints_colorspace(halnet_main_out)
-    print_time('HALNet hand root localisation: ', time.time() - start)
-
-    plt.imshow(conv.numpy_to_plottable_rgb(img_numpy))
-    #plot_joints(labels_colorspace, show_legend=False)
-    heatmap = np.exp(halnet_main_out[joint_ix])
-    heatmap = heatmap.swapaxes(0, 1)
-    plt.imshow(255 * heatmap, alpha=0.6, cmap='hot')
-    plt.title(input_img_namebase)
-    plt.pause(0.01)
-    plt.clf()
-    print('--------------------------------------------------------------------------')
-
-plt.show()
\ No newline at end of file
+        start = time.time()
+        input_img_namebase = get_image_name(args.input_img_namebase, i, dataset_name)
+        print_time('Image reading: ', time.time() - start)
+
+        start = time.time()
+        data = get_image_as_data(args.dataset_folder, input_img_namebase, dataset_name, (320, 240))
+        img_numpy = data.data.numpy()
+        print_time('HALNet image conversion: ', time.time() - start)
+
+        start = time.time()
+        output_halnet = halnet(conv.data_to_batch(data))
+        print_time('HALNet pass: ', time.time() - start)
+
+        start = time.time()
+        halnet_main_out = output_halnet[3][0].data.numpy()
+        handroot_colorspace = np.unravel_index(np.argmax(halnet_main_out[joint_ix]), halnet_main_out[joint_ix].shape)
+        print('Handroot (colorspace):\t{}'.format(handroot_colorspace))
+        print_time('HALNet hand root localisation: ', time.time() - start)
+
+        plt.imshow(conv.numpy_to_plottable_rgb(img_numpy))
+        heatmap = np.exp(halnet_main_out[joint_ix])
+        heatmap = heatmap.swapaxes(0, 1)
+        plt.imshow(255 * heatmap, alpha=0.6, cmap='hot')
+        plt.title(input_img_namebase)
+        plt.pause(0.01)
+        plt.clf()
+        print('--------------------------------------------------------------------------')
+
+    plt.show()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,23 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
 import time
 import numpy as np
 import pickle
 from debugger import print_verbose
 from magic import display_est_time_loop
-from tsne import tsne
 
 HANDS2017_ROOTPATH = '/home/paulo/Downloads/'
 HANDS2017_TRAIN_FOLDER = ''
 HANDS2017_TRAIN_FILENAME = 'Training_Annotation.txt'
-HANDS_2017_TRAIN_OUTPUT_FILEPATH = 'Training_Annotation.pkl'
+HANDS_2017_TRAIN_OUTPUT_FILEBASE = 'Training_Annotation'
 HANDS_2017_TRAIN_FILEPATH = HANDS2017_ROOTPATH + HANDS2017_TRAIN_FOLDER + HANDS2017_TRAIN_FILENAME
-HANDS_2017_TRAIN_OUTPUT_FILEPATH = '/home/paulo/handschallenge/' + HANDS_2017_TRAIN_OUTPUT_FILEPATH
+HANDS_2017_TRAIN_OUTPUT_FILEBASE = '/home/paulo/handschallenge/' + HANDS_2017_TRAIN_OUTPUT_FILEBASE
+
+NUM_JOINTS = 21
+IMAGE_NAME_DTYPE = 'S32'
+CHUNK_BYTES = 32 * 2**20
 
 def training_file_line_to_numpy_array(line, num_joints):
     joint_gt = np.zeros((num_joints, 3))
@@ -34,42 +41,191 @@ def get_joints_rel_ranges(joints):
     range_z = max_z - min_z
     return range_x, range_y, range_z
 
-def load_training_annotation(filepath, verbose=False):
-    output_filepath = filepath[:-4] + '_embed.pkl'
-    image_names, joints = pickle.load(open(filepath, "rb"))
-    joints = np.array(joints)
-    joints_embed = tsne(joints.reshape((joints.shape[0], joints.shape[1] * joints.shape[2]))[0:10000, :])
-    with open(output_filepath, 'wb') as pf:
-        pickle.dump(joints_embed, pf)
+def get_output_filepaths(output_filebase):
+    return output_filebase + '_joints.npy', output_filebase + '_image_names.npy', output_filebase + '_progress.json'
+
+def _get_chunk_ranges(filepath, chunk_bytes):
+    '''
+    Splits a text file into byte ranges of about chunk_bytes that start and end at line boundaries
+    '''
+    file_size = os.path.getsize(filepath)
+    chunk_ranges = []
+    with open(filepath, 'rb') as f:
+        start_byte = 0
+        while start_byte < file_size:
+            f.seek(min(start_byte + chunk_bytes, file_size))
+            f.readline()
+            end_byte = min(f.tell(), file_size)
+            chunk_ranges.append((start_byte, end_byte))
+            start_byte = end_byte
+    return chunk_ranges
+
+def _read_chunk(filepath, start_byte, end_byte):
+    with open(filepath, 'rb') as f:
+        f.seek(start_byte)
+        return f.read(end_byte - start_byte)
+
+def _count_chunk_lines(args):
+    filepath, start_byte, end_byte = args
+    chunk = _read_chunk(filepath, start_byte, end_byte)
+    # blank lines hold no annotation
+    return sum(1 for line in chunk.splitlines() if line.strip())
+
+def _parse_chunk(args):
+    '''
+    Parses the lines of a byte range straight into the rows of the output memmaps
+    Each line is an image name followed by num_joints * 3 coordinates
+    '''
+    chunk_ix, training_filepath, output_filebase, start_byte, end_byte, start_row, num_rows, num_joints = args
+    joints_filepath, image_names_filepath, _ = get_output_filepaths(output_filebase)
+    num_fields = 1 + (num_joints * 3)
+    fields = _read_chunk(training_filepath, start_byte, end_byte).split()
+    if not len(fields) == num_rows * num_fields:
+        raise ValueError('Malformed annotation lines between bytes ' + str(start_byte) + ' and ' +
+                         str(end_byte) + ' of ' + training_filepath)
+    fields = np.array(fields).reshape((num_rows, num_fields))
+    joints = np.load(joints_filepath, mmap_mode='r+')
+    joints[start_row:start_row + num_rows] = fields[:, 1:].astype(np.float32).reshape((num_rows, num_joints, 3))
+    joints.flush()
+    image_names = np.load(image_names_filepath, mmap_mode='r+')
+    image_names[start_row:start_row + num_rows] = fields[:, 0].astype(IMAGE_NAME_DTYPE)
+    image_names.flush()
+    return chunk_ix
 
-def get_training_annotation(training_filepath, output_filepath, verbose=False):
-    guess_num_lines = 1e6
-    read_interval = 10000000
-    num_joints = 21
+def _save_progress(progress_filepath, progress):
+    with open(progress_filepath + '.tmp', 'w') as f:
+        json.dump(progress, f)
+    os.replace(progress_filepath + '.tmp', progress_filepath)
+
+def _init_progress(training_filepath, output_filebase, chunk_bytes, num_joints, pool):
+    joints_filepath, image_names_filepath, progress_filepath = get_output_filepaths(output_filebase)
+    chunk_ranges = _get_chunk_ranges(training_filepath, chunk_bytes)
+    chunks_num_rows = pool.map(_count_chunk_lines, [(training_filepath, start_byte, end_byte)
+                                                    for start_byte, end_byte in chunk_ranges])
+    chunks = []
+    start_row = 0
+    for (start_byte, end_byte), num_rows in zip(chunk_ranges, chunks_num_rows):
+        chunks.append({'start_byte': start_byte, 'end_byte': end_byte,
+                       'start_row': start_row, 'num_rows': num_rows, 'done': False})
+        start_row += num_rows
+    progress = {
+        'training_filepath': os.path.abspath(training_filepath),
+        'file_size': os.path.getsize(training_filepath),
+        'num_joints': num_joints,
+        'num_rows': start_row,
+        'chunks': chunks
+    }
+    np.lib.format.open_memmap(joints_filepath, mode='w+', dtype=np.float32,
+                              shape=(start_row, num_joints, 3)).flush()
+    np.lib.format.open_memmap(image_names_filepath, mode='w+', dtype=IMAGE_NAME_DTYPE,
+                              shape=(start_row,)).flush()
+    _save_progress(progress_filepath, progress)
+    return progress
+
+def parse_training_annotation(training_filepath, output_filebase, num_processes=None,
+                              chunk_bytes=CHUNK_BYTES, num_joints=NUM_JOINTS, verbose=False):
+    '''
+    Parses a HANDS2017 annotation file into a (N, num_joints, 3) float32 .npy memmap of joints
+    and an (N,) .npy memmap of image names
+    Byte-range chunks of the file are parsed in a process pool, each writing straight into its
+    rows of the memmaps. Finished chunks are recorded in a progress file, so an interrupted run
+    resumes from the first byte offset not yet parsed
+    :return: image names and joints, memory-mapped read-only
+    '''
+    _, _, progress_filepath = get_output_filepaths(output_filebase)
+    if num_processes is None:
+        num_processes = mp.cpu_count()
     print_verbose("Training input file path: " + training_filepath, verbose)
-    print_verbose("Testing if program can write to output: " + output_filepath, verbose)
-    with open(output_filepath, 'wb') as f:
-        pickle.dump([], f)
-    joints = []
-    image_names = []
-    with open(training_filepath, 'r') as f:
-        line = f.readline()
-        curr_line_ix = 1
+    pool = mp.Pool(processes=num_processes)
+    try:
+        progress = None
+        if os.path.isfile(progress_filepath):
+            with open(progress_filepath, 'r') as f:
+                progress = json.load(f)
+            if not progress['file_size'] == os.path.getsize(training_filepath) or \
+                    not progress['num_joints'] == num_joints:
+                print_verbose("Progress file does not match input file; parsing from the start", verbose)
+                progress = None
+        if progress is None:
+            print_verbose("Counting lines...", verbose)
+            progress = _init_progress(training_filepath, output_filebase, chunk_bytes, num_joints, pool)
+        chunks_args = [(chunk_ix, training_filepath, output_filebase, chunk['start_byte'], chunk['end_byte'],
+                        chunk['start_row'], chunk['num_rows'], num_joints)
+                       for chunk_ix, chunk in enumerate(progress['chunks']) if not chunk['done']]
+        num_chunks = len(progress['chunks'])
+        num_chunks_done = num_chunks - len(chunks_args)
+        if num_chunks_done > 0:
+            print_verbose("Resuming from " + str(num_chunks_done) + "/" + str(num_chunks) + " parsed chunks", verbose)
+        print_verbose("Output file path: " + output_filebase + " (" + str(progress['num_rows']) + " lines)", verbose)
         tot_toc = 0
-        while line:
-            start = time.time()
-            image_names.append(training_file_line_to_image_name(line))
-            joints.append(training_file_line_to_numpy_array(line, num_joints))
-            if curr_line_ix % read_interval == 0:
-                with open(output_filepath + '.pkl', 'wb') as pf:
-                    pickle.dump([image_names, joints], pf)
-            line = f.readline()
-            curr_line_ix += 1
-            tot_toc = display_est_time_loop(tot_toc + (time.time() - start), curr_line_ix,
-                                            guess_num_lines,
-                                            prefix='Line: ' + str(curr_line_ix) + ' ')
+        start = time.time()
+        for chunk_ix in pool.imap_unordered(_parse_chunk, chunks_args):
+            progress['chunks'][chunk_ix]['done'] = True
+            _save_progress(progress_filepath, progress)
+            num_chunks_done += 1
+            if verbose:
+                tot_toc = display_est_time_loop(tot_toc + (time.time() - start), num_chunks_done, num_chunks,
+                                                prefix='Chunk: ' + str(num_chunks_done) + ' ')
+                start = time.time()
+    finally:
+        pool.close()
+        pool.join()
+    return open_training_annotation(output_filebase)
+
+def open_training_annotation(output_filebase):
+    '''
+    :return: image names and joints of a parsed annotation file, memory-mapped read-only
+    '''
+    joints_filepath, image_names_filepath, _ = get_output_filepaths(output_filebase)
+    image_names = np.load(image_names_filepath, mmap_mode='r')
+    joints = np.load(joints_filepath, mmap_mode='r')
+    return image_names, joints
+
+def load_training_annotation(output_filebase, start_ix=0, num_examples=10000, verbose=False):
+    '''
+    Embeds a slice of the parsed joints with t-SNE, reading only that slice from disk
+    '''
+    from tsne import tsne
+    output_filepath = output_filebase + '_embed.pkl'
+    _, joints = open_training_annotation(output_filebase)
+    joints = np.array(joints[start_ix:start_ix + num_examples], dtype=np.float64)
+    print_verbose("Embedding " + str(joints.shape[0]) + " hands with t-SNE...", verbose)
+    joints_embed = tsne(joints.reshape((joints.shape[0], joints.shape[1] * joints.shape[2])))
     with open(output_filepath, 'wb') as pf:
-        pickle.dump([image_names, joints], pf)
+        pickle.dump(joints_embed, pf)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Parse and embed the HANDS2017 training annotation')
+    parser.add_argument('-i', dest='training_filepath', default=HANDS_2017_TRAIN_FILEPATH,
+                        help='HANDS2017 training annotation file')
+    parser.add_argument('-o', dest='output_filebase', default=HANDS_2017_TRAIN_OUTPUT_FILEBASE,
+                        help='Output file base for the parsed joints, image names and progress files')
+    parser.add_argument('--parse', dest='parse', action='store_true', default=False,
+                        help='Whether to parse the annotation file (resuming if a progress file exists)')
+    parser.add_argument('--num_processes', type=int, dest='num_processes', default=None,
+                        help='Number of parsing processes (default: number of CPUs)')
+    parser.add_argument('--chunk_mb', type=int, dest='chunk_mb', default=int(CHUNK_BYTES / 2**20),
+                        help='Size in MB of each chunk parsed at once (default ' +
+                             str(int(CHUNK_BYTES / 2**20)) + ')')
+    parser.add_argument('--embed', dest='embed', action='store_true', default=False,
+                        help='Whether to embed parsed joints with t-SNE')
+    parser.add_argument('--embed_start', type=int, dest='embed_start', default=0,
+                        help='First example to embed (default 0)')
+    parser.add_argument('--embed_num', type=int, dest='embed_num', default=10000,
+                        help='Number of examples to embed (default 10000)')
+    parser.add_argument('-v', '--verbose', dest='verbose', action='store_true', default=True,
+                        help='Verbose mode')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.parse:
+        parse_training_annotation(args.training_filepath, args.output_filebase,
+                                  num_processes=args.num_processes, chunk_bytes=args.chunk_mb * 2**20,
+                                  verbose=args.verbose)
+    if args.embed:
+        load_training_annotation(args.output_filebase, start_ix=args.embed_start,
+                                 num_examples=args.embed_num, verbose=args.verbose)
 
-#get_training_annotation(HANDS_2017_TRAIN_FILEPATH, HANDS_2017_TRAIN_OUTPUT_FILEPATH, verbose=True)
-load_training_annotation(HANDS_2017_TRAIN_OUTPUT_FILEPATH, verbose=True)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import numpy as np
+import torch
+import converter as conv
+import io_image
+import egodexter_handler
+import synthhands_handler
+
+# assumed depth (mm) of the hand root when lifting its 2D location to 3D, as in tracking_demo
+HANDROOT_DEPTH = 300.
+# handler modules with the depth camera intrinsics of each dataset
+DATASET_HANDLERS = {
+    'synthhands': synthhands_handler,
+    'egodexter': egodexter_handler,
+}
+
+
+def get_depth_intrinsics(dataset_name):
+    '''
+    :return: depth camera intrinsic matrix of a dataset and its inverse
+    '''
+    if not dataset_name in DATASET_HANDLERS:
+        raise ValueError('Dataset ' + str(dataset_name) + ' does not exist. Valid datasets are: ' +
+                         str(list(DATASET_HANDLERS.keys())))
+    handler = DATASET_HANDLERS[dataset_name]
+    return handler.DEPTH_INTR_MTX, handler.DEPTH_INTR_MTX_INV
+
+
+def get_handroots(handroots_colorspace, depth_intr_matrix_inv, handroot_depth=HANDROOT_DEPTH):
+    '''
+    Batched camera.joint_color2depth for the hand roots found by HALNet
+    The (u, v) of the heatmaps are lifted as they are, as tracking_demo always did
+    :param handroots_colorspace: (N, 2) hand root (u, v) of the HALNet heatmaps
+    :return: (N, 3) hand roots in depth camera space (mm)
+    '''
+    handroots_uv1 = np.ones((handroots_colorspace.shape[0], 3))
+    handroots_uv1[:, 0:2] = handroots_colorspace
+    return handroot_depth * np.dot(handroots_uv1, depth_intr_matrix_inv.T)
+
+
+def crop_hands(images, joints_colorspace, crop_res=(128, 128)):
+    '''
+    Crops and resizes the hand of each image, as JORNet was trained on (see io_image.crop_hand_rgbd)
+    :param images: (N, 4, U, V) RGB-D images
+    :param joints_colorspace: (N, J, 2) joints (u, v) found by HALNet
+    :return: (N, 4, crop U, crop V) float32 crops
+    '''
+    crops = np.empty((images.shape[0], 4, crop_res[0], crop_res[1]), dtype=np.float32)
+    for i in range(images.shape[0]):
+        crops[i], _ = io_image.crop_hand_rgbd(joints_colorspace[i], images[i], crop_res=crop_res)
+    return crops
+
+
+def local_to_global_joints(jornet_joints, handroots):
+    '''
+    Batched converter.jornet_local_to_global_joints
+    :param jornet_joints: (N, 60) JORNet joints, relative to the hand root
+    :param handroots: (N, 3) hand roots
+    :return: (N, 21, 3) joints in depth camera space (mm)
+    '''
+    joints_global = np.empty((handroots.shape[0], 21, 3))
+    joints_global[:, 0] = handroots
+    joints_global[:, 1:] = jornet_joints.reshape((-1, 20, 3)) + handroots[:, np.newaxis, :]
+    return joints_global
+
+
+def project_joints(joints_depth, depth_intr_matrix, img_res=(320, 240), orig_res=(640, 480)):
+    '''
+    Batched camera.joints_depth2color
+    :param joints_depth: (N, J, 3) joints in depth camera space (mm)
+    :return: (N, J, 2) joints (u, v) at img_res
+    '''
+    joints_pixel = np.dot(joints_depth, depth_intr_matrix.T)
+    joints_z = joints_pixel[:, :, 2:3]
+    joints_colorspace = np.divide(joints_pixel[:, :, 0:2], joints_z,
+                                  out=np.zeros_like(joints_pixel[:, :, 0:2]), where=joints_z != 0)
+    joints_colorspace[:, :, 0] *= img_res[0] / orig_res[0]
+    joints_colorspace[:, :, 1] *= img_res[1] / orig_res[1]
+    return joints_colorspace
+
+
+class HandTracker:
+    '''
+    Runs the HALNet -> JORNet cascade on a batch of RGB-D frames
+    halnet and jornet are inference backends (see inference_backends.load_backend)
+    depth_intr_matrix and depth_intr_matrix_inv are those of the frames' dataset (see get_depth_intrinsics)
+    '''
+    def __init__(self, halnet, jornet, depth_intr_matrix, depth_intr_matrix_inv, img_res=(320, 240),
+                 orig_res=(640, 480), crop_res=(128, 128), handroot_depth=HANDROOT_DEPTH, use_cuda=False):
+        self.halnet = halnet
+        self.jornet = jornet
+        self.img_res = img_res
+        self.orig_res = orig_res
+        self.crop_res = crop_res
+        self.depth_intr_matrix = depth_intr_matrix
+        self.depth_intr_matrix_inv = depth_intr_matrix_inv
+        self.handroot_depth = handroot_depth
+        self.use_cuda = use_cuda
+
+    def track_batch(self, images):
+        '''
+        :param images: (N, 4, U, V) RGB-D frames at img_res (numpy array or torch tensor)
+        :return: dict of batched outputs:
+            joints_colorspace: (N, 21, 2) HALNet joints (u, v)
+            handroots: (N, 3) hand roots (mm)
+            joints_3d: (N, 21, 3) JORNet joints in depth camera space (mm)
+            joints_3d_colorspace: (N, 21, 2) JORNet joints projected to (u, v)
+        '''
+        images = np.ascontiguousarray(conv._as_numpy(images))
+        batch_halnet = conv.batch_to_device_float(torch.from_numpy(images), use_cuda=self.use_cuda)
+        halnet_heatmaps = self.halnet.forward_inference(batch_halnet)
+        joints_colorspace = conv.batch_heatmaps_to_joints_colorspace(halnet_heatmaps)
+        handroots = get_handroots(joints_colorspace[:, 0], self.depth_intr_matrix_inv,
+                                  handroot_depth=self.handroot_depth)
+        crops = crop_hands(images, joints_colorspace, crop_res=self.crop_res)
+        batch_jornet = conv.batch_to_device_float(torch.from_numpy(crops), use_cuda=self.use_cuda)
+        _, jornet_joints = self.jornet.forward_inference(batch_jornet)
+        joints_3d = local_to_global_joints(conv._as_numpy(jornet_joints), handroots)
+        return {
+            'joints_colorspace': joints_colorspace,
+            'handroots': handroots,
+            'joints_3d': joints_3d,
+            'joints_3d_colorspace': project_joints(joints_3d, self.depth_intr_matrix,
+                                                   img_res=self.img_res, orig_res=self.orig_res),
+        }
+
+    def track(self, image):
+        '''
+        Tracks a single (4, U, V) frame
+        :return: dict of per-frame outputs (see track_batch)
+        '''
+        outputs = self.track_batch(conv._as_numpy(image)[np.newaxis])
+        return {output_name: output[0] for output_name, output in outputs.items()}
+
+
+def split_outputs(outputs):
+    '''
+    :return: list with the outputs of each frame of a track_batch result
+    '''
+    batch_size = next(iter(outputs.values())).shape[0]
+    return [{output_name: output[i] for output_name, output in outputs.items()} for i in range(batch_size)]
@@ -0,0 +1,107 @@
+import numpy as np
+import torch
+import torch.nn as nn
+
+BACKENDS = ['eager', 'torchscript', 'onnx']
+
+
+class InferenceWrapper(nn.Module):
+    '''
+    Exposes a network's forward_inference as forward, so it can be traced/exported
+    HALNet gives the main heatmaps; JORNet gives the main heatmaps and main joints
+    '''
+    def __init__(self, model):
+        super(InferenceWrapper, self).__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model.forward_inference(x)
+
+
+def _unpack_outputs(outputs):
+    # same return convention as forward_inference: a tensor for a single output, else a tuple
+    if len(outputs) == 1:
+        return outputs[0]
+    return tuple(outputs)
+
+
+class EagerBackend:
+    '''
+    Runs a PyTorch network eagerly, in eval mode
+    '''
+    name = 'eager'
+
+    def __init__(self, model):
+        self.model = model
+        self.model.eval()
+
+    def forward_inference(self, batch):
+        return self.model.forward_inference(batch)
+
+    def __call__(self, batch):
+        return self.forward_inference(batch)
+
+
+class TorchScriptBackend:
+    '''
+    Runs a TorchScript graph saved by exporter.export_torchscript
+    '''
+    name = 'torchscript'
+
+    def __init__(self, filepath, use_cuda=False):
+        map_location = 'cuda' if use_cuda else 'cpu'
+        self.model = torch.jit.load(filepath, map_location=map_location)
+        self.model.eval()
+
+    def forward_inference(self, batch):
+        with torch.no_grad():
+            return self.model(batch)
+
+    def __call__(self, batch):
+        return self.forward_inference(batch)
+
+
+class ONNXRuntimeBackend:
+    '''
+    Runs an ONNX graph saved by exporter.export_onnx on ONNX Runtime's CPU provider
+    Takes and returns torch tensors, like the other backends
+    '''
+    name = 'onnx'
+
+    def __init__(self, filepath, num_threads=0):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError('The onnx backend needs onnxruntime (pip install onnxruntime)')
+        session_options = onnxruntime.SessionOptions()
+        if num_threads > 0:
+            session_options.intra_op_num_threads = num_threads
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(filepath, sess_options=session_options,
+                                                    providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def forward_inference(self, batch):
+        batch = np.ascontiguousarray(batch.detach().cpu().numpy(), dtype=np.float32)
+        outputs = self.session.run(None, {self.input_name: batch})
+        return _unpack_outputs([torch.from_numpy(output) for output in outputs])
+
+    def __call__(self, batch):
+        return self.forward_inference(batch)
+
+
+def load_backend(backend_name, filepath, model_class=None, use_cuda=False, num_threads=0):
+    '''
+    :param backend_name: one of BACKENDS
+    :param filepath: training or inference checkpoint (eager), TorchScript file (torchscript) or ONNX file (onnx)
+    :param model_class: network class of the checkpoint, needed for training checkpoints with the eager backend
+    :return: backend with a forward_inference(batch) method
+    '''
+    if backend_name == 'eager':
+        import model_io
+        return EagerBackend(model_io.load_model_for_inference(filepath, model_class=model_class, use_cuda=use_cuda))
+    if backend_name == 'torchscript':
+        return TorchScriptBackend(filepath, use_cuda=use_cuda)
+    if backend_name == 'onnx':
+        return ONNXRuntimeBackend(filepath, num_threads=num_threads)
+    raise ValueError('Backend ' + str(backend_name) + ' does not exist. Valid backends are: ' + str(BACKENDS))
@@ -0,0 +1,305 @@
+import argparse
+import io
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import numpy as np
+import torch
+import benchmarker
+import hand_tracker
+import inference_backends
+import HALNet, JORNet
+
+
+class ServerBusy(Exception):
+    pass
+
+
+def encode_frame(image):
+    '''
+    :param image: (4, U, V) RGB-D frame
+    :return: frame as .npy bytes (the request body of /track)
+    '''
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(image), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def decode_frame(frame_bytes):
+    return np.load(io.BytesIO(frame_bytes), allow_pickle=False)
+
+
+class TrackRequest:
+    def __init__(self, image):
+        self.image = image
+        self.arrival_time = time.perf_counter()
+        self.done = threading.Event()
+        self.outputs = None
+        self.error = None
+
+
+class DynamicBatcher:
+    '''
+    Queues frames from many clients and runs the HALNet -> JORNet cascade on dynamic batches
+    A batch is run as soon as it has max_batch_size frames, or max_wait_ms after its first
+    frame arrived, whichever comes first
+    The queue is bounded: when it is full, new frames are rejected (backpressure)
+    '''
+    def __init__(self, tracker, max_batch_size=8, max_wait_ms=5., max_queue_size=64):
+        self.tracker = tracker
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.latency_hist = benchmarker.LatencyHistogram()
+        self.queue_wait_hist = benchmarker.LatencyHistogram()
+        self.batch_hist = benchmarker.LatencyHistogram()
+        self.batch_size_counts = np.zeros(max_batch_size + 1, dtype=np.int64)
+        self.num_rejected = 0
+        self.num_errors = 0
+        self.start_time = time.time()
+        self.stats_lock = threading.Lock()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, image):
+        request = TrackRequest(image)
+        try:
+            self.queue.put_nowait(request)
+        except queue.Full:
+            with self.stats_lock:
+                self.num_rejected += 1
+            raise ServerBusy('Inference queue is full (' + str(self.queue.maxsize) + ' frames)')
+        return request
+
+    def track(self, image, timeout=None):
+        '''
+        Queues a frame and waits for its outputs
+        :return: dict of per-frame outputs (see hand_tracker.HandTracker.track_batch)
+        '''
+        request = self.submit(image)
+        if not request.done.wait(timeout):
+            raise TimeoutError('Timed out waiting for the inference of a frame')
+        if request.error is not None:
+            raise request.error
+        return request.outputs
+
+    def _get_batch(self):
+        try:
+            batch = [self.queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self.stopped:
+            batch = self._get_batch()
+            if len(batch) == 0:
+                continue
+            batch_start = time.perf_counter()
+            try:
+                outputs = self.tracker.track_batch(np.stack([request.image for request in batch]))
+                frames_outputs = hand_tracker.split_outputs(outputs)
+            except Exception as e:
+                with self.stats_lock:
+                    self.num_errors += len(batch)
+                for request in batch:
+                    request.error = e
+                    request.done.set()
+                continue
+            batch_end = time.perf_counter()
+            self.batch_hist.add((batch_end - batch_start) * 1000)
+            with self.stats_lock:
+                self.batch_size_counts[len(batch)] += 1
+            for request, frame_outputs in zip(batch, frames_outputs):
+                self.queue_wait_hist.add((batch_start - request.arrival_time) * 1000)
+                self.latency_hist.add((batch_end - request.arrival_time) * 1000)
+                request.outputs = frame_outputs
+                request.done.set()
+
+    def stop(self):
+        self.stopped = True
+        self.thread.join()
+
+    def get_stats(self):
+        with self.stats_lock:
+            batch_size_counts = self.batch_size_counts.copy()
+            num_rejected = self.num_rejected
+            num_errors = self.num_errors
+        num_frames = int(np.dot(np.arange(len(batch_size_counts)), batch_size_counts))
+        num_batches = int(batch_size_counts.sum())
+        elapsed_time = time.time() - self.start_time
+        return {
+            'num_frames': num_frames,
+            'num_batches': num_batches,
+            'num_rejected': num_rejected,
+            'num_errors': num_errors,
+            'queue_size': self.queue.qsize(),
+            'uptime_s': elapsed_time,
+            'throughput_fps': num_frames / elapsed_time,
+            'mean_batch_size': num_frames / num_batches if num_batches > 0 else 0.,
+            'batch_sizes': {str(batch_size): int(count)
+                            for batch_size, count in enumerate(batch_size_counts) if count > 0},
+            'latency': self.latency_hist.to_dict(),
+            'queue_wait': self.queue_wait_hist.to_dict(),
+            'batch_compute': self.batch_hist.to_dict(),
+        }
+
+
+def outputs_to_json(outputs):
+    return {output_name: output.tolist() for output_name, output in outputs.items()}
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    '''
+    POST /track  body: one (4, U, V) frame as .npy bytes; returns the joints as JSON
+    GET /stats   returns throughput, batch size and latency histograms as JSON
+    GET /health
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def _send_json(self, status, response, headers=None):
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for header_name, header_value in (headers or {}).items():
+            self.send_header(header_name, header_value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._send_json(200, self.server.batcher.get_stats())
+        elif self.path == '/health':
+            self._send_json(200, {'status': 'ok', 'dataset': self.server.dataset_name})
+        else:
+            self._send_json(404, {'error': 'Unknown path ' + self.path})
+
+    def do_POST(self):
+        frame_bytes = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path == '/track':
+            self._send_json(404, {'error': 'Unknown path ' + self.path})
+            return
+        try:
+            image = decode_frame(frame_bytes)
+        except ValueError as e:
+            self._send_json(400, {'error': 'Could not decode frame: ' + str(e)})
+            return
+        if not image.shape == self.server.frame_shape:
+            self._send_json(400, {'error': 'Frame shape ' + str(image.shape) + ' is not ' +
+                                           str(self.server.frame_shape)})
+            return
+        start = time.perf_counter()
+        try:
+            outputs = self.server.batcher.track(image, timeout=self.server.request_timeout)
+        except ServerBusy as e:
+            self._send_json(503, {'error': str(e)}, headers={'Retry-After': '1'})
+            return
+        except TimeoutError as e:
+            self._send_json(504, {'error': str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+        response = outputs_to_json(outputs)
+        response['server_latency_ms'] = (time.perf_counter() - start) * 1000
+        self._send_json(200, response)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class InferenceServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, server_address, batcher, frame_shape, dataset_name='', request_timeout=30., verbose=False):
+        '''
+        :param dataset_name: dataset whose camera the tracker assumes, reported by GET /health
+        '''
+        HTTPServer.__init__(self, server_address, InferenceRequestHandler)
+        self.batcher = batcher
+        self.frame_shape = tuple(frame_shape)
+        self.dataset_name = dataset_name
+        self.request_timeout = request_timeout
+        self.verbose = verbose
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Local HTTP inference server running the HALNet -> JORNet '
+                                                 'cascade on dynamic batches of frames from many clients')
+    parser.add_argument('--halnet', dest='halnet_filepath', type=str, required=True,
+                        help='Filepath to trained HALNet checkpoint (or exported file, see --backend)')
+    parser.add_argument('--jornet', dest='jornet_filepath', type=str, required=True,
+                        help='Filepath to trained JORNet checkpoint (or exported file, see --backend)')
+    parser.add_argument('--dataset', dest='dataset_name', required=True,
+                        choices=list(hand_tracker.DATASET_HANDLERS.keys()),
+                        help='Dataset of the frames to track; its depth camera intrinsics lift the hand roots '
+                             'and project the joints')
+    parser.add_argument('--backend', dest='backend', default='eager', choices=inference_backends.BACKENDS,
+                        help='Inference backend (default eager)')
+    parser.add_argument('--cuda', dest='use_cuda', action='store_true', default=False,
+                        help='Whether to use cuda')
+    parser.add_argument('--host', dest='host', default='127.0.0.1',
+                        help='Host to listen on (default 127.0.0.1)')
+    parser.add_argument('--port', dest='port', type=int, default=8000,
+                        help='Port to listen on (default 8000)')
+    parser.add_argument('--max_batch_size', dest='max_batch_size', type=int, default=8,
+                        help='Maximum number of frames per batch (default 8)')
+    parser.add_argument('--max_wait_ms', dest='max_wait_ms', type=float, default=5.,
+                        help='Maximum time a batch waits for more frames after its first one (default 5 ms)')
+    parser.add_argument('--max_queue_size', dest='max_queue_size', type=int, default=64,
+                        help='Maximum number of queued frames; beyond it requests get 503 (default 64)')
+    parser.add_argument('--num_threads', dest='num_threads', type=int, default=0,
+                        help='Number of torch CPU threads (default 0: torch default)')
+    parser.add_argument('-v', '--verbose', dest='verbose', action='store_true', default=False,
+                        help='Whether to log every request')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.num_threads > 0:
+        torch.set_num_threads(args.num_threads)
+    print('Loading HALNet from: ' + args.halnet_filepath)
+    halnet = inference_backends.load_backend(args.backend, args.halnet_filepath,
+                                             model_class=HALNet.HALNet, use_cuda=args.use_cuda)
+    print('Loading JORNet from: ' + args.jornet_filepath)
+    jornet = inference_backends.load_backend(args.backend, args.jornet_filepath,
+                                             model_class=JORNet.JORNet, use_cuda=args.use_cuda)
+    depth_intr_matrix, depth_intr_matrix_inv = hand_tracker.get_depth_intrinsics(args.dataset_name)
+    tracker = hand_tracker.HandTracker(halnet, jornet, depth_intr_matrix, depth_intr_matrix_inv,
+                                       use_cuda=args.use_cuda)
+    frame_shape = (4,) + tuple(tracker.img_res)
+    # warm up, so the first clients do not pay for lazy initialisation
+    tracker.track_batch(np.zeros((1,) + frame_shape, dtype=np.uint8))
+    batcher = DynamicBatcher(tracker, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+                             max_queue_size=args.max_queue_size)
+    server = InferenceServer((args.host, args.port), batcher, frame_shape, dataset_name=args.dataset_name,
+                             verbose=args.verbose)
+    print('Serving on http://' + args.host + ':' + str(args.port) + ' (POST /track, GET /stats)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.stop()
+        print(json.dumps(batcher.get_stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,51 @@
-from scipy import misc
 import numpy as np
 import converter as conv
 
 
 def change_res_image(image, new_res):
+    from scipy import misc
     image = misc.imresize(image, new_res)
     return image
 
 
 def read_RGB_image(image_filepath, new_res=None):
+    # scipy is only needed to decode images; imported here to keep this module light to import
+    from scipy import misc
     image = misc.imread(image_filepath)
     image = image.swapaxes(0, 1)
     if new_res:
         image = change_res_image(image, new_res)
     return image
 
+def write_RGB_image(image_filepath, image):
+    '''
+    Inverse of read_RGB_image: writes a (U, V, 3) color or (U, V) grayscale image
+    '''
+    from scipy import misc
+    misc.imsave(image_filepath, np.asarray(image).swapaxes(0, 1))
+
+def read_RGBD_image(color_filepath, depth_filepath, new_res=None, out=None):
+    '''
+    Decodes a color and a depth image straight into one channel-first RGB-D array
+    Each decoded image is written once into the (4, U, V) output, so no
+    intermediate concatenated or non-contiguous copy is created
+    :param color_filepath: path to the color (on depth) image
+    :param depth_filepath: path to the depth image
+    :param new_res: optional (U, V) resolution to resize both images to
+    :param out: optional preallocated contiguous (4, U, V) array to decode into
+    :return: contiguous (4, U, V) array (uint8 when resized)
+    '''
+    color_image = read_RGB_image(color_filepath, new_res=new_res)
+    depth_image = read_RGB_image(depth_filepath, new_res=new_res)
+    if len(depth_image.shape) == 3:
+        depth_image = depth_image[:, :, 0]
+    if out is None:
+        out = np.empty((4, color_image.shape[0], color_image.shape[1]),
+                       dtype=np.result_type(color_image.dtype, depth_image.dtype))
+    out[0:3] = color_image.transpose((2, 0, 1))
+    out[3] = depth_image
+    return out
+
 def get_labels_cropped_heatmaps(labels_colorspace, joint_ixs, crop_coords, heatmap_res):
     res_transf_u = (heatmap_res[0] / (crop_coords[2] - crop_coords[0]))
     res_transf_v = (heatmap_res[1] / (crop_coords[3] - crop_coords[1]))
@@ -52,16 +83,14 @@ def crop_hand_rgbd(joints_uv, image_rgbd, crop_res):
     crop_coords = get_crop_coords(joints_uv, image_rgbd)
     # crop hand
     crop = image_rgbd[:, crop_coords[0]:crop_coords[2], crop_coords[1]:crop_coords[3]]
-    crop = crop.swapaxes(0, 1)
-    crop = crop.swapaxes(1, 2)
+    crop = crop.transpose((1, 2, 0))
     crop_rgb = change_res_image(crop[:, :, 0:3], crop_res)
     crop_depth = change_res_image(crop[:, :, 3], crop_res)
+    # write resized crop straight into a contiguous channel-first array
+    crop_rgbd = np.empty((4, crop_res[0], crop_res[1]), dtype=np.float32)
+    crop_rgbd[0:3] = crop_rgb.transpose((2, 0, 1))
     # normalize depth
-    crop_depth = np.divide(crop_depth, np.max(crop_depth))
-    crop_depth = crop_depth.reshape(crop_depth.shape[0], crop_depth.shape[1], 1)
-    crop_rgbd = np.append(crop_rgb, crop_depth, axis=2)
-    crop_rgbd = crop_rgbd.swapaxes(1, 2)
-    crop_rgbd = crop_rgbd.swapaxes(0, 1)
+    crop_rgbd[3] = np.divide(crop_depth, np.max(crop_depth))
     return crop_rgbd, crop_coords
 
 def crop_image_get_labels(data, labels_colorspace, joint_ixs=range(21), crop_res=(128, 128)):
@@ -1,73 +1,162 @@
-import synthhands_handler
-from scipy.spatial.distance import pdist, squareform
+import argparse
+import multiprocessing as mp
 import numpy as np
-import pickle
-from matplotlib import pyplot as plt
+from dataset_handler import load_dataset_split
+from synthhands_handler import _read_label
 
-root_folder = '/home/paulo/rds_muri/paulo/synthhands/SynthHands_Release/'
+NUM_JOINTS = 21
+NUM_JOINT_PAIRS = int(NUM_JOINTS * (NUM_JOINTS - 1) / 2)
+MAX_DIST_SPAN = 300  # in mm
+JOINT_PRIOR_FILENAME = 'joint_prior.npz'
 
-load = True
+# joint pairs in condensed (pdist) order: (0,1), (0,2), ..., (19,20)
+JOINT_PAIRS_I, JOINT_PAIRS_J = np.triu_indices(NUM_JOINTS, k=1)
 
-if load:
-    joint_prior = pickle.load(open("joint_prior.p", "rb"))
-    plt.imshow(joint_prior['pair_dist_prob'].astype(int), cmap='viridis', interpolation='nearest')
-    plt.yticks(np.arange(0, 210, 10.0))
-    plt.xticks(np.arange(0, 300, 10.0))
+
+def get_joint_pair_dists(joints):
+    '''
+    Condensed pairwise joint distances for a batch of hands, same order as scipy's pdist
+    :param joints: N x NUM_JOINTS x 3 numpy array
+    :return: N x NUM_JOINT_PAIRS numpy array
+    '''
+    joints = np.asarray(joints, dtype=np.float64).reshape((-1, NUM_JOINTS, 3))
+    pair_diffs = joints[:, JOINT_PAIRS_I, :] - joints[:, JOINT_PAIRS_J, :]
+    return np.sqrt(np.einsum('npk,npk->np', pair_diffs, pair_diffs))
+
+
+def get_joint_pair_dist_bins(pair_dists, max_dist_span=MAX_DIST_SPAN):
+    '''
+    1mm bin of each pair distance; distances beyond max_dist_span go to the last bin
+    :param pair_dists: N x NUM_JOINT_PAIRS numpy array
+    :return: N x NUM_JOINT_PAIRS int64 numpy array
+    '''
+    return np.clip(pair_dists.astype(np.int64), 0, max_dist_span - 1)
+
+
+def count_joint_pair_dists(pair_dists, max_dist_span=MAX_DIST_SPAN):
+    '''
+    Histogram of pair distances, one row per joint pair
+    :param pair_dists: N x NUM_JOINT_PAIRS numpy array
+    :return: NUM_JOINT_PAIRS x max_dist_span int64 numpy array of counts
+    '''
+    dist_bins = get_joint_pair_dist_bins(pair_dists, max_dist_span)
+    flat_bins = dist_bins + (np.arange(dist_bins.shape[1]) * max_dist_span)
+    counts = np.bincount(flat_bins.ravel(), minlength=dist_bins.shape[1] * max_dist_span)
+    return counts.reshape((dist_bins.shape[1], max_dist_span))
+
+
+def read_joints(root_folder, filenamebases, label_suffix='_joint_pos.txt'):
+    '''
+    Reads only the joint labels (no images) of a list of dataset examples
+    :return: len(filenamebases) x NUM_JOINTS x 3 numpy array
+    '''
+    joints = np.zeros((len(filenamebases), NUM_JOINTS, 3))
+    for i, filenamebase in enumerate(filenamebases):
+        joints[i] = _read_label(root_folder + filenamebase + label_suffix, num_joints=NUM_JOINTS)
+    return joints
+
+
+def _build_chunk_prior(args):
+    root_folder, filenamebases, max_dist_span = args
+    pair_dists = get_joint_pair_dists(read_joints(root_folder, filenamebases))
+    return count_joint_pair_dists(pair_dists, max_dist_span), \
+           pair_dists.min(), pair_dists.max(), len(filenamebases)
+
+
+def build_joint_prior(root_folder, filenamebases, max_dist_span=MAX_DIST_SPAN,
+                      chunk_size=2000, num_processes=None, verbose=False):
+    '''
+    Builds the joint-pair distance histogram of a dataset
+    Chunks of examples are read and binned in a process pool and their counts summed
+    :return: dict with pair_dist_count, min_dist, max_dist and num_examples
+    '''
+    chunks = [(root_folder, filenamebases[i:i + chunk_size], max_dist_span)
+              for i in range(0, len(filenamebases), chunk_size)]
+    joint_prior = {
+        'pair_dist_count': np.zeros((NUM_JOINT_PAIRS, max_dist_span), dtype=np.int64),
+        'min_dist': 1e10,
+        'max_dist': -1,
+        'num_examples': 0
+    }
+    if num_processes is None:
+        num_processes = mp.cpu_count()
+    if num_processes > 1 and len(chunks) > 1:
+        pool = mp.Pool(processes=min(num_processes, len(chunks)))
+        chunk_priors = pool.imap_unordered(_build_chunk_prior, chunks)
+    else:
+        pool = None
+        chunk_priors = map(_build_chunk_prior, chunks)
+    try:
+        for chunk_count, chunk_min_dist, chunk_max_dist, chunk_num_examples in chunk_priors:
+            joint_prior['pair_dist_count'] += chunk_count
+            joint_prior['min_dist'] = min(joint_prior['min_dist'], chunk_min_dist)
+            joint_prior['max_dist'] = max(joint_prior['max_dist'], chunk_max_dist)
+            joint_prior['num_examples'] += chunk_num_examples
+            if verbose:
+                print("\rBinned examples: " + str(joint_prior['num_examples']) + '/' +
+                      str(len(filenamebases)), end='')
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if verbose:
+        print('')
+    return joint_prior
+
+
+def save_joint_prior(filepath, joint_prior):
+    np.savez_compressed(filepath,
+                        pair_dist_count=joint_prior['pair_dist_count'].astype(np.uint32),
+                        min_dist=joint_prior['min_dist'],
+                        max_dist=joint_prior['max_dist'],
+                        num_examples=joint_prior['num_examples'])
+
+
+def plot_joint_prior(pair_dist_count):
+    from matplotlib import pyplot as plt
+    plt.imshow(pair_dist_count.astype(int), cmap='viridis', interpolation='nearest')
+    plt.yticks(np.arange(0, NUM_JOINT_PAIRS, 10.0))
+    plt.xticks(np.arange(0, pair_dist_count.shape[1], 10.0))
     plt.show()
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='Build the joint-pair distance prior of a SynthHands dataset')
+    parser.add_argument('-r', dest='root_folder', default='', required=True, help='Root folder for dataset')
+    parser.add_argument('--split_filename', dest='split_filename', default='dataset_split_files.p',
+                        help='Split filename for the file with dataset splits (default dataset_split_files.p)')
+    parser.add_argument('-o', dest='output_filepath', default='',
+                        help='Output file for the prior (default ' + JOINT_PRIOR_FILENAME + ' in the root folder)')
+    parser.add_argument('--max_dist_span', type=int, dest='max_dist_span', default=MAX_DIST_SPAN,
+                        help='Number of 1mm distance bins (default ' + str(MAX_DIST_SPAN) + ')')
+    parser.add_argument('--chunk_size', type=int, dest='chunk_size', default=2000,
+                        help='Number of examples binned at once by each process (default 2000)')
+    parser.add_argument('--num_processes', type=int, dest='num_processes', default=None,
+                        help='Number of processes (default: number of CPUs)')
+    parser.add_argument('--plot', dest='plot', action='store_true', default=False,
+                        help='Whether to plot the prior after building it')
+    parser.add_argument('-v', '--verbose', dest='verbose', action='store_true', default=True,
+                        help='Verbose mode')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.output_filepath == '':
+        args.output_filepath = args.root_folder + JOINT_PRIOR_FILENAME
+    dataset_split_files = load_dataset_split(root_folder=args.root_folder, splitfilename=args.split_filename)
+    filenamebases = list(dataset_split_files['filenamebases'])
+    joint_prior = build_joint_prior(args.root_folder, filenamebases, max_dist_span=args.max_dist_span,
+                                    chunk_size=args.chunk_size, num_processes=args.num_processes,
+                                    verbose=args.verbose)
+    if args.verbose:
+        print("Max dist: " + str(joint_prior['max_dist']))
+        print("Min dist: " + str(joint_prior['min_dist']))
+        print("Saving joint prior: " + args.output_filepath)
+    save_joint_prior(args.output_filepath, joint_prior)
+    if args.plot:
+        plot_joint_prior(joint_prior['pair_dist_count'])
 
-full_loader = synthhands_handler.get_SynthHands_fullloader(root_folder=root_folder,
-                                                           joint_ixs=range(21),
-                                                           heatmap_res=(640, 480),
-                                                           batch_size=1,
-                                                           verbose=True)
-
-min_dist = 1e10
-max_dist = -1
-len_dataset = len(full_loader)
-max_dist_span = 300  # in mm
-
-pair_dist_prob = np.zeros((210, max_dist_span))
-for batch_idx, (data, target) in enumerate(full_loader):
-    filenamebase = full_loader.dataset.get_filenamebase(batch_idx)
-    _, target_joints, target_roothand = target
-    target_joints, target_roothand = target_joints.data.numpy(), target_roothand.data.numpy()
-    D = squareform(pdist(target_joints.reshape((21, 3))))
-    ix_pair = 0
-    for i in range(D.shape[0]):
-        j = i + 1
-        while j < D.shape[1]:
-            # print('(' + str(i) + ', ' + str(j) + '): ' + str(D[i, j]))
-            dist = D[i, j]
-            pair_dist_prob[ix_pair, int(dist)] += 1
-            if dist > max_dist:
-                max_dist = dist
-            if dist < min_dist:
-                min_dist = dist
-            j += 1
-            ix_pair += 1
-    print(filenamebase + ': ' + str(batch_idx) + '/' + str(len_dataset))
-    print(filenamebase + ': ' + 'Max dist: ' + str(max_dist))
-    print(filenamebase + ': ' + 'Min dist: ' + str(min_dist))
-    if batch_idx % 500 == 0:
-        print("Saving checkpoint...")
-        data = {
-            'min_dist': min_dist,
-            'max_dist': max_dist,
-            'pair_dist_prob': pair_dist_prob,
-            'batch_idx': batch_idx
-        }
-        with open('joint_prior.p', 'wb') as handle:
-            pickle.dump(data, handle, protocol=pickle.HIGHEST_PROTOCOL)
-
-print("Saving final checkpoint...")
-data = {
-    'min_dist': min_dist,
-    'max_dist': max_dist,
-    'pair_dist_prob': pair_dist_prob,
-    'batch_idx': batch_idx
-}
-with open('joint_prior.p', 'wb') as handle:
-    pickle.dump(data, handle, protocol=pickle.HIGHEST_PROTOCOL)
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+import argparse
+import json
+import time
+import warnings
+import torch
+import torch.nn as nn
+import benchmarker
+import benchmark_checkpointing
+
+# estimated floating point operations per output element of layers without multiply-accumulates
+ELEMENTWISE_FLOPS = {
+    nn.BatchNorm2d: 2,
+    nn.ReLU: 1,
+    nn.Upsample: 8,
+    nn.Softmax: 3,
+}
+SORT_KEYS = ['total_ms', 'fwd_ms', 'bwd_ms', 'flops', 'activation_bytes', 'param_bytes']
+
+
+def get_layer_flops(module, output):
+    '''
+    :return: estimated floating point operations of a forward pass of a layer producing output
+        (2 per multiply-accumulate of convolutions and linear layers)
+    '''
+    macs = benchmarker.get_layer_macs(module, output)
+    if macs > 0:
+        return 2 * macs
+    if isinstance(module, nn.MaxPool2d):
+        kernel_size = module.kernel_size if isinstance(module.kernel_size, tuple) else \
+            (module.kernel_size, module.kernel_size)
+        return output.numel() * kernel_size[0] * kernel_size[1]
+    for module_class, flops_per_element in ELEMENTWISE_FLOPS.items():
+        if isinstance(module, module_class):
+            return output.numel() * flops_per_element
+    # the log-softmax of HALNet.SoftmaxLogProbability2D
+    if type(module).__name__ == 'SoftmaxLogProbability2D':
+        return output.numel() * 3
+    return 0
+
+
+def get_tensors_bytes(tensors):
+    if isinstance(tensors, torch.Tensor):
+        return tensors.numel() * tensors.element_size()
+    if isinstance(tensors, (tuple, list)):
+        return sum(get_tensors_bytes(tensor) for tensor in tensors)
+    return 0
+
+
+class LayerProfiler:
+    '''
+    Forward and backward hooks on every named submodule of a model (and on the model itself),
+    accumulating per module: calls, forward and backward wall time, estimated FLOPs and bytes of
+    the activations it outputs
+    Times of a module include its submodules' (and the hooks' overhead, which weighs on small layers)
+    Use as a context manager, or attach and detach, running backward passes through the profiler:
+        with LayerProfiler(model) as profiler:
+            loss = model(batch)...
+            profiler.backward(loss)
+        profiler.print_stats()
+    '''
+    def __init__(self, model, use_cuda=False):
+        '''
+        :param use_cuda: whether to wait for queued cuda work in the hooks, so they time the work
+        '''
+        self.model = model
+        self.use_cuda = use_cuda
+        self.modules = [('(model)', model)] + [(name, module) for name, module in model.named_modules()
+                                               if not name == '']
+        self.handles = []
+        self.reset()
+
+    def reset(self):
+        self.stats = {name: {'calls': 0, 'fwd_s': 0., 'bwd_s': 0., 'flops': 0, 'activation_bytes': 0}
+                      for name, _ in self.modules}
+        self.fwd_starts = {name: [] for name, _ in self.modules}
+        self.bwd_starts = {name: [] for name, _ in self.modules}
+        # backward passes of modules whose inputs need no gradient (e.g. the first layer): their hook
+        # fires before their weight gradients are computed, so they end with the whole backward pass
+        self.pending_bwd_starts = []
+
+    def _sync(self):
+        if self.use_cuda:
+            torch.cuda.synchronize()
+
+    def _get_hooks(self, name):
+        def forward_pre_hook(module, inputs):
+            self._sync()
+            self.fwd_starts[name].append(time.perf_counter())
+
+        def forward_hook(module, inputs, output):
+            self._sync()
+            module_stats = self.stats[name]
+            module_stats['fwd_s'] += time.perf_counter() - self.fwd_starts[name].pop()
+            module_stats['calls'] += 1
+            module_stats['activation_bytes'] += get_tensors_bytes(output)
+            if isinstance(output, torch.Tensor):
+                module_stats['flops'] += get_layer_flops(module, output)
+
+        def backward_pre_hook(module, grad_output):
+            self._sync()
+            self.bwd_starts[name].append(time.perf_counter())
+
+        def backward_hook(module, grad_input, grad_output):
+            self._sync()
+            if len(self.bwd_starts[name]) == 0:
+                return
+            start = self.bwd_starts[name].pop()
+            if all(grad is None for grad in grad_input):
+                self.pending_bwd_starts.append((name, start))
+            else:
+                self.stats[name]['bwd_s'] += time.perf_counter() - start
+
+        return forward_pre_hook, forward_hook, backward_pre_hook, backward_hook
+
+    def attach(self):
+        for name, module in self.modules:
+            forward_pre_hook, forward_hook, backward_pre_hook, backward_hook = self._get_hooks(name)
+            self.handles.append(module.register_forward_pre_hook(forward_pre_hook))
+            self.handles.append(module.register_forward_hook(forward_hook))
+            if module is self.model:
+                # the model's backward pass is timed by backward
+                continue
+            self.handles.append(module.register_full_backward_pre_hook(backward_pre_hook))
+            self.handles.append(module.register_full_backward_hook(backward_hook))
+        return self
+
+    def backward(self, loss):
+        '''
+        Runs and times the backward pass of loss
+        '''
+        self._sync()
+        start = time.perf_counter()
+        with warnings.catch_warnings():
+            # the hooks of modules whose inputs need no gradient are expected to fire early
+            warnings.filterwarnings('ignore', message='Full backward hook is firing')
+            loss.backward()
+        self._sync()
+        end = time.perf_counter()
+        self.stats['(model)']['bwd_s'] += end - start
+        for name, module_start in self.pending_bwd_starts:
+            self.stats[name]['bwd_s'] += end - module_start
+        self.pending_bwd_starts = []
+
+    def detach(self):
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+
+    def __enter__(self):
+        return self.attach()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.detach()
+
+    def get_stats(self):
+        '''
+        :return: list of dicts, one per module, of its calls, depth in the module tree and, per forward
+            pass of the model: forward, backward and total ms, FLOPs, activation bytes, and its parameter
+            bytes and share of the model's total time
+        '''
+        num_passes = max(self.stats['(model)']['calls'], 1)
+        model_total_s = self.stats['(model)']['fwd_s'] + self.stats['(model)']['bwd_s']
+        rows = []
+        for name, module in self.modules:
+            module_stats = self.stats[name]
+            if name == '(model)':
+                # flops of the model are those of its layers
+                flops = sum(self.stats[other_name]['flops'] for other_name, other_module in self.modules
+                            if not other_name == '(model)' and len(list(other_module.children())) == 0)
+            else:
+                flops = sum(self.stats[other_name]['flops'] for other_name, _ in self.modules
+                            if other_name == name or other_name.startswith(name + '.'))
+            total_s = module_stats['fwd_s'] + module_stats['bwd_s']
+            rows.append({
+                'name': name,
+                'type': type(module).__name__,
+                'depth': 0 if name == '(model)' else name.count('.') + 1,
+                'calls': module_stats['calls'],
+                'fwd_ms': module_stats['fwd_s'] * 1000. / num_passes,
+                'bwd_ms': module_stats['bwd_s'] * 1000. / num_passes,
+                'total_ms': total_s * 1000. / num_passes,
+                'share': total_s / model_total_s if model_total_s > 0 else 0.,
+                'flops': flops // num_passes,
+                'activation_bytes': module_stats['activation_bytes'] // num_passes,
+                'param_bytes': sum(param.numel() * param.element_size() for param in module.parameters()),
+            })
+        return rows
+
+    def format_stats(self, max_depth=1, sort_key='total_ms'):
+        '''
+        :param max_depth: deepest level of submodules shown (0 for all)
+        '''
+        rows = [row for row in self.get_stats() if max_depth == 0 or row['depth'] <= max_depth]
+        rows.sort(key=lambda row: row[sort_key], reverse=True)
+        for row in rows:
+            row['gflops'] = row['flops'] / 1e9
+            row['activation_mb'] = row['activation_bytes'] / 2**20
+            row['param_mb'] = row['param_bytes'] / 2**20
+        return benchmarker.format_table(rows, ['name', 'type', 'calls', 'fwd_ms', 'bwd_ms', 'total_ms', 'share',
+                                               'gflops', 'activation_mb', 'param_mb'])
+
+    def print_stats(self, max_depth=1, sort_key='total_ms'):
+        print(self.format_stats(max_depth=max_depth, sort_key=sort_key))
+
+    def write_json(self, filepath, info=None):
+        '''
+        :param info: dict of what was profiled (model, batch size...), written along the modules
+        '''
+        with open(filepath, 'w') as f:
+            json.dump({'info': {} if info is None else info, 'modules': self.get_stats()}, f, indent=2)
+
+
+def profile_model(model_name, batch_size=1, num_iter=3, num_warmup=1, train=True, cross_entropy=False,
+                  use_cuda=False):
+    '''
+    Profiles forward (and backward, when train) passes of synthetic input through a network
+    :return: the LayerProfiler, with the stats of the timed iterations
+    '''
+    model, input_shape = benchmark_checkpointing.build_model(model_name, [], use_cuda=use_cuda,
+                                                             cross_entropy=cross_entropy)
+    if train:
+        model.train()
+    else:
+        model.eval()
+    batch = torch.rand((batch_size,) + input_shape)
+    if use_cuda:
+        batch = batch.cuda()
+
+    def step():
+        if train:
+            model.zero_grad()
+            outputs = model(batch)
+            # stands in for the training losses: every head contributes to the gradient
+            loss = sum((output ** 2).mean() for output in outputs)
+            profiler.backward(loss)
+        else:
+            with torch.no_grad():
+                model(batch)
+
+    profiler = LayerProfiler(model, use_cuda=use_cuda)
+    with profiler:
+        for _ in range(num_warmup):
+            step()
+        profiler.reset()
+        for _ in range(num_iter):
+            step()
+    return profiler
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Time, FLOPs and memory per layer of HALNet/JORNet, '
+                                                 'on synthetic input (no dataset needed)')
+    parser.add_argument('--model', dest='model_name', default='halnet',
+                        choices=list(benchmark_checkpointing.MODELS.keys()),
+                        help='Network to profile (default halnet)')
+    parser.add_argument('--batch_size', dest='batch_size', type=int, default=1,
+                        help='Batch size (default 1)')
+    parser.add_argument('--num_iter', dest='num_iter', type=int, default=3,
+                        help='Number of profiled iterations (default 3)')
+    parser.add_argument('--num_warmup', dest='num_warmup', type=int, default=1,
+                        help='Number of unprofiled warmup iterations (default 1)')
+    parser.add_argument('--inference', dest='inference', action='store_true', default=False,
+                        help='Whether to profile inference (eval mode, no backward) instead of training steps')
+    parser.add_argument('--cross_entropy', dest='cross_entropy', action='store_true', default=False,
+                        help='Whether to build the network with its log-softmax heads')
+    parser.add_argument('--depth', dest='max_depth', type=int, default=1,
+                        help='Deepest level of submodules in the table (default 1: children of the network; '
+                             '0: all)')
+    parser.add_argument('--sort', dest='sort_key', default='total_ms', choices=SORT_KEYS,
+                        help='Column to sort the table by (default total_ms)')
+    parser.add_argument('-o', dest='output_filepath', default='',
+                        help='JSON file to write the stats of all modules to (default: none)')
+    parser.add_argument('--num_threads', dest='num_threads', type=int, default=0,
+                        help='Number of torch CPU threads (default 0: torch default)')
+    parser.add_argument('--cuda', dest='use_cuda', action='store_true', default=False,
+                        help='Whether to profile on GPU')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.num_threads > 0:
+        torch.set_num_threads(args.num_threads)
+    mode = 'inference' if args.inference else 'train'
+    print('Profiling ' + args.model_name + ' (' + mode + ', batch size ' + str(args.batch_size) + ')...')
+    profiler = profile_model(args.model_name, batch_size=args.batch_size, num_iter=args.num_iter,
+                             num_warmup=args.num_warmup, train=not args.inference,
+                             cross_entropy=args.cross_entropy, use_cuda=args.use_cuda)
+    profiler.print_stats(max_depth=args.max_depth, sort_key=args.sort_key)
+    if not args.output_filepath == '':
+        profiler.write_json(args.output_filepath, info={'model': args.model_name, 'mode': mode,
+                                                        'batch_size': args.batch_size, 'num_iter': args.num_iter,
+                                                        'cross_entropy': args.cross_entropy,
+                                                        'use_cuda': args.use_cuda})
+        print('Wrote stats of all modules to: ' + args.output_filepath)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import argparse
+import http.client
+import json
+import threading
+import time
+import numpy as np
+from urllib.parse import urlparse
+import benchmarker
+import inference_server
+
+DATASETS = ['synthhands', 'egodexter']
+
+
+def load_frames(dataset_name, root_folder, num_frames, type_='test', img_res=(320, 240)):
+    '''
+    :return: list of num_frames frames (evenly spaced over the dataset) as request bodies
+    '''
+    if dataset_name == 'synthhands':
+        import synthhands_handler
+        dataset = synthhands_handler.SynthHandsDataset(root_folder=root_folder, type_=type_, heatmap_res=img_res)
+    elif dataset_name == 'egodexter':
+        import egodexter_handler
+        dataset = egodexter_handler.EgoDexterDataset(type_=type_, root_folder=root_folder, heatmap_res=img_res)
+    else:
+        raise ValueError('Dataset ' + str(dataset_name) + ' does not exist. Valid datasets are: ' + str(DATASETS))
+    frame_ixs = np.linspace(0, len(dataset) - 1, min(num_frames, len(dataset))).astype(int)
+    return [inference_server.encode_frame(dataset[frame_ix][0].numpy()) for frame_ix in frame_ixs]
+
+
+def get_json(url, path):
+    parsed_url = urlparse(url)
+    connection = http.client.HTTPConnection(parsed_url.hostname, parsed_url.port)
+    try:
+        connection.request('GET', path)
+        return json.loads(connection.getresponse().read().decode('utf-8'))
+    finally:
+        connection.close()
+
+
+def run_client(url, frames, num_requests, first_frame_ix, results):
+    '''
+    Sends num_requests frames one after the other over one keep-alive connection
+    and appends (status, latency in s) of each request to results
+    '''
+    parsed_url = urlparse(url)
+    connection = http.client.HTTPConnection(parsed_url.hostname, parsed_url.port)
+    headers = {'Content-Type': 'application/octet-stream'}
+    client_results = []
+    try:
+        for i in range(num_requests):
+            frame_bytes = frames[(first_frame_ix + i) % len(frames)]
+            start = time.perf_counter()
+            connection.request('POST', '/track', body=frame_bytes, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            client_results.append((response.status, time.perf_counter() - start))
+    finally:
+        connection.close()
+    results.extend(client_results)
+
+
+def run_load(url, frames, num_clients, num_requests_per_client):
+    '''
+    Closed-loop load: num_clients concurrent clients, each sending its next frame as soon as
+    the previous one is answered
+    :return: dict of throughput and latency statistics
+    '''
+    results = []
+    threads = [threading.Thread(target=run_client,
+                                args=(url, frames, num_requests_per_client, i * num_requests_per_client, results))
+               for i in range(num_clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed_time = time.perf_counter() - start
+    latencies = [latency for status, latency in results if status == 200]
+    row = benchmarker.get_timing_stats(latencies) if len(latencies) > 0 else {}
+    row['num_clients'] = num_clients
+    row['num_ok'] = len(latencies)
+    row['num_rejected'] = sum(1 for status, _ in results if status == 503)
+    row['num_failed'] = len(results) - row['num_ok'] - row['num_rejected']
+    row['throughput_fps'] = len(latencies) / elapsed_time
+    return row
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Replay SynthHands/EgoDexter frames against inference_server.py '
+                                                 'and measure throughput versus latency')
+    parser.add_argument('-r', dest='root_folder', required=True, help='Root folder for dataset')
+    parser.add_argument('--dataset', dest='dataset_name', required=True, choices=DATASETS,
+                        help='Dataset to replay frames from (the same as the --dataset of the server)')
+    parser.add_argument('--type', dest='type_', default='test',
+                        help='Dataset split to replay frames from (default test)')
+    parser.add_argument('--num_frames', dest='num_frames', type=int, default=100,
+                        help='Number of distinct frames to replay (default 100)')
+    parser.add_argument('--url', dest='url', default='http://127.0.0.1:8000',
+                        help='Server URL (default http://127.0.0.1:8000)')
+    parser.add_argument('--num_clients', dest='num_clients', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help='Numbers of concurrent clients to test (default 1 2 4 8 16)')
+    parser.add_argument('--num_requests', dest='num_requests', type=int, default=20,
+                        help='Number of requests per client (default 20)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # the server lifts and projects joints with the intrinsics of its dataset's camera
+    server_dataset_name = get_json(args.url, '/health').get('dataset', '')
+    if not server_dataset_name == args.dataset_name:
+        raise ValueError('Server tracks ' + str(server_dataset_name) + ' frames, not ' + args.dataset_name +
+                         ' (see the --dataset of inference_server.py)')
+    print('Loading ' + str(args.num_frames) + ' ' + args.dataset_name + ' frames...')
+    frames = load_frames(args.dataset_name, args.root_folder, args.num_frames, type_=args.type_)
+    rows = []
+    for num_clients in args.num_clients:
+        print('Running ' + str(num_clients) + ' client(s)...')
+        rows.append(run_load(args.url, frames, num_clients, args.num_requests))
+    benchmarker.print_table(rows, ['num_clients', 'num_ok', 'num_rejected', 'num_failed', 'throughput_fps',
+                                   'mean_ms', 'median_ms', 'p95_ms', 'p99_ms'],
+                            title='Throughput vs latency (client side)')
+    server_stats = get_json(args.url, '/stats')
+    print('Server: mean batch size ' + str(round(server_stats['mean_batch_size'], 2)) +
+          ', batch sizes ' + json.dumps(server_stats['batch_sizes']) +
+          ', rejected ' + str(server_stats['num_rejected']))
+
+
+if __name__ == '__main__':
+    main()
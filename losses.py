@@ -16,6 +16,17 @@ def cross_entropy_loss_p_logq(torchvar_p, torchvar_logq, eps=1e-9):
     batch_size = torchvar_p.data.shape[0]
     return (-((torchvar_p + eps) * torchvar_logq + eps).sum(dim=1).sum(dim=1)).sum() / batch_size
 
+def cross_entropy_loss_p_logq_1d_bins(torchvar_p, target_bins, eps=1e-9):
+    '''
+    Same value as summing cross_entropy_loss_p_logq_1d over the channels of torchvar_p
+    with a one-hot of target_bins as torchvar_logq, as a single gather
+    :param torchvar_p: batch x channels x bins
+    :param target_bins: batch x channels integer (long) bin indices
+    '''
+    batch_size, num_channels, num_bins = torchvar_p.data.shape
+    target_p = torchvar_p.gather(2, target_bins.long().unsqueeze(2))
+    return -(target_p.sum() / batch_size) - (num_channels * (num_bins + 1) * eps)
+
 def calculate_loss_HALNet(loss_func, output, target, heatmap_ixs,
                                        weight_loss_intermed1, weight_loss_intermed2,
                                        weight_loss_intermed3, weight_loss_main, iter_size):
@@ -42,9 +53,7 @@ def calculate_loss_HALNet_prior(loss_func, output, target_heatmaps, target_prior
     loss_halnet = calculate_loss_HALNet(loss_func, output, target_heatmaps, joint_ixs,
                                        weight_loss_intermed1, weight_loss_intermed2,
                                        weight_loss_intermed3, weight_loss_main, iter_size)
-    loss_prior = 0
-    for idx_joint_pair in range(output[4].shape[1]):
-        loss_prior += cross_entropy_loss_p_logq_1d(output[4][:, idx_joint_pair, :], target_prior[:, idx_joint_pair, :])
+    loss_prior = cross_entropy_loss_p_logq_1d_bins(output[4], target_prior)
     loss_prior /= iter_size
     loss = loss_halnet + loss_prior
     return loss, loss_prior
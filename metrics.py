@@ -0,0 +1,206 @@
+import warnings
+import numpy as np
+import benchmarker
+
+
+def get_joint_errors(output_joints, target_joints):
+    '''
+    :param output_joints: (N, J, D) array of estimated joints (D = 2 for pixels, 3 for mm)
+    :return: (N, J) array of the euclidean distances between output and target joints
+    '''
+    return np.linalg.norm(np.asarray(output_joints, dtype=float) - np.asarray(target_joints, dtype=float), axis=-1)
+
+
+def get_thresholds(max_threshold, num_thresholds):
+    '''
+    :return: num_thresholds evenly spaced thresholds, from 0 up to (not including) max_threshold
+    '''
+    return np.linspace(0., max_threshold, num_thresholds, endpoint=False)
+
+
+def _as_errors_and_mask(errors, mask=None):
+    errors = np.asarray(errors, dtype=float)
+    if mask is None:
+        return errors, np.ones(errors.shape, dtype=bool)
+    return errors, np.broadcast_to(np.asarray(mask, dtype=bool), errors.shape)
+
+
+def get_frame_errors(errors, mask=None):
+    '''
+    :param errors: (N, J) array of joint errors
+    :param mask: (N, J) boolean array of the valid (labeled) joints (default: all valid)
+    :return: (N,) array of the mean error of the valid joints of each example (nan if it has none)
+    '''
+    errors, mask = _as_errors_and_mask(errors, mask)
+    num_valid = mask.sum(axis=1)
+    error_sums = np.where(mask, errors, 0.).sum(axis=1)
+    return np.where(num_valid > 0, error_sums / np.maximum(num_valid, 1), np.nan)
+
+
+def get_joint_stats(errors, mask=None):
+    '''
+    :param errors: (N, J) array of joint errors
+    :param mask: (N, J) boolean array of the valid (labeled) joints (default: all valid)
+    :return: dict of (J,) arrays of the number of valid errors and the mean, std and median error of each joint
+        (nan for joints without valid errors)
+    '''
+    errors, mask = _as_errors_and_mask(errors, mask)
+    valid_errors = np.where(mask, errors, np.nan)
+    with warnings.catch_warnings():
+        # joints never labeled
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        return {
+            'num_valid': mask.sum(axis=0),
+            'mean': np.nanmean(valid_errors, axis=0),
+            'std': np.nanstd(valid_errors, axis=0),
+            'median': np.nanmedian(valid_errors, axis=0),
+        }
+
+
+def _get_sorted_pck(sorted_errors, num_valid, thresholds):
+    # fraction of errors under each threshold; invalid errors are sorted last as inf, so never counted
+    num_under = np.stack([np.searchsorted(sorted_errors[:, i], thresholds, side='left')
+                          for i in range(sorted_errors.shape[1])])
+    return num_under / np.maximum(num_valid, 1)[:, np.newaxis]
+
+
+def get_pck(errors, thresholds, mask=None):
+    '''
+    Percentage of correct keypoints: fraction of (valid) errors strictly under each threshold
+    Errors are sorted once and each curve is a search of all thresholds in them
+    :param errors: (N,) array of errors, or (N, J) array of joint errors
+    :param mask: boolean array, of the shape of errors, of the valid errors (default: all valid)
+    :return: (T,) array for (N,) errors, else (J, T) array of the curve of each joint
+    '''
+    errors, mask = _as_errors_and_mask(errors, mask)
+    thresholds = np.asarray(thresholds, dtype=float)
+    if errors.ndim == 1:
+        return get_pck(errors[:, np.newaxis], thresholds, mask[:, np.newaxis])[0]
+    sorted_errors = np.sort(np.where(mask & ~np.isnan(errors), errors, np.inf), axis=0)
+    return _get_sorted_pck(sorted_errors, np.isfinite(sorted_errors).sum(axis=0), thresholds)
+
+
+def get_auc(pck, thresholds):
+    '''
+    :param pck: (..., T) array of PCK curves over thresholds
+    :return: (...) area under each curve, normalized by the range of thresholds (1 for a perfect curve)
+    '''
+    thresholds = np.asarray(thresholds, dtype=float)
+    pck = np.asarray(pck, dtype=float)
+    if len(thresholds) < 2:
+        return pck[..., 0]
+    areas = ((pck[..., 1:] + pck[..., :-1]) / 2. * np.diff(thresholds)).sum(axis=-1)
+    return areas / (thresholds[-1] - thresholds[0])
+
+
+def get_metrics(errors, thresholds, mask=None):
+    '''
+    :param errors: (N, J) array of joint errors
+    :param thresholds: (T,) array of the PCK thresholds
+    :param mask: (N, J) boolean array of the valid (labeled) joints (default: all valid)
+    :return: dict of:
+        per joint (J,) arrays: num_valid, mean, std, median, auc and their (J, T) pck curves
+        over all valid joint errors: mean_error, std_error, median_error, pck_all and auc_all
+        over the mean error of each example with valid joints: frame_errors, frame_mean, frame_std,
+            pck_frames and auc_frames
+    '''
+    errors, mask = _as_errors_and_mask(errors, mask)
+    thresholds = np.asarray(thresholds, dtype=float)
+    metrics = get_joint_stats(errors, mask)
+    metrics['thresholds'] = thresholds
+    metrics['pck'] = get_pck(errors, thresholds, mask)
+    metrics['auc'] = get_auc(metrics['pck'], thresholds)
+    all_errors = errors[mask]
+    metrics['mean_error'] = float(np.mean(all_errors)) if len(all_errors) > 0 else np.nan
+    metrics['std_error'] = float(np.std(all_errors)) if len(all_errors) > 0 else np.nan
+    metrics['median_error'] = float(np.median(all_errors)) if len(all_errors) > 0 else np.nan
+    metrics['pck_all'] = get_pck(all_errors, thresholds)
+    metrics['auc_all'] = float(get_auc(metrics['pck_all'], thresholds))
+    frame_errors = get_frame_errors(errors, mask)
+    frame_errors = frame_errors[~np.isnan(frame_errors)]
+    metrics['frame_errors'] = frame_errors
+    metrics['frame_mean'] = float(np.mean(frame_errors)) if len(frame_errors) > 0 else np.nan
+    metrics['frame_std'] = float(np.std(frame_errors)) if len(frame_errors) > 0 else np.nan
+    metrics['pck_frames'] = get_pck(frame_errors, thresholds)
+    metrics['auc_frames'] = float(get_auc(metrics['pck_frames'], thresholds))
+    return metrics
+
+
+def format_metrics(metrics, joint_names=None, float_precision=2):
+    '''
+    :param joint_names: name of each joint (default: its index)
+    :return: table with a row per joint, and one for all joints, of its errors and AUC
+    '''
+    num_joints = len(metrics['mean'])
+    joint_names = [str(i) for i in range(num_joints)] if joint_names is None else joint_names
+    rows = []
+    for i in range(num_joints):
+        rows.append({'joint': joint_names[i], 'num_valid': int(metrics['num_valid'][i]),
+                     'mean': float(metrics['mean'][i]), 'std': float(metrics['std'][i]),
+                     'median': float(metrics['median'][i]), 'auc': float(metrics['auc'][i])})
+    rows.append({'joint': 'all', 'num_valid': int(np.sum(metrics['num_valid'])),
+                 'mean': metrics['mean_error'], 'std': metrics['std_error'],
+                 'median': metrics['median_error'], 'auc': metrics['auc_all']})
+    return benchmarker.format_table(rows, ['joint', 'num_valid', 'mean', 'std', 'median', 'auc'],
+                                    float_precision=float_precision)
+
+
+class ErrorAccumulator:
+    '''
+    Streams (N, J) batches of joint errors (and validity masks) from batched inference
+    Running sums give the per joint means and stds at any point without going over the history;
+    the errors are kept in a buffer, grown by doubling, for the medians and PCK curves of get_metrics
+    '''
+    def __init__(self, num_joints, capacity=1024):
+        self.num_joints = num_joints
+        self.errors = np.zeros((capacity, num_joints))
+        self.mask = np.zeros((capacity, num_joints), dtype=bool)
+        self.num_examples = 0
+        self.error_sums = np.zeros(num_joints)
+        self.squared_error_sums = np.zeros(num_joints)
+        self.num_valid = np.zeros(num_joints, dtype=int)
+
+    def __len__(self):
+        return self.num_examples
+
+    def add_batch(self, errors, mask=None):
+        '''
+        :param errors: (N, J) array of joint errors
+        :param mask: (N, J) boolean array of the valid (labeled) joints (default: all valid)
+        '''
+        errors, mask = _as_errors_and_mask(errors, mask)
+        end_ix = self.num_examples + errors.shape[0]
+        if end_ix > self.errors.shape[0]:
+            capacity = max(end_ix, 2 * self.errors.shape[0])
+            errors_buffer = np.zeros((capacity, self.num_joints))
+            errors_buffer[:self.num_examples] = self.errors[:self.num_examples]
+            mask_buffer = np.zeros((capacity, self.num_joints), dtype=bool)
+            mask_buffer[:self.num_examples] = self.mask[:self.num_examples]
+            self.errors, self.mask = errors_buffer, mask_buffer
+        self.errors[self.num_examples:end_ix] = errors
+        self.mask[self.num_examples:end_ix] = mask
+        self.num_examples = end_ix
+        valid_errors = np.where(mask, errors, 0.)
+        self.error_sums += valid_errors.sum(axis=0)
+        self.squared_error_sums += (valid_errors ** 2).sum(axis=0)
+        self.num_valid += mask.sum(axis=0)
+
+    def get_errors(self):
+        '''
+        :return: (N, J) arrays of all errors so far and of their validity
+        '''
+        return self.errors[:self.num_examples], self.mask[:self.num_examples]
+
+    def get_means(self):
+        '''
+        :return: (J,) arrays of the running mean and std of each joint (nan for joints without valid errors)
+        '''
+        num_valid = np.maximum(self.num_valid, 1)
+        means = self.error_sums / num_valid
+        stds = np.sqrt(np.maximum(self.squared_error_sums / num_valid - means ** 2, 0.))
+        no_valid = self.num_valid == 0
+        return np.where(no_valid, np.nan, means), np.where(no_valid, np.nan, stds)
+
+    def get_metrics(self, thresholds):
+        errors, mask = self.get_errors()
+        return get_metrics(errors, thresholds, mask)
@@ -0,0 +1,220 @@
+import argparse
+import json
+import struct
+import time
+import numpy as np
+import torch
+from HALNet import HALNet
+from JORNet import JORNet
+
+MODEL_CLASSES = {
+    'HALNet': HALNet,
+    'JORNet': JORNet,
+}
+INFERENCE_CHECKPOINT_EXT = '.safetensors'
+# safetensors dtype names
+DTYPES = {
+    'F64': np.float64,
+    'F32': np.float32,
+    'F16': np.float16,
+    'I64': np.int64,
+    'I32': np.int32,
+    'I16': np.int16,
+    'I8': np.int8,
+    'U8': np.uint8,
+    'BOOL': np.bool_,
+}
+DTYPE_NAMES = {np.dtype(dtype): dtype_name for dtype_name, dtype in DTYPES.items()}
+# the tensor data starts at an offset multiple of this
+HEADER_ALIGNMENT = 8
+
+
+def get_model_config(model, folded_conv_bn=False):
+    params_dict = {}
+    params_dict['joint_ixs'] = [int(joint_ix) for joint_ix in model.joint_ixs]
+    params_dict['cross_entropy'] = bool(model.cross_entropy)
+    return {
+        'model_class': type(model).__name__,
+        'params_dict': params_dict,
+        'folded_conv_bn': folded_conv_bn,
+    }
+
+
+def save_inference_checkpoint(model, filepath, folded_conv_bn=False):
+    '''
+    Saves model weights as an inference checkpoint, in the safetensors layout:
+    8-byte little-endian header size, JSON header (dtype, shape and byte offsets of
+    each tensor, plus the model config as metadata) and the raw tensor data
+    There is no optimizer or training state, and nothing is pickled
+    '''
+    state_dict = model.state_dict()
+    # largest items first, so every tensor is aligned in the file
+    tensor_names = sorted(state_dict.keys(), key=lambda name: -state_dict[name].element_size())
+    header = {'__metadata__': {'config': json.dumps(get_model_config(model, folded_conv_bn))}}
+    arrays = []
+    offset = 0
+    for tensor_name in tensor_names:
+        array = np.ascontiguousarray(state_dict[tensor_name].detach().cpu().numpy())
+        header[tensor_name] = {
+            'dtype': DTYPE_NAMES[array.dtype],
+            'shape': list(array.shape),
+            'data_offsets': [offset, offset + array.nbytes],
+        }
+        arrays.append(array)
+        offset += array.nbytes
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b' ' * (-(len(header_bytes) + 8) % HEADER_ALIGNMENT)
+    with open(filepath, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for array in arrays:
+            f.write(array.tobytes())
+
+
+def read_inference_checkpoint(filepath):
+    '''
+    Memory-maps an inference checkpoint; tensor data is only read from disk when used
+    The map is copy-on-write, so the tensors can be modified without touching the file
+    :return: model config dict and state dict of tensors backed by the file
+    '''
+    with open(filepath, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size).decode('utf-8'))
+    config = json.loads(header.pop('__metadata__')['config'])
+    data = np.memmap(filepath, dtype=np.uint8, mode='c', offset=8 + header_size)
+    state_dict = {}
+    for tensor_name, tensor_info in header.items():
+        start, end = tensor_info['data_offsets']
+        array = data[start:end].view(DTYPES[tensor_info['dtype']]).reshape(tensor_info['shape'])
+        state_dict[tensor_name] = torch.from_numpy(array)
+    return config, state_dict
+
+
+def is_inference_checkpoint(filepath):
+    return filepath.endswith(INFERENCE_CHECKPOINT_EXT)
+
+
+def _torch_load(filepath):
+    # memory-map the tensors of zip-format checkpoints (torch >= 2.1)
+    try:
+        return torch.load(filepath, map_location='cpu', mmap=True, weights_only=False)
+    except (TypeError, RuntimeError):
+        return torch.load(filepath, map_location=lambda storage, loc: storage)
+
+
+def read_legacy_checkpoint(filepath):
+    '''
+    Reads the model of a training checkpoint (.pth.tar) or deploy.py artifact,
+    skipping the optimizer state
+    :return: model config dict (model class may be None) and state dict
+    '''
+    torch_file = _torch_load(filepath)
+    if 'train_vars' in torch_file:
+        train_vars = torch_file['train_vars']
+        params_dict = {}
+        params_dict['joint_ixs'] = train_vars['heatmap_ixs']
+        params_dict['cross_entropy'] = train_vars['cross_entropy']
+        config = {'model_class': None, 'params_dict': params_dict, 'folded_conv_bn': False}
+    else:
+        config = {'model_class': torch_file['model_class'], 'params_dict': torch_file['params_dict'],
+                  'folded_conv_bn': torch_file['folded_conv_bn']}
+    return config, torch_file['model_state_dict']
+
+
+def build_model(model_class, params_dict, state_dict, folded_conv_bn=False):
+    '''
+    Builds a model on the meta device (no weight allocation or initialisation) and
+    assigns it the given tensors; falls back to a regular build on older torch versions
+    '''
+    params_dict = dict(params_dict)
+    params_dict['use_cuda'] = False
+    try:
+        with torch.device('meta'):
+            model = model_class(params_dict)
+            if folded_conv_bn:
+                import deploy
+                model = deploy.fold_model_conv_bn(model)
+        model.load_state_dict(state_dict, assign=True)
+    except (AttributeError, TypeError):
+        model = model_class(params_dict)
+        if folded_conv_bn:
+            import deploy
+            model = deploy.fold_model_conv_bn(model)
+        model.load_state_dict(state_dict)
+    return model
+
+
+def load_model_for_inference(filepath, model_class=None, use_cuda=False):
+    '''
+    Loads a model for inference from an inference checkpoint (.safetensors), a training
+    checkpoint (.pth.tar) or a deploy.py artifact; no optimizer is built
+    :param model_class: network class, needed only for training checkpoints
+    :return: model in eval mode
+    '''
+    if is_inference_checkpoint(filepath):
+        config, state_dict = read_inference_checkpoint(filepath)
+    else:
+        config, state_dict = read_legacy_checkpoint(filepath)
+    if config['model_class'] is not None:
+        model_class = MODEL_CLASSES[config['model_class']]
+    elif model_class is None:
+        raise ValueError('A model class is needed to load the training checkpoint ' + filepath)
+    model = build_model(model_class, config['params_dict'], state_dict,
+                        folded_conv_bn=config['folded_conv_bn'])
+    model.eval()
+    if use_cuda:
+        model = model.cuda()
+    return model
+
+
+def get_output_filepath(filepath):
+    return filepath.split('.pth')[0] + INFERENCE_CHECKPOINT_EXT
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Convert training checkpoints (.pth.tar) to '
+                                                 'memory-mappable inference checkpoints (' +
+                                                 INFERENCE_CHECKPOINT_EXT + ')')
+    parser.add_argument('-c', dest='checkpoint_filepaths', nargs='+', required=True,
+                        help='Training checkpoints (or deploy.py artifacts) to convert')
+    parser.add_argument('--model', dest='model_class', default='HALNet', choices=list(MODEL_CLASSES.keys()),
+                        help='Network class of the training checkpoints (default HALNet)')
+    parser.add_argument('-o', dest='output_filepaths', nargs='+', default=[],
+                        help='Output files (default: checkpoint name with ' + INFERENCE_CHECKPOINT_EXT + ')')
+    parser.add_argument('--check', dest='check', action='store_true', default=False,
+                        help='Whether to check the converted outputs and compare loading times')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if len(args.output_filepaths) == 0:
+        args.output_filepaths = [get_output_filepath(filepath) for filepath in args.checkpoint_filepaths]
+    if not len(args.output_filepaths) == len(args.checkpoint_filepaths):
+        raise ValueError('Give one output file per checkpoint')
+    for checkpoint_filepath, output_filepath in zip(args.checkpoint_filepaths, args.output_filepaths):
+        print("Converting " + checkpoint_filepath + " to " + output_filepath)
+        config, state_dict = read_legacy_checkpoint(checkpoint_filepath)
+        model_class = MODEL_CLASSES[args.model_class]
+        if config['model_class'] is not None:
+            model_class = MODEL_CLASSES[config['model_class']]
+        model = build_model(model_class, config['params_dict'], state_dict,
+                            folded_conv_bn=config['folded_conv_bn'])
+        save_inference_checkpoint(model, output_filepath, folded_conv_bn=config['folded_conv_bn'])
+        if not args.check:
+            continue
+        if config['model_class'] is None:
+            import trainer
+            start = time.time()
+            trainer.load_checkpoint(checkpoint_filepath, model_class)
+            print("\tLoading time (trainer.load_checkpoint): " + str(round((time.time() - start) * 1000)) + ' ms')
+        start = time.time()
+        inference_model = load_model_for_inference(output_filepath)
+        print("\tLoading time (load_model_for_inference): " + str(round((time.time() - start) * 1000)) + ' ms')
+        state_dict, inference_state_dict = model.state_dict(), inference_model.state_dict()
+        max_abs_diff = max(float((state_dict[name].float() - inference_state_dict[name].float()).abs().max())
+                           for name in state_dict.keys())
+        print("\tMax absolute weight difference: " + str(max_abs_diff))
+
+if __name__ == '__main__':
+    main()
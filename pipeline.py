@@ -0,0 +1,149 @@
+import queue
+import threading
+import time
+import benchmarker
+
+_STOP = object()
+
+
+class _StageError:
+    def __init__(self, stage_name, error):
+        self.stage_name = stage_name
+        self.error = error
+
+
+class Stage:
+    '''
+    One step of a pipeline: func is called on the output of the previous stage
+    Stages share their process's torch intra-op thread pool (torch.set_num_threads is process wide)
+    '''
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.num_items = 0
+        self.busy_time = 0.
+        self.queue_depth_sum = 0
+        self.queue_depth_max = 0
+
+    def process(self, item, queue_depth=0):
+        start = time.perf_counter()
+        output = self.func(item)
+        self.busy_time += time.perf_counter() - start
+        self.num_items += 1
+        self.queue_depth_sum += queue_depth
+        self.queue_depth_max = max(self.queue_depth_max, queue_depth)
+        return output
+
+
+class PipelineExecutor:
+    '''
+    Runs stages in separate threads on consecutive items, with bounded queues between them,
+    so throughput approaches that of the slowest stage
+    Outputs are yielded in input order
+    '''
+    def __init__(self, stages, queue_size=4):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.elapsed_time = 0.
+
+    def _run_stage(self, stage, in_queue, out_queue):
+        while True:
+            queue_depth = in_queue.qsize()
+            item = in_queue.get()
+            if item is _STOP or isinstance(item, _StageError):
+                out_queue.put(item)
+                return
+            try:
+                output = stage.process(item, queue_depth)
+            except Exception as e:
+                out_queue.put(_StageError(stage.name, e))
+                return
+            out_queue.put(output)
+
+    def _feed(self, inputs, in_queue, stop_event):
+        for item in inputs:
+            if stop_event.is_set():
+                break
+            in_queue.put(item)
+        in_queue.put(_STOP)
+
+    def run(self, inputs):
+        '''
+        :param inputs: iterable of inputs to the first stage (consumed lazily)
+        :return: generator of the outputs of the last stage
+        '''
+        for stage in self.stages:
+            stage.reset_stats()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        stop_event = threading.Event()
+        threads = [threading.Thread(target=self._feed, args=(inputs, queues[0], stop_event), daemon=True)]
+        for stage_ix, stage in enumerate(self.stages):
+            threads.append(threading.Thread(target=self._run_stage, daemon=True,
+                                            args=(stage, queues[stage_ix], queues[stage_ix + 1])))
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                output = queues[-1].get()
+                if output is _STOP:
+                    break
+                if isinstance(output, _StageError):
+                    raise RuntimeError('Pipeline stage ' + output.stage_name + ' failed') from output.error
+                yield output
+        finally:
+            self.elapsed_time = time.perf_counter() - start
+            stop_event.set()
+            # unblock stages waiting to put, so every thread can see the stop marker
+            for queue_ in queues:
+                while not queue_.empty():
+                    try:
+                        queue_.get_nowait()
+                    except queue.Empty:
+                        break
+
+    def run_sequential(self, inputs):
+        '''
+        Runs every stage on an item before taking the next one, in the calling thread
+        (the baseline for the pipelined run)
+        '''
+        for stage in self.stages:
+            stage.reset_stats()
+        start = time.perf_counter()
+        try:
+            for item in inputs:
+                for stage in self.stages:
+                    item = stage.process(item)
+                yield item
+        finally:
+            self.elapsed_time = time.perf_counter() - start
+
+    def get_stats(self):
+        '''
+        :return: list with, per stage: items processed, mean time per item, utilization
+            (fraction of the run the stage was busy) and input queue depth
+        '''
+        rows = []
+        for stage in self.stages:
+            rows.append({
+                'stage': stage.name,
+                'num_items': stage.num_items,
+                'mean_ms': stage.busy_time * 1000 / max(stage.num_items, 1),
+                'utilization': stage.busy_time / self.elapsed_time if self.elapsed_time > 0 else 0.,
+                'mean_queue_depth': stage.queue_depth_sum / max(stage.num_items, 1),
+                'max_queue_depth': stage.queue_depth_max,
+            })
+        return rows
+
+    def get_throughput(self):
+        if self.elapsed_time == 0:
+            return 0.
+        return self.stages[-1].num_items / self.elapsed_time
+
+    def print_stats(self, title='Pipeline stages'):
+        benchmarker.print_table(self.get_stats(), ['stage', 'num_items', 'mean_ms', 'utilization',
+                                                   'mean_queue_depth', 'max_queue_depth'],
+                                title=title + ' (' + str(round(self.get_throughput(), 2)) + ' items/s)')
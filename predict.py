@@ -3,28 +3,30 @@ import argparse
 import HALNet, JORNet
 import converter
 import synthhands_handler
-import visualize
-import trainer
+import inference_backends
 import converter as conv
 import camera
 
-parser = argparse.ArgumentParser(description='Train a hand-tracking deep neural network')
-parser.add_argument('-i', dest='input_img_namebase', default='', type=str, required=False,
-                    help='Input image file name base (e.g. female_noobject/seq01/cam01/01/00000000')
-parser.add_argument('-r', dest='dataset_folder', default='', type=str, required=True,
-                    help='Dataset folder')
-parser.add_argument('--halnet', dest='halnet_filepath', type=str, required=True,
-                    help='Filepath to trained HALNet checkpoint')
-parser.add_argument('--jornet', dest='jornet_filepath', type=str, required=True,
-                    help='Filepath to trained HALNet checkpoint')
-parser.add_argument('--cuda', dest='use_cuda', action='store_true', default=False,
-                    help='Whether to use cuda for training')
-parser.add_argument('-o', dest='output_filepath', default='',
-                    help='Output file for logging')
-args = parser.parse_args()
-
-if args.use_cuda:
-    torch.set_default_tensor_type('torch.cuda.Floaimg_filenamebasetTensor')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Train a hand-tracking deep neural network')
+    parser.add_argument('-i', dest='input_img_namebase', default='', type=str, required=False,
+                        help='Input image file name base (e.g. female_noobject/seq01/cam01/01/00000000')
+    parser.add_argument('-r', dest='dataset_folder', default='', type=str, required=True,
+                        help='Dataset folder')
+    parser.add_argument('--halnet', dest='halnet_filepath', type=str, required=True,
+                        help='Filepath to trained HALNet checkpoint')
+    parser.add_argument('--jornet', dest='jornet_filepath', type=str, required=True,
+                        help='Filepath to trained HALNet checkpoint')
+    parser.add_argument('--cuda', dest='use_cuda', action='store_true', default=False,
+                        help='Whether to use cuda for training')
+    parser.add_argument('--backend', dest='backend', default='eager', choices=inference_backends.BACKENDS,
+                        help='Inference backend (default eager). For torchscript/onnx, --halnet and --jornet '
+                             'are the files written by exporter.py')
+    parser.add_argument('-o', dest='output_filepath', default='',
+                        help='Output file for logging')
+    return parser.parse_args()
+
 
 def predict_from_dataset(args, halnet, jornet):
     valid_loader = synthhands_handler.get_SynthHands_validloader(root_folder=args.dataset_folder,
@@ -35,18 +37,21 @@ def predict_from_dataset(args, halnet, jornet):
 
 
 def plot_halnet_joints_from_heatmaps(halnet_main_out, img_numpy, filenamebase):
+    import visualize
     fig = visualize.create_fig()
     visualize.plot_joints_from_heatmaps(halnet_main_out, fig=fig, data=img_numpy)
     visualize.title('HALNet (joints from heatmaps): ' + filenamebase)
     visualize.show()
 
 def plot_halnet_heatmap(halnet_mainout, img_numpy, heatmap_ix, filenamebase):
+    import visualize
     visualize.plot_image_and_heatmap(halnet_mainout[heatmap_ix], data=img_numpy)
     joint_name = synthhands_handler.get_joint_name_from_ix(heatmap_ix)
     visualize.title('HALNet (heatmap for ' + joint_name + '): ' + filenamebase)
     visualize.show()
 
 def plot_halnet_joints_from_heatmaps_crop(halnet_main_out, img_numpy, filenamebase, plot=True):
+    import visualize
     labels_colorspace = conv.heatmaps_to_joints_colorspace(halnet_main_out)
     data_crop, crop_coords, labels_heatmaps, labels_colorspace = \
         converter.crop_image_get_labels(img_numpy, labels_colorspace, range(21))
@@ -60,6 +65,7 @@ def plot_halnet_joints_from_heatmaps_crop(halnet_main_out, img_numpy, filenameba
 
 def plot_jornet_joints_global_depth(joints_global_depth, filenamebase,
                                     gt_joints=None, color_jornet_joints='C6'):
+    import visualize
     if gt_joints is None:
         visualize.plot_3D_joints(joints_global_depth)
     else:
@@ -83,8 +89,8 @@ def predict_from_image(args, halnet, jornet, img_res=(320, 240), orig_res=(640,
     labels_jointspace, labels_colorspace, labels_joint_depth_z =\
         synthhands_handler.get_labels_depth_and_color(args.dataset_folder, args.input_img_namebase)
     # plot HALnet predictions
-    output_halnet = halnet(conv.data_to_batch(data))
-    halnet_main_out = output_halnet[3][0].data.numpy()
+    output_halnet = halnet.forward_inference(conv.data_to_batch(data))
+    halnet_main_out = output_halnet[0].data.numpy()
     img_numpy = data.data.numpy()
     #plot_halnet_heatmap(halnet_main_out, img_numpy, 8, args.input_img_namebase)
     #plot_halnet_joints_from_heatmaps(halnet_main_out, img_numpy, args.input_img_namebase)
@@ -92,8 +98,8 @@ def predict_from_image(args, halnet, jornet, img_res=(320, 240), orig_res=(640,
     # get JORNet outputs
     handroot = labels_jointspace[0, 0:3]
     batch_jornet = convert_data_to_batch(data_crop)
-    output_jornet = jornet(batch_jornet)
-    jornet_joints_mainout = output_jornet[7][0].data.cpu().numpy()
+    output_jornet = jornet.forward_inference(batch_jornet)
+    jornet_joints_mainout = output_jornet[1][0].data.cpu().numpy()
     # plot depth
     jornet_joints_mainout *= 1.1
     jornet_joints_global = get_jornet_global_depth(jornet_joints_mainout, handroot)
@@ -103,25 +109,29 @@ def predict_from_image(args, halnet, jornet, img_res=(320, 240), orig_res=(640,
     return output_halnet, output_jornet, jornet_joints_global
 
 
-# load nets
-print('Loading HALNet from: ' + args.halnet_filepath)
-halnet, _, _, _ = trainer.load_checkpoint(filename=args.halnet_filepath,
-                                          model_class=HALNet.HALNet,
-                                          use_cuda=args.use_cuda)
-print('Loading JORNet from: ' + args.jornet_filepath)
-jornet, _, _, _ = trainer.load_checkpoint(filename=args.jornet_filepath,
-                                          model_class=JORNet.JORNet,
-                                          use_cuda=args.use_cuda)
+def main():
+    args = parse_args()
+    if args.use_cuda:
+        torch.set_default_tensor_type('torch.cuda.FloatTensor')
 
+    # load nets
+    print('Loading HALNet from: ' + args.halnet_filepath)
+    halnet = inference_backends.load_backend(args.backend, args.halnet_filepath,
+                                             model_class=HALNet.HALNet, use_cuda=args.use_cuda)
+    print('Loading JORNet from: ' + args.jornet_filepath)
+    jornet = inference_backends.load_backend(args.backend, args.jornet_filepath,
+                                             model_class=JORNet.JORNet, use_cuda=args.use_cuda)
 
-if args.input_img_namebase == '':
-    predict_from_dataset(args, halnet, jornet)
-elif args.dataset_folder == '':
-    raise('You need to define either a dataset folder (-r) or an image file name base (-i)')
-else:
-    for i in range(10):
-        args.input_img_namebase = args.input_img_namebase[0:-1] + str(i)
-        predict_from_image(args, halnet, jornet)
 
+    if args.input_img_namebase == '':
+        predict_from_dataset(args, halnet, jornet)
+    elif args.dataset_folder == '':
+        raise('You need to define either a dataset folder (-r) or an image file name base (-i)')
+    else:
+        for i in range(10):
+            args.input_img_namebase = args.input_img_namebase[0:-1] + str(i)
+            predict_from_image(args, halnet, jornet)
 
 
+if __name__ == '__main__':
+    main()
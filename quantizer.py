@@ -0,0 +1,289 @@
+import argparse
+import copy
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+try:
+    import torch.ao.quantization as quantization
+except ImportError:
+    import torch.quantization as quantization
+import benchmarker
+import converter as conv
+import deploy
+import egodexter_handler
+import synthhands_handler
+
+# heads not used by forward_inference; dropped from quantized models
+UNUSED_HEADS = ['interm_loss1', 'interm_loss1_deconv', 'interm_loss1_softmax',
+                'interm_loss2', 'interm_loss2_deconv', 'interm_loss2_softmax',
+                'interm_loss3', 'interm_loss3_deconv', 'interm_loss3_softmax',
+                'innerproduct1_joint1', 'innerproduct2_joint1',
+                'innerproduct1_joint2', 'innerproduct2_joint2',
+                'innerproduct1_joint3', 'innerproduct2_joint3']
+
+
+class QuantizableInference(nn.Module):
+    '''
+    Inference-only forward of HALNet/JORNet with quantization boundaries:
+    the input is quantized, the conv body runs in int8, and the outputs are
+    dequantized before the bilinear upsampling, the softmax and the joint regressor
+    (the latter is quantized dynamically instead)
+    '''
+    def __init__(self, model):
+        super(QuantizableInference, self).__init__()
+        self.model = model
+        self.quant = quantization.QuantStub()
+        self.dequant_heatmaps = quantization.DeQuantStub()
+        self.dequant_joints = quantization.DeQuantStub()
+        self.regress_joints = hasattr(model, 'forward_main_joints')
+
+    def forward(self, x):
+        x = self.quant(x)
+        _, _, _, conv4fout = self.model.forward_common_net(x)
+        out_main = self.model.main_loss_conv(conv4fout)
+        out_main = self.model.main_loss_deconv(self.dequant_heatmaps(out_main))
+        if self.model.cross_entropy:
+            out_main = self.model.softmax_final(out_main)
+        if not self.regress_joints:
+            return out_main
+        # quantized convs give channels-last tensors; the regressor flattens in NCHW order
+        out_joints = self.model.forward_main_joints(self.dequant_joints(conv4fout).contiguous())
+        return out_main, out_joints
+
+
+def _is_conv_block(module):
+    children = list(module.children())
+    return isinstance(module, nn.Sequential) and len(children) == 2 and \
+           isinstance(children[0], nn.Conv2d) and isinstance(children[1], nn.BatchNorm2d)
+
+
+def get_fuse_groups(model):
+    '''
+    :return: lists of module names to fuse: the Conv2d and BatchNorm2d of every
+        HALNetConvBlock, plus the ReLU following it in a sequence, if any
+    '''
+    followed_by_relu = set()
+    for name, module in model.named_modules():
+        if not isinstance(module, nn.Sequential):
+            continue
+        children = list(module.named_children())
+        for (child_name, child), (_, next_child) in zip(children[:-1], children[1:]):
+            if _is_conv_block(child) and isinstance(next_child, nn.ReLU):
+                followed_by_relu.add((name + '.' if name else '') + child_name)
+    fuse_groups = []
+    for name, module in model.named_modules():
+        if _is_conv_block(module):
+            fuse_group = [name + '.0', name + '.1']
+            if name in followed_by_relu:
+                parent_name, _, child_name = name.rpartition('.')
+                fuse_group.append((parent_name + '.' if parent_name else '') + str(int(child_name) + 1))
+            fuse_groups.append(fuse_group)
+    return fuse_groups
+
+
+def strip_unused_heads(model):
+    for head_name in UNUSED_HEADS:
+        if hasattr(model, head_name):
+            setattr(model, head_name, nn.Identity())
+    return model
+
+
+def get_quantized_engine():
+    supported_engines = torch.backends.quantized.supported_engines
+    for engine in ['x86', 'fbgemm', 'qnnpack']:
+        if engine in supported_engines:
+            return engine
+    raise RuntimeError('No quantized engine supported on this machine: ' + str(supported_engines))
+
+
+def prepare_static_quantization(model, engine=None):
+    '''
+    Fuses Conv+BN(+ReLU), drops unused heads and inserts observers for calibration
+    :return: prepared (observed) inference module; the given model is not changed
+    '''
+    if engine is None:
+        engine = get_quantized_engine()
+    torch.backends.quantized.engine = engine
+    model = copy.deepcopy(model)
+    model.eval()
+    strip_unused_heads(model)
+    quantization.fuse_modules(model, get_fuse_groups(model), inplace=True)
+    quant_model = QuantizableInference(model)
+    quant_model.eval()
+    quant_model.qconfig = quantization.get_default_qconfig(engine)
+    # float parts: upsampling/softmax after dequantization and the (dynamically quantized) regressor
+    for module in quant_model.modules():
+        if isinstance(module, (nn.Linear, nn.Upsample)):
+            module.qconfig = None
+    return quantization.prepare(quant_model, inplace=False)
+
+
+def calibrate(prepared_model, calibration_loader, num_frames, verbose=False):
+    num_calibrated = 0
+    with torch.no_grad():
+        for data, _ in calibration_loader:
+            prepared_model(conv.batch_to_device_float(data))
+            num_calibrated += data.shape[0]
+            if verbose:
+                print("\rCalibrated frames: " + str(num_calibrated) + '/' + str(num_frames), end='')
+            if num_calibrated >= num_frames:
+                break
+    if verbose:
+        print('')
+    return prepared_model
+
+
+def convert_quantization(prepared_model):
+    '''
+    Converts a calibrated model to int8 and quantizes its linear layers dynamically
+    '''
+    quant_model = quantization.convert(prepared_model, inplace=False)
+    return quantization.quantize_dynamic(quant_model, {nn.Linear}, dtype=torch.qint8, inplace=False)
+
+
+def quantize_model(model, calibration_loader, num_frames, engine=None, verbose=False):
+    prepared_model = prepare_static_quantization(model, engine=engine)
+    calibrate(prepared_model, calibration_loader, num_frames, verbose=verbose)
+    return convert_quantization(prepared_model)
+
+
+def save_quantized_model(quant_model, filepath, input_shape):
+    '''
+    Saves a quantized model as TorchScript (loadable with the torchscript inference backend)
+    '''
+    example_batch = torch.rand((2,) + tuple(input_shape))
+    with torch.no_grad():
+        traced_model = torch.jit.trace(quant_model, example_batch)
+    traced_model = torch.jit.freeze(traced_model)
+    traced_model.save(filepath)
+
+
+def get_frames_loader(dataset, num_frames, batch_size):
+    # frames spread evenly over the dataset
+    frame_ixs = np.linspace(0, len(dataset) - 1, min(num_frames, len(dataset))).astype(int)
+    return torch.utils.data.DataLoader(torch.utils.data.Subset(dataset, list(frame_ixs)),
+                                       batch_size=batch_size, shuffle=False)
+
+
+def get_dataset(dataset_name, root_folder, type_, model_class_name, split_filename=''):
+    crop_hand = model_class_name == 'JORNet'
+    heatmap_res = deploy.MODEL_INPUT_SHAPES[model_class_name][1:]
+    if dataset_name == 'synthhands':
+        kwargs = {} if split_filename == '' else {'splitfilename': split_filename}
+        return synthhands_handler.SynthHandsDataset(root_folder=root_folder, type_=type_,
+                                                    heatmap_res=heatmap_res, crop_hand=crop_hand, **kwargs)
+    if dataset_name == 'egodexter':
+        if crop_hand:
+            raise ValueError('EgoDexter frames can only be used with HALNet (JORNet needs hand crops)')
+        kwargs = {} if split_filename == '' else {'splitfilename': split_filename}
+        return egodexter_handler.EgoDexterDataset(type_=type_, root_folder=root_folder,
+                                                  heatmap_res=heatmap_res, **kwargs)
+    raise ValueError('Dataset ' + str(dataset_name) + ' does not exist. Valid datasets are: synthhands, egodexter')
+
+
+def heatmaps_to_joints_colorspace_batch(heatmaps):
+    '''
+    :param heatmaps: batch x joints x U x V tensor
+    :return: batch x joints x 2 tensor of heatmap maxima (u, v)
+    '''
+    heatmap_ixs = heatmaps.flatten(start_dim=2).argmax(dim=2)
+    return torch.stack((heatmap_ixs // heatmaps.shape[3], heatmap_ixs % heatmaps.shape[3]), dim=2).float()
+
+
+def evaluate_errors(model_func, eval_loader):
+    '''
+    :return: mean joint pixel error (heatmap maxima vs target maxima) and, for networks
+        regressing joints, mean joint error in mm
+    '''
+    pixel_errors = []
+    mm_errors = []
+    for data, target in eval_loader:
+        _, target_joints, target_heatmaps, _ = target[0:4]
+        outputs = model_func(conv.batch_to_device_float(data))
+        out_heatmaps = outputs[0] if isinstance(outputs, tuple) else outputs
+        pixel_errors.append((heatmaps_to_joints_colorspace_batch(out_heatmaps) -
+                             heatmaps_to_joints_colorspace_batch(target_heatmaps)).norm(dim=2))
+        if isinstance(outputs, tuple):
+            # joints regressed relative to the hand root, without the root itself
+            out_joints = outputs[1].reshape((outputs[1].shape[0], -1, 3))
+            target_joints = target_joints[:, 3:].reshape(out_joints.shape)
+            mm_errors.append((out_joints - target_joints).norm(dim=2))
+    errors = {'pixel_error': float(torch.cat(pixel_errors).mean())}
+    if len(mm_errors) > 0:
+        errors['mm_error'] = float(torch.cat(mm_errors).mean())
+    return errors
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Post-training int8 quantization of a trained network')
+    parser.add_argument('-c', dest='checkpoint_filepath', required=True,
+                        help='Training checkpoint to quantize')
+    parser.add_argument('--model', dest='model_class', default='HALNet', choices=list(deploy.MODEL_CLASSES.keys()),
+                        help='Network class of the checkpoint (default HALNet)')
+    parser.add_argument('-r', dest='root_folder', required=True, help='Root folder for dataset')
+    parser.add_argument('--dataset', dest='dataset_name', default='synthhands', choices=['synthhands', 'egodexter'],
+                        help='Dataset of the calibration frames (default synthhands)')
+    parser.add_argument('--split_filename', dest='split_filename', default='',
+                        help='Split filename for the file with the calibration dataset splits (default: dataset default)')
+    parser.add_argument('--eval_split_filename', dest='eval_split_filename', default='',
+                        help='Split filename for the file with SynthHands splits, for the error report '
+                             '(default: dataset default)')
+    parser.add_argument('--calib_type', dest='calib_type', default='train',
+                        help='Dataset split of the calibration frames (default train)')
+    parser.add_argument('--num_calib', dest='num_calib', type=int, default=300,
+                        help='Number of calibration frames (default 300)')
+    parser.add_argument('--eval_type', dest='eval_type', default='test',
+                        help='SynthHands split of the frames for the error report (default test)')
+    parser.add_argument('--num_eval', dest='num_eval', type=int, default=200,
+                        help='Number of frames for the error report (default 200)')
+    parser.add_argument('--batch_size', dest='batch_size', type=int, default=8,
+                        help='Batch size for calibration and evaluation (default 8)')
+    parser.add_argument('--num_iter', type=int, dest='num_iter', default=10,
+                        help='Number of timed iterations when benchmarking (default 10)')
+    parser.add_argument('-o', dest='output_filepath', default='',
+                        help='Output file for the quantized TorchScript model (default: checkpoint name + _int8.pt)')
+    parser.add_argument('-v', '--verbose', dest='verbose', action='store_true', default=True,
+                        help='Verbose mode')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.output_filepath == '':
+        args.output_filepath = args.checkpoint_filepath.split('.pth')[0] + '_int8.pt'
+    model_class = deploy.MODEL_CLASSES[args.model_class]
+    input_shape = deploy.MODEL_INPUT_SHAPES[args.model_class]
+    print("Loading model from checkpoint: " + args.checkpoint_filepath)
+    model = deploy.load_model_weights(args.checkpoint_filepath, model_class)
+    model.eval()
+
+    calib_dataset = get_dataset(args.dataset_name, args.root_folder, args.calib_type,
+                                args.model_class, split_filename=args.split_filename)
+    calib_loader = get_frames_loader(calib_dataset, args.num_calib, args.batch_size)
+    print("Calibrating on " + str(len(calib_loader.dataset)) + " " + args.dataset_name + " frames...")
+    start = time.time()
+    quant_model = quantize_model(model, calib_loader, args.num_calib, verbose=args.verbose)
+    print("Quantized in " + str(round(time.time() - start, 1)) + " s")
+    print("Saving quantized model: " + args.output_filepath)
+    save_quantized_model(quant_model, args.output_filepath, input_shape)
+    quant_model = torch.jit.load(args.output_filepath)
+
+    eval_dataset = get_dataset('synthhands', args.root_folder, args.eval_type,
+                               args.model_class, split_filename=args.eval_split_filename)
+    eval_loader = get_frames_loader(eval_dataset, args.num_eval, args.batch_size)
+    batch = torch.rand((1,) + input_shape)
+    rows = []
+    for model_name, model_func in [('float32', model.forward_inference), ('int8', quant_model)]:
+        print("Evaluating " + model_name + " on " + str(len(eval_loader.dataset)) + " frames...")
+        with torch.no_grad():
+            row = evaluate_errors(model_func, eval_loader)
+            row.update(benchmarker.time_func(lambda: model_func(batch), num_iter=args.num_iter))
+        row['model'] = model_name
+        rows.append(row)
+    benchmarker.print_table(rows, ['model', 'pixel_error', 'mm_error', 'mean_ms', 'std_ms', 'p95_ms'],
+                            title='Quantization report (' + args.model_class + ', latency at batch size 1)')
+
+
+if __name__ == '__main__':
+    main()
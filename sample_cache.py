@@ -0,0 +1,208 @@
+import ctypes
+import multiprocessing as mp
+import numpy as np
+import torch
+
+# slot states
+SLOT_EMPTY = 0
+SLOT_WRITING = 1
+SLOT_READY = 2
+
+# indexes into the shared counters array
+COUNTER_CLOCK = 0
+COUNTER_HITS = 1
+COUNTER_MISSES = 2
+COUNTER_EVICTIONS = 3
+
+
+def _flatten_sample(sample):
+    '''
+    Flattens a (possibly nested) tuple/list of torch tensors and numpy arrays
+    :param sample: dataset sample, e.g. (data, (labels_colorspace, labels_jointvec, ...))
+    :return: structure description and list of numpy arrays (zero-copy for tensors)
+    '''
+    if isinstance(sample, torch.Tensor):
+        return 'tensor', [sample.detach().cpu().numpy()]
+    if isinstance(sample, np.ndarray):
+        return 'ndarray', [sample]
+    if isinstance(sample, (tuple, list)):
+        structure = []
+        arrays = []
+        for elem in sample:
+            elem_structure, elem_arrays = _flatten_sample(elem)
+            structure.append(elem_structure)
+            arrays += elem_arrays
+        return (type(sample).__name__, structure), arrays
+    raise ValueError('Cannot cache sample element of type ' + str(type(sample)))
+
+
+def _unflatten_sample(structure, arrays, array_ix=0):
+    if structure == 'tensor':
+        return torch.from_numpy(arrays[array_ix]), array_ix + 1
+    if structure == 'ndarray':
+        return arrays[array_ix], array_ix + 1
+    container_name, elems_structure = structure
+    elems = []
+    for elem_structure in elems_structure:
+        elem, array_ix = _unflatten_sample(elem_structure, arrays, array_ix)
+        elems.append(elem)
+    if container_name == 'list':
+        return elems, array_ix
+    return tuple(elems), array_ix
+
+
+class SharedSampleCache:
+    '''
+    Byte-budgeted LRU cache of decoded dataset samples living in shared memory
+
+    All buffers are allocated on creation (in the main process), so DataLoader
+    workers - forked or spawned - and consecutive epochs all see the same cache.
+    Every sample of a dataset has the same array layout (given by the example
+    sample), so the budget is split into fixed-size slots; a sample with a
+    different layout is simply not cached.
+    Readers pin a slot while copying out of it, so the global lock is only held
+    for bookkeeping and never during the copies.
+    '''
+
+    def __init__(self, max_bytes, example_sample, num_keys):
+        self.structure, example_arrays = _flatten_sample(example_sample)
+        self.layout = [(array.dtype.str, array.shape) for array in example_arrays]
+        self.sample_nbytes = int(sum(array.nbytes for array in example_arrays))
+        self.max_bytes = int(max_bytes)
+        self.num_slots = int(min(self.max_bytes // self.sample_nbytes, num_keys))
+        self.num_keys = num_keys
+        self._lock = mp.Lock()
+        self._slots_buffer = mp.RawArray(ctypes.c_uint8, max(1, self.num_slots * self.sample_nbytes))
+        self._slot_keys = mp.RawArray(ctypes.c_int64, max(1, self.num_slots))
+        self._slot_last_used = mp.RawArray(ctypes.c_int64, max(1, self.num_slots))
+        self._slot_states = mp.RawArray(ctypes.c_int8, max(1, self.num_slots))
+        self._slot_pins = mp.RawArray(ctypes.c_int32, max(1, self.num_slots))
+        self._key_slots = mp.RawArray(ctypes.c_int64, max(1, num_keys))
+        self._counters = mp.RawArray(ctypes.c_int64, 4)
+        self._views = None
+        views = self._get_views()
+        views['slot_keys'][:] = -1
+        views['slot_last_used'][:] = -1
+        views['key_slots'][:] = -1
+
+    def __getstate__(self):
+        # numpy views are rebuilt in each process
+        state = self.__dict__.copy()
+        state['_views'] = None
+        return state
+
+    def _get_views(self):
+        if self._views is None:
+            self._views = {
+                'slots': np.frombuffer(self._slots_buffer, dtype=np.uint8),
+                'slot_keys': np.frombuffer(self._slot_keys, dtype=np.int64),
+                'slot_last_used': np.frombuffer(self._slot_last_used, dtype=np.int64),
+                'slot_states': np.frombuffer(self._slot_states, dtype=np.int8),
+                'slot_pins': np.frombuffer(self._slot_pins, dtype=np.int32),
+                'key_slots': np.frombuffer(self._key_slots, dtype=np.int64),
+                'counters': np.frombuffer(self._counters, dtype=np.int64),
+            }
+        return self._views
+
+    def _slot_arrays(self, slot):
+        slot_bytes = self._get_views()['slots'][slot * self.sample_nbytes:(slot + 1) * self.sample_nbytes]
+        arrays = []
+        offset = 0
+        for dtype_str, shape in self.layout:
+            dtype = np.dtype(dtype_str)
+            nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+            arrays.append(slot_bytes[offset:offset + nbytes].view(dtype).reshape(shape))
+            offset += nbytes
+        return arrays
+
+    def get(self, key):
+        '''
+        :return: a copy of the cached sample for key, or None on a miss
+        '''
+        views = self._get_views()
+        with self._lock:
+            slot = views['key_slots'][key]
+            if slot < 0 or views['slot_states'][slot] != SLOT_READY:
+                views['counters'][COUNTER_MISSES] += 1
+                return None
+            views['counters'][COUNTER_CLOCK] += 1
+            views['slot_last_used'][slot] = views['counters'][COUNTER_CLOCK]
+            views['counters'][COUNTER_HITS] += 1
+            views['slot_pins'][slot] += 1
+        try:
+            arrays = [np.array(array) for array in self._slot_arrays(slot)]
+        finally:
+            with self._lock:
+                views['slot_pins'][slot] -= 1
+        sample, _ = _unflatten_sample(self.structure, arrays)
+        return sample
+
+    def put(self, key, sample):
+        '''
+        Stores sample under key, evicting the least recently used sample if needed
+        :return: whether the sample was stored
+        '''
+        if self.num_slots == 0:
+            return False
+        try:
+            structure, arrays = _flatten_sample(sample)
+        except ValueError:
+            return False
+        if not structure == self.structure or \
+                not [(array.dtype.str, array.shape) for array in arrays] == self.layout:
+            return False
+        views = self._get_views()
+        with self._lock:
+            if views['key_slots'][key] >= 0:
+                return False
+            free_slots = (views['slot_pins'] == 0) & (views['slot_states'] != SLOT_WRITING)
+            if not np.any(free_slots):
+                return False
+            slot = int(np.argmin(np.where(free_slots, views['slot_last_used'], np.iinfo(np.int64).max)))
+            evicted_key = views['slot_keys'][slot]
+            if evicted_key >= 0:
+                views['key_slots'][evicted_key] = -1
+                views['counters'][COUNTER_EVICTIONS] += 1
+            views['slot_keys'][slot] = key
+            views['slot_states'][slot] = SLOT_WRITING
+            views['key_slots'][key] = slot
+        for slot_array, array in zip(self._slot_arrays(slot), arrays):
+            slot_array[...] = array
+        with self._lock:
+            views['counters'][COUNTER_CLOCK] += 1
+            views['slot_last_used'][slot] = views['counters'][COUNTER_CLOCK]
+            views['slot_states'][slot] = SLOT_READY
+        return True
+
+    def get_or_compute(self, key, compute_func):
+        sample = self.get(key)
+        if sample is None:
+            sample = compute_func(key)
+            self.put(key, sample)
+        return sample
+
+    def stats(self):
+        views = self._get_views()
+        with self._lock:
+            hits = int(views['counters'][COUNTER_HITS])
+            misses = int(views['counters'][COUNTER_MISSES])
+            evictions = int(views['counters'][COUNTER_EVICTIONS])
+            num_cached = int(np.sum(views['slot_states'][:self.num_slots] == SLOT_READY))
+        num_lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'evictions': evictions,
+            'hit_rate': hits / num_lookups if num_lookups > 0 else 0.,
+            'num_cached': num_cached,
+            'num_slots': self.num_slots,
+            'sample_nbytes': self.sample_nbytes,
+            'max_bytes': self.max_bytes,
+        }
+
+    def stats_str(self):
+        stats = self.stats()
+        return 'Sample cache: ' + str(stats['hits']) + ' hits, ' + str(stats['misses']) + ' misses, ' + \
+               str(stats['evictions']) + ' evictions (hit rate ' + str(round(stats['hit_rate'] * 100, 1)) + '%), ' + \
+               str(stats['num_cached']) + '/' + str(stats['num_slots']) + ' slots of ' + \
+               str(round(stats['sample_nbytes'] / 2**20, 2)) + ' MB used'
@@ -1,8 +1,6 @@
 from autograd import grad
 import autograd.numpy as np  # Thinly-wrapped numpy
 from autograd.builtins import list
-from matplotlib import pyplot as plt
-from mpl_toolkits.mplot3d import axes3d, Axes3D #<-- Note the capitalization!
 
 # hand 'canonical' pose is:
 #   Hand root (wrist) in origin
@@ -11,6 +9,8 @@ from mpl_toolkits.mplot3d import axes3d, Axes3D #<-- Note the capitalization!
 # bones start as a vector [bone_length, 0., 0.] before being rotated
 
 def plot_bone_lines(bone_lines, fig=None, show=True, lim=200):
+    from matplotlib import pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D
     if fig is None:
         fig = plt.figure()
     ax = Axes3D(fig)
@@ -36,6 +36,8 @@ def plot_bone_lines(bone_lines, fig=None, show=True, lim=200):
     return fig
 
 def plot_hand_matrix(hand_matrix, fig=None, show=True, lim=200):
+    from matplotlib import pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D
     if fig is None:
         fig = plt.figure()
     ax = Axes3D(fig)
@@ -234,6 +236,7 @@ def Theta_to_hand_matrix(Theta, bones_lengths, fingers_angles):
     return hand_matrix
 
 def animate_skeleton(pausing=0.001):
+    from matplotlib import pyplot as plt
     bones_lengths = get_bones_lengths()
     fingers_angles = get_fingers_angles_canonical()
     fig = None
@@ -346,38 +349,36 @@ def fit_skeleton(loss_func, target_matrix, bones_lengths, fingers_angles, Theta_
     print('Theta:\n{}'.format(theta))
     return theta, losses
 
-#animate_skeleton()
+def main():
+    #animate_skeleton()
 
-Theta_lims = get_Theta_lims()
-bones_lengths = get_bones_lengths()
-fingers_angles = get_fingers_angles_canonical()
-
-Theta = np.array([0.1] * 23)
-print(Theta)
-hand_seq = get_hand_seq(Theta, bones_lengths, fingers_angles)
-#plot_bone_lines(hand_seq)
-
-hand_matrix = Theta_to_hand_matrix(Theta, bones_lengths, fingers_angles)
-print(hand_matrix)
-
-target_matrix = get_example_target_matrix2()
-print(target_matrix)
-#plot_hand_matrix(target_matrix)
+    Theta_lims = get_Theta_lims()
+    bones_lengths = get_bones_lengths()
+    fingers_angles = get_fingers_angles_canonical()
 
-loss = E_pos3D(Theta, target_matrix, bones_lengths, fingers_angles)
-print(loss)
+    Theta = np.array([0.1] * 23)
+    print(Theta)
 
-Theta_fit, losses = fit_skeleton(Epsilon_Loss, target_matrix, bones_lengths, fingers_angles, Theta_lims,
-                         initial_theta=Theta, num_iter=1000, log_interval=10, lr=2e-5)
-hand_seq_fit = get_hand_seq(Theta_fit, bones_lengths, fingers_angles)
+    hand_matrix = Theta_to_hand_matrix(Theta, bones_lengths, fingers_angles)
+    print(hand_matrix)
 
-hand_matrix = Theta_to_hand_matrix(Theta, bones_lengths, fingers_angles)
-print(hand_matrix)
+    target_matrix = get_example_target_matrix2()
+    print(target_matrix)
+    #plot_hand_matrix(target_matrix)
 
+    loss = E_pos3D(Theta, target_matrix, bones_lengths, fingers_angles)
+    print(loss)
 
-plot_hand_matrix(target_matrix)
-plot_bone_lines(hand_seq_fit)
+    Theta_fit, losses = fit_skeleton(Epsilon_Loss, target_matrix, bones_lengths, fingers_angles, Theta_lims,
+                             initial_theta=Theta, num_iter=1000, log_interval=10, lr=2e-5)
+    hand_seq_fit = get_hand_seq(Theta_fit, bones_lengths, fingers_angles)
 
+    hand_matrix = Theta_to_hand_matrix(Theta, bones_lengths, fingers_angles)
+    print(hand_matrix)
 
+    plot_hand_matrix(target_matrix)
+    plot_bone_lines(hand_seq_fit)
 
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+import argparse
+import multiprocessing as mp
+import os
+import numpy as np
+import camera
+import dataset_handler
+import egodexter_handler
+import io_image
+import synthhands_handler
+
+DATASETS = ['synthhands', 'egodexter']
+ORIG_RES = (640, 480)
+SKIN_COLOR = [200, 150, 120]
+JOINT_RADIUS = 8
+# discs drawn along each bone, besides the ones at its joints
+NUM_BONE_DISCS = 3
+# (parent, child) joints of the bones, in SynthHands order: each finger's first joint hangs from the hand root
+HAND_BONES = [(0 if joint_ix % 4 == 1 else joint_ix - 1, joint_ix) for joint_ix in range(1, 21)]
+FINGERTIP_JOINT_IXS = [4, 8, 12, 16, 20]
+# hand root position limits (mm, depth camera space); far enough for a stretched hand to stay in view
+HANDROOT_LIMS = np.array([[-30., 30.], [-30., 30.], [550., 750.]])
+SYNTHHANDS_SEQUENCE_FOLDER = 'synthetic_noobject/seq{:02d}/cam01/01/'
+EGODEXTER_SPLIT_FILENAME = 'egodexter_split_10.p'
+
+
+def get_pose_trajectory(num_frames, rng, step=0.05):
+    '''
+    Random walk of a hand, smooth over frames and within the skeleton_fitter joint limits
+    :param step: standard deviation of the change of pose between frames (radians of the walk's phase)
+    :return: (num_frames, 27) poses: skeleton_fitter Theta (23 joint angles), rotation around the camera axis
+        and hand root position (mm)
+    '''
+    import skeleton_fitter
+    lims = np.vstack([skeleton_fitter.get_Theta_lims(), [[0., 2 * np.pi]], HANDROOT_LIMS])
+    phases = rng.uniform(0, 2 * np.pi, size=lims.shape[0]) + \
+        np.cumsum(rng.normal(0, step, size=(num_frames, lims.shape[0])), axis=0)
+    return lims[:, 0] + (lims[:, 1] - lims[:, 0]) * (0.5 + 0.5 * np.sin(phases))
+
+
+def get_hand_joints(pose):
+    '''
+    :param pose: a pose of get_pose_trajectory
+    :return: (21, 3) joints (mm, depth camera space) in SynthHands order:
+        hand root, then 4 joints per finger from thumb to little finger
+    '''
+    import skeleton_fitter
+    hand_matrix = skeleton_fitter.Theta_to_hand_matrix(pose[:23], skeleton_fitter.get_bones_lengths(),
+                                                       skeleton_fitter.get_fingers_angles_canonical())
+    cos_angle, sin_angle = np.cos(pose[23]), np.sin(pose[23])
+    rot_camera_axis = np.array([[cos_angle, -sin_angle, 0.], [sin_angle, cos_angle, 0.], [0., 0., 1.]])
+    joints = np.vstack([np.zeros((1, 3)), np.dot(np.array(hand_matrix), rot_camera_axis.T)])
+    return joints + pose[24:27]
+
+
+def render_hand(joints, rng, res=ORIG_RES, depth_intr_mtx=synthhands_handler.DEPTH_INTR_MTX):
+    '''
+    Draws discs at the joints and along the bones on noise, nearest on top
+    :return: (U, V, 3) uint8 color image and (U, V) uint8 depth image (hand near, background far)
+    '''
+    color_image = rng.randint(0, 60, size=(res[0], res[1], 3)).astype(np.uint8)
+    depth_image = np.full(res, 255, dtype=np.uint8)
+    joints_uvz = camera.joints_depth2color(joints, depth_intr_mtx)
+    discs = [joints_uvz]
+    for disc_ix in range(1, NUM_BONE_DISCS + 1):
+        t = disc_ix / (NUM_BONE_DISCS + 1.)
+        discs += [(1 - t) * joints_uvz[parent_ix] + t * joints_uvz[child_ix] for parent_ix, child_ix in HAND_BONES]
+    discs = np.vstack(discs)
+    offsets = np.arange(-JOINT_RADIUS, JOINT_RADIUS + 1)
+    disc_mask = offsets[:, None] ** 2 + offsets[None, :] ** 2 <= JOINT_RADIUS ** 2
+    for u, v, z in discs[np.argsort(-discs[:, 2])]:
+        grid_u = int(u) + offsets[:, None]
+        grid_v = int(v) + offsets[None, :]
+        mask = disc_mask & (grid_u >= 0) & (grid_u < res[0]) & (grid_v >= 0) & (grid_v < res[1])
+        mask_u, mask_v = np.broadcast_to(grid_u, mask.shape)[mask], np.broadcast_to(grid_v, mask.shape)[mask]
+        color_image[mask_u, mask_v] = SKIN_COLOR
+        depth_image[mask_u, mask_v] = np.clip(z / 4., 0, 254)
+    return color_image, depth_image
+
+
+def get_depth_filepath(root_folder, filenamebase, dataset_name):
+    if dataset_name == 'synthhands':
+        return root_folder + filenamebase + '_depth.png'
+    # EgoDexter keeps the depth images in a sibling folder of the color on depth ones
+    filenamebase_split = filenamebase.split('/')
+    return root_folder + '/'.join(filenamebase_split[0:1]) + '/depth/' + filenamebase_split[-1] + '_depth.png'
+
+
+def write_frame(root_folder, filenamebase, joints, rng, dataset_name='synthhands'):
+    '''
+    Writes the color on depth and depth images of a hand, and its joints file for SynthHands
+    (EgoDexter keeps its labels in per sequence annotation files)
+    '''
+    color_image, depth_image = render_hand(joints, rng)
+    io_image.write_RGB_image(root_folder + filenamebase + '_color_on_depth.png', color_image)
+    io_image.write_RGB_image(get_depth_filepath(root_folder, filenamebase, dataset_name), depth_image)
+    if dataset_name == 'synthhands':
+        with open(root_folder + filenamebase + '_joint_pos.txt', 'w') as f:
+            f.write(','.join(str(coord) for coord in joints.flatten()) + '\n')
+
+
+def _write_chunk(args):
+    chunk_ix, root_folder, filenamebases, poses, dataset_name, seed = args
+    # image noise of a chunk only depends on the seed and the chunk, not on which process writes it
+    rng = np.random.RandomState([seed, chunk_ix])
+    chunk_joints = np.zeros((len(filenamebases), 21, 3))
+    for i, filenamebase in enumerate(filenamebases):
+        chunk_joints[i] = get_hand_joints(poses[i])
+        write_frame(root_folder, filenamebase, chunk_joints[i], rng, dataset_name=dataset_name)
+    return chunk_ix, chunk_joints
+
+
+def write_frames(root_folder, filenamebases, poses, dataset_name, seed=0, chunk_size=100, num_processes=None,
+                 verbose=False):
+    '''
+    Renders and writes frames, chunk_size frames at a time in a process pool
+    Same seed, same frames, whatever the number of processes
+    :return: (N, 21, 3) joints of the frames
+    '''
+    chunks = [(chunk_ix, root_folder, filenamebases[i:i + chunk_size], poses[i:i + chunk_size], dataset_name, seed)
+              for chunk_ix, i in enumerate(range(0, len(filenamebases), chunk_size))]
+    joints = np.zeros((len(filenamebases), 21, 3))
+    if num_processes is None:
+        num_processes = mp.cpu_count()
+    if num_processes > 1 and len(chunks) > 1:
+        pool = mp.Pool(processes=min(num_processes, len(chunks)))
+        written_chunks = pool.imap_unordered(_write_chunk, chunks)
+    else:
+        pool = None
+        written_chunks = map(_write_chunk, chunks)
+    num_written = 0
+    try:
+        for chunk_ix, chunk_joints in written_chunks:
+            joints[chunk_ix * chunk_size:chunk_ix * chunk_size + chunk_joints.shape[0]] = chunk_joints
+            num_written += chunk_joints.shape[0]
+            if verbose:
+                print("\rWritten frames: " + str(num_written) + '/' + str(len(filenamebases)), end='')
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if verbose:
+        print('')
+    return joints
+
+
+def get_sequence_lengths(num_frames, num_sequences):
+    return [num_frames // num_sequences + (1 if seq_ix < num_frames % num_sequences else 0)
+            for seq_ix in range(num_sequences)]
+
+
+def get_poses(sequence_lengths, seed):
+    rng = np.random.RandomState(seed)
+    return np.vstack([get_pose_trajectory(sequence_length, rng) for sequence_length in sequence_lengths])
+
+
+def make_synthhands_dataset(root_folder, num_frames=20, num_sequences=1, seed=0,
+                            splitfilename='dataset_split_files.p', perc_train=0.7, perc_valid=0.15,
+                            chunk_size=100, num_processes=None, verbose=False):
+    '''
+    Writes a SynthHands-layout dataset of random hands, num_frames split into num_sequences sequences of
+    smoothly moving hands: root_folder/synthetic_noobject/seq<NN>/cam01/01/<frame>_color_on_depth.png,
+    _depth.png and _joint_pos.txt, and its split file (as dataset_handler.dataset_save_split)
+    Same seed, same dataset
+    :return: filenamebases of the frames
+    '''
+    root_folder = os.path.join(root_folder, '')
+    sequence_lengths = get_sequence_lengths(num_frames, num_sequences)
+    filenamebases = []
+    for seq_ix, sequence_length in enumerate(sequence_lengths):
+        sequence_folder = SYNTHHANDS_SEQUENCE_FOLDER.format(seq_ix + 1)
+        os.makedirs(root_folder + sequence_folder, exist_ok=True)
+        filenamebases += [sequence_folder + str(frame_ix).zfill(synthhands_handler.SPLIT_PREFIX_LENGTH)
+                          for frame_ix in range(sequence_length)]
+    write_frames(root_folder, filenamebases, get_poses(sequence_lengths, seed), 'synthhands', seed=seed,
+                 chunk_size=chunk_size, num_processes=num_processes, verbose=verbose)
+    # dataset_save_split shuffles with the global numpy generator
+    np.random.seed(seed)
+    dataset_handler.dataset_save_split(root_folder, splitfilename, filenamebases, None,
+                                       perc_train, perc_valid, 1. - perc_train - perc_valid)
+    return filenamebases
+
+
+def write_egodexter_annotations(root_folder, sequence_folder, joints):
+    '''
+    Writes the fingertips of the frames of a sequence as EgoDexter does, one frame per line:
+    annotation.txt with "u,v;" pixels and annotation.txt_3D.txt with "x,y,z;" positions (mm)
+    '''
+    fingertips = joints[:, FINGERTIP_JOINT_IXS, :]
+    with open(root_folder + sequence_folder + 'annotation.txt', 'w') as f:
+        for frame_fingertips in fingertips:
+            fingertips_uvz = camera.joints_depth2color(frame_fingertips, egodexter_handler.DEPTH_INTR_MTX)
+            f.write(''.join(str(int(u)) + ',' + str(int(v)) + ';' for u, v, _ in fingertips_uvz) + '\n')
+    with open(root_folder + sequence_folder + 'annotation.txt_3D.txt', 'w') as f:
+        for frame_fingertips in fingertips:
+            f.write(''.join(','.join(str(coord) for coord in fingertip) + ';' for fingertip in frame_fingertips) + '\n')
+
+
+def make_egodexter_dataset(root_folder, num_frames=100, seed=0, perc_train=0.7, perc_valid=0.15, num_splits=10,
+                           chunk_size=100, num_processes=None, verbose=False):
+    '''
+    Writes an EgoDexter-layout dataset of random hands, num_frames split into the sequences EgoDexterDataset
+    reads (Desk/, Fruits/...): <sequence>/color_on_depth/image_<frame>_color_on_depth.png,
+    <sequence>/depth/image_<frame>_depth.png, <sequence>/annotation.txt and annotation.txt_3D.txt,
+    and its split files: egodexter_handler.DATASET_SPLIT_FILENAME (training, validation and test)
+    and egodexter_split_10.p (num_splits splits, the default of EgoDexterDataset)
+    EgoDexterDataset reads its first 10 examples when built, so each split it loads needs at least 10 frames
+    Same seed, same dataset
+    :return: filenamebases of the frames
+    '''
+    root_folder = os.path.join(root_folder, '')
+    sequence_folders = egodexter_handler.EgoDexterDataset.data_folders
+    sequence_lengths = get_sequence_lengths(num_frames, len(sequence_folders))
+    filenamebases = []
+    for sequence_folder, sequence_length in zip(sequence_folders, sequence_lengths):
+        os.makedirs(root_folder + sequence_folder + 'color_on_depth', exist_ok=True)
+        os.makedirs(root_folder + sequence_folder + 'depth', exist_ok=True)
+        # EgoDexterDataset takes the annotation line of a frame from the last 5 characters of its name
+        filenamebases += [sequence_folder + 'color_on_depth/image_' + str(frame_ix).zfill(5)
+                          for frame_ix in range(sequence_length)]
+    joints = write_frames(root_folder, filenamebases, get_poses(sequence_lengths, seed), 'egodexter', seed=seed,
+                          chunk_size=chunk_size, num_processes=num_processes, verbose=verbose)
+    start_ix = 0
+    for sequence_folder, sequence_length in zip(sequence_folders, sequence_lengths):
+        write_egodexter_annotations(root_folder, sequence_folder, joints[start_ix:start_ix + sequence_length])
+        start_ix += sequence_length
+    # the split functions shuffle with the global numpy generator
+    np.random.seed(seed)
+    dataset_handler.dataset_save_split(root_folder, egodexter_handler.DATASET_SPLIT_FILENAME, filenamebases, None,
+                                       perc_train, perc_valid, 1. - perc_train - perc_valid)
+    np.random.seed(seed)
+    dataset_handler.dataset_n_splits(root_folder, EGODEXTER_SPLIT_FILENAME, filenamebases, None, num_splits)
+    return filenamebases
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Write a synthetic dataset of random hands in the SynthHands '
+                                                 'or EgoDexter layout, for running the data pipeline, '
+                                                 'benchmarks and load tests offline')
+    parser.add_argument('-r', dest='root_folder', required=True, help='Root folder to write the dataset to')
+    parser.add_argument('--dataset', dest='dataset_name', default='synthhands', choices=DATASETS,
+                        help='Layout of the dataset (default synthhands)')
+    parser.add_argument('--num_frames', dest='num_frames', type=int, default=20,
+                        help='Number of frames (default 20)')
+    parser.add_argument('--num_sequences', dest='num_sequences', type=int, default=1,
+                        help='Number of sequences the frames are split into, for SynthHands (default 1; '
+                             'EgoDexter has its 4 sequences)')
+    parser.add_argument('--seed', dest='seed', type=int, default=0, help='Random seed (default 0)')
+    parser.add_argument('--chunk_size', type=int, dest='chunk_size', default=100,
+                        help='Number of frames written at once by each process (default 100)')
+    parser.add_argument('--num_processes', type=int, dest='num_processes', default=None,
+                        help='Number of processes (default: number of CPUs)')
+    parser.add_argument('-v', '--verbose', dest='verbose', action='store_true', default=True,
+                        help='Verbose mode')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.dataset_name == 'synthhands':
+        make_synthhands_dataset(args.root_folder, num_frames=args.num_frames, num_sequences=args.num_sequences,
+                                seed=args.seed, chunk_size=args.chunk_size, num_processes=args.num_processes,
+                                verbose=args.verbose)
+    else:
+        make_egodexter_dataset(args.root_folder, num_frames=args.num_frames, seed=args.seed,
+                               chunk_size=args.chunk_size, num_processes=args.num_processes, verbose=args.verbose)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,8 +5,8 @@ import torch
 from torch.utils.data.dataset import Dataset
 import converter as conv
 from dataset_handler import load_dataset_split
-from io_image import read_RGB_image, crop_image_get_labels, get_crop_coords
-from scipy.spatial.distance import pdist, squareform
+from sample_cache import SharedSampleCache
+from io_image import read_RGBD_image, crop_image_get_labels, get_crop_coords
 #import visualize
 
 SPLIT_PREFIX_LENGTH = 8
@@ -30,6 +30,9 @@ PROJECT_MTX =    np.array([[1.0, 0.0, 0.0, 0.0],
 
 DATASET_SPLIT_FILENAME = 'dataset_split_synthhands.p'
 
+# joint pairs in condensed (pdist) order: (0,1), (0,2), ..., (19,20)
+JOINT_PAIRS_I, JOINT_PAIRS_J = np.triu_indices(21, k=1)
+
 def get_finger_name_from_joint_ix(joint_ix):
     finger_name = ''
     if joint_ix == 0:
@@ -59,42 +62,38 @@ def get_joint_name_from_ix(joint_ix):
     return joint_name
 
 def _get_joint_prior(dataset_folder,  prior_file_name):
-    joint_prior_dict = pickle.load(open(dataset_folder + prior_file_name, "rb"))
-    joint_prior = joint_prior_dict['pair_dist_prob']
+    '''
+    Loads a joint-pair distance prior built by joint_prior.py (.npz) or a legacy pickle
+    '''
+    if prior_file_name.endswith('.npz'):
+        with np.load(dataset_folder + prior_file_name) as joint_prior_file:
+            joint_prior = joint_prior_file['pair_dist_count'].astype(np.float64)
+    else:
+        joint_prior_dict = pickle.load(open(dataset_folder + prior_file_name, "rb"))
+        joint_prior = joint_prior_dict['pair_dist_prob']
     joint_prior /= joint_prior.sum()
     joint_prior = torch.from_numpy(joint_prior).float()
     return joint_prior
 
-def _get_joints_dist_posterior(target_joints):
-    joint_posterior = pair_dist_prob = np.zeros((210, 300))
-    D = squareform(pdist(target_joints.reshape((21, 3))))
-    ix_pair = 0
-    for i in range(D.shape[0]):
-        j = i + 1
-        while j < D.shape[1]:
-            # print('(' + str(i) + ', ' + str(j) + '): ' + str(D[i, j]))
-            dist = D[i, j]
-            pair_dist_prob[ix_pair, int(dist)] = 1
-            j += 1
-            ix_pair += 1
-    joint_posterior = torch.from_numpy(joint_posterior).float()
-    return joint_posterior
-
-def _get_data(root_folder, filenamebase, new_res, as_torch=True, depth_suffix='_depth.png', color_on_depth_suffix='_color_on_depth.png'):
-    # load color
+def _get_joints_dist_posterior(target_joints, max_dist_span=300):
+    '''
+    :param target_joints: 21 x 3 joint positions (in mm)
+    :return: 210 int64 tensor with the 1mm distance bin of each joint pair (pdist order),
+        distances beyond max_dist_span go to the last bin
+    '''
+    joints = target_joints.reshape((21, 3))
+    pair_dists = np.linalg.norm(joints[JOINT_PAIRS_I] - joints[JOINT_PAIRS_J], axis=1)
+    dist_bins = np.clip(pair_dists.astype(np.int64), 0, max_dist_span - 1)
+    return torch.from_numpy(dist_bins)
+
+def _get_data(root_folder, filenamebase, new_res, as_torch=True, depth_suffix='_depth.png', color_on_depth_suffix='_color_on_depth.png', out=None):
     color_on_depth_image_filename = root_folder + filenamebase + color_on_depth_suffix
-    color_on_depth_image = read_RGB_image(color_on_depth_image_filename, new_res=new_res)
-    # load depth
     depth_image_filename = root_folder + filenamebase + depth_suffix
-    depth_image = read_RGB_image(depth_image_filename, new_res=new_res)
-    depth_image = np.array(depth_image)
-    depth_image = np.reshape(depth_image, (depth_image.shape[0], depth_image.shape[1], 1))
-    # get data
-    RGBD_image = np.concatenate((color_on_depth_image, depth_image), axis=-1)
-    RGBD_image = RGBD_image.swapaxes(1, 2).swapaxes(0, 1)
-    data = RGBD_image
+    # decode color and depth into one contiguous (4, U, V) array
+    # float conversion is left to converter.batch_to_device_float
+    data = read_RGBD_image(color_on_depth_image_filename, depth_image_filename, new_res=new_res, out=out)
     if as_torch:
-        data = torch.from_numpy(RGBD_image).float()
+        data = torch.from_numpy(data)
     return data
 
 def get_labels_depth_and_color(root_folder, filenamebase, label_suffix='_joint_pos.txt'):
@@ -168,7 +167,7 @@ def _get_data_labels(root_folder, idx, filenamebases, heatmap_res, joint_ixs, fl
         labels_jointvec, handroot = get_labels_jointvec(labels_jointspace, joint_ixs, rel_root=True)
         data, crop_coords, labels_heatmaps, labels_colorspace =\
             crop_image_get_labels(data, labels_colorspace, joint_ixs)
-        data = torch.from_numpy(data).float()
+        data = torch.from_numpy(data)
         labels_heatmaps = torch.from_numpy(labels_heatmaps).float()
         labels_jointvec = torch.from_numpy(labels_jointvec).float()
     else:
@@ -242,9 +241,10 @@ class SynthHandsDataset(Dataset):
     dataset_folder = ''
     heatmap_res = None
     crop_hand = False
+    cache = None
 
     def __init__(self, root_folder, type_, joint_ixs=range(21), heatmap_res=(320, 240),
-                 split_ix=0, crop_hand=False, splitfilename='dataset_split_files.p'):
+                 split_ix=0, crop_hand=False, splitfilename='dataset_split_files.p', cache_bytes=0):
         self.type = type_
         self.joint_ixs = joint_ixs
         self.num_splits = 0
@@ -260,11 +260,27 @@ class SynthHandsDataset(Dataset):
         self.dataset_folder = root_folder
         self.heatmap_res = heatmap_res
         self.crop_hand = crop_hand
-
-    def __getitem__(self, idx):
+        if cache_bytes > 0:
+            self.enable_cache(cache_bytes)
+
+    def enable_cache(self, max_bytes):
+        '''
+        Keeps up to max_bytes of decoded samples in shared memory
+        Must be called before the dataset is handed to a DataLoader, so that all
+        worker processes share the same cache
+        '''
+        self.cache = SharedSampleCache(max_bytes, self._get_item(0), self.length)
+        return self.cache
+
+    def _get_item(self, idx):
         return _get_data_labels(self.dataset_folder, idx, self.filenamebases,
                                 self.heatmap_res, self.joint_ixs, flag_crop_hand=self.crop_hand)
 
+    def __getitem__(self, idx):
+        if self.cache is None:
+            return self._get_item(idx)
+        return self.cache.get_or_compute(idx, self._get_item)
+
     def get_filenamebase(self, idx):
         return self.filenamebases[idx]
 
@@ -332,13 +348,9 @@ class SynthHandsDataset_prior(SynthHandsDataset):
     dataset_folder = ''
     heatmap_res = None
     crop_hand = False
-    prior_file_name = 'joint_prior.p'
+    prior_file_name = 'joint_prior.npz'
 
-    def __init__(self, root_folder, joint_ixs, type, heatmap_res, crop_hand):
-        super(SynthHandsDataset_prior, self).__init__(root_folder, joint_ixs, type, heatmap_res, crop_hand)
-        #self.joint_prior = _get_joint_prior(self.dataset_folder, self.prior_file_name)
-
-    def __getitem__(self, idx):
+    def _get_item(self, idx):
         data, labels = _get_data_labels(self.dataset_folder, idx, self.filenamebases,
                                 self.heatmap_res, self.joint_ixs, flag_crop_hand=self.crop_hand)
         labels_list = list(labels)
@@ -361,25 +373,40 @@ class SynthHandsTestDataset(SynthHandsDataset):
 class SynthHandsFullDataset(SynthHandsDataset):
     type = 'full'
 
-def _get_SynthHands_loader(root_folder, joint_ixs, heatmap_res, crop_hand, verbose, type, batch_size=1):
+def _get_SynthHands_loader(root_folder, joint_ixs, heatmap_res, dataset_type, crop_hand, verbose, type, batch_size=1,
+                           cache_bytes=0, num_workers=0, world_size=1, rank=0):
     list_of_types = ['prior', 'train', 'test', 'valid', 'full']
     if verbose:
         print("Loading synthhands " + type + " dataset...")
     dataset_class = SynthHandsDataset
+    if dataset_type == 'prior':
+        dataset_class = SynthHandsDataset_prior
     if not type in list_of_types:
         raise BaseException('Type ' + type + ' does not exist. Valid types are: ' + str(list_of_types))
-    dataset = dataset_class(root_folder, type, joint_ixs, heatmap_res, crop_hand)
+    dataset = dataset_class(root_folder=root_folder, type_=type, joint_ixs=joint_ixs,
+                            heatmap_res=heatmap_res, crop_hand=crop_hand, cache_bytes=cache_bytes)
+    sampler = None
+    if world_size > 1:
+        import distributed
+        sampler = distributed.get_sampler(dataset, world_size, rank)
     dataset_loader = torch.utils.data.DataLoader(
         dataset,
         batch_size=batch_size,
-        shuffle=False)
+        shuffle=False,
+        sampler=sampler,
+        num_workers=num_workers)
     if verbose:
         data_example, label_example = dataset[0]
-        labels_colorspace, labels_jointvec, labels_heatmaps, handroot = label_example
+        labels_colorspace, labels_jointvec, labels_heatmaps, handroot = label_example[0:4]
         print("Synthhands " + type + " dataset loaded with " + str(len(dataset)) + " examples")
+        if not sampler is None:
+            print("\tSharded across " + str(world_size) + " processes: " + str(len(sampler)) + " examples each")
         print("\tExample shape: " + str(data_example.shape))
         print("\tLabel heatmap shape: " + str(labels_heatmaps.shape))
         print("\tLabel joint vector shape (N_JOINTS * 3): " + str(labels_jointvec.shape))
+        if not dataset.cache is None:
+            print("\tSample cache: " + str(dataset.cache.num_slots) + " slots of " +
+                  str(round(dataset.cache.sample_nbytes / 2**20, 2)) + " MB")
     return dataset_loader
 
 def get_SynthHands_boundbox_loader(root_folder, heatmap_res, verbose, type, batch_size=1):
@@ -404,14 +431,22 @@ def get_SynthHands_boundbox_loader(root_folder, heatmap_res, verbose, type, batc
         print("\tHand root shape: " + str(handroot.shape))
     return dataset_loader
 
-def get_SynthHands_trainloader(root_folder, joint_ixs=range(21), heatmap_res=(320, 240), dataset_type='normal', crop_hand=False, batch_size=1, verbose=False):
-    return _get_SynthHands_loader(root_folder, joint_ixs, heatmap_res, dataset_type, crop_hand, verbose, 'train', batch_size)
-
-def get_SynthHands_validloader(root_folder, joint_ixs=range(21), heatmap_res=(320, 240), dataset_type='normal', crop_hand=False, batch_size=1, verbose=False):
-    return _get_SynthHands_loader(root_folder, joint_ixs, heatmap_res, dataset_type, crop_hand, verbose, 'valid', batch_size)
-
-def get_SynthHands_testloader(root_folder, joint_ixs=range(21), heatmap_res=(320, 240), dataset_type='normal', crop_hand=False, batch_size=1, verbose=False):
-    return _get_SynthHands_loader(root_folder, joint_ixs, heatmap_res, dataset_type, crop_hand, verbose, 'test', batch_size)
-
-def get_SynthHands_fullloader(root_folder, joint_ixs=range(21), heatmap_res=(320, 240), dataset_type='normal', crop_hand=False, batch_size=1, verbose=False):
-    return _get_SynthHands_loader(root_folder, joint_ixs, heatmap_res, dataset_type, crop_hand, verbose, 'full', batch_size)
+def get_SynthHands_trainloader(root_folder, joint_ixs=range(21), heatmap_res=(320, 240), dataset_type='normal', crop_hand=False, batch_size=1, verbose=False,
+                             cache_bytes=0, num_workers=0, world_size=1, rank=0):
+    return _get_SynthHands_loader(root_folder, joint_ixs, heatmap_res, dataset_type, crop_hand, verbose, 'train', batch_size,
+                                  cache_bytes=cache_bytes, num_workers=num_workers, world_size=world_size, rank=rank)
+
+def get_SynthHands_validloader(root_folder, joint_ixs=range(21), heatmap_res=(320, 240), dataset_type='normal', crop_hand=False, batch_size=1, verbose=False,
+                             cache_bytes=0, num_workers=0):
+    return _get_SynthHands_loader(root_folder, joint_ixs, heatmap_res, dataset_type, crop_hand, verbose, 'valid', batch_size,
+                                  cache_bytes=cache_bytes, num_workers=num_workers)
+
+def get_SynthHands_testloader(root_folder, joint_ixs=range(21), heatmap_res=(320, 240), dataset_type='normal', crop_hand=False, batch_size=1, verbose=False,
+                             cache_bytes=0, num_workers=0):
+    return _get_SynthHands_loader(root_folder, joint_ixs, heatmap_res, dataset_type, crop_hand, verbose, 'test', batch_size,
+                                  cache_bytes=cache_bytes, num_workers=num_workers)
+
+def get_SynthHands_fullloader(root_folder, joint_ixs=range(21), heatmap_res=(320, 240), dataset_type='normal', crop_hand=False, batch_size=1, verbose=False,
+                             cache_bytes=0, num_workers=0):
+    return _get_SynthHands_loader(root_folder, joint_ixs, heatmap_res, dataset_type, crop_hand, verbose, 'full', batch_size,
+                                  cache_bytes=cache_bytes, num_workers=num_workers)
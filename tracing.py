@@ -0,0 +1,215 @@
+import collections
+import json
+import os
+import threading
+import time
+import numpy as np
+import benchmarker
+
+STATS_COLUMNS = ['phase', 'count', 'mean_ms', 'p50_ms', 'p95_ms', 'ms_per_iter', 'share']
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.tracer._sync()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.tracer._sync()
+        self.tracer.add(self.name, self.start, time.perf_counter())
+        return False
+
+
+class Tracer:
+    '''
+    Named spans around the phases of a training step, e.g.:
+        with tracer.span('forward'):
+            output = model(data)
+    Keeps, for each phase, the durations of its last window spans (for rolling p50/p95) and its total
+    time in each of the last window iterations (end_iter marks the end of an optimiser iteration)
+    Spans may nest (a nested span's time also counts for the enclosing one)
+    Optionally records every span of iterations trace_start_iter to trace_start_iter + trace_num_iter - 1
+    and writes them to trace_filepath as a Chrome trace (chrome://tracing or https://ui.perfetto.dev)
+    A disabled tracer does nothing (its spans are a shared no-op context manager)
+    '''
+    def __init__(self, enabled=True, window=100, trace_filepath='', trace_start_iter=1, trace_num_iter=0,
+                 sync_cuda=False, pid=0, verbose=True):
+        '''
+        :param sync_cuda: whether to wait for queued cuda work at span boundaries, so spans time the work
+            and not just its launch (serialises cpu and gpu, so steps get slower)
+        :param pid: process id in the Chrome trace (e.g. the rank in distributed training)
+        '''
+        self.enabled = enabled
+        self.window = window
+        self.trace_filepath = trace_filepath
+        self.trace_start_iter = trace_start_iter
+        self.trace_num_iter = trace_num_iter if not trace_filepath == '' else 0
+        self.sync_cuda = sync_cuda
+        self.pid = pid
+        self.verbose = verbose
+        self.span_ms = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self.iter_ms = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self.curr_iter_ms = collections.defaultdict(float)
+        self.num_iter = 0
+        self.time_origin = time.perf_counter()
+        self.iter_start = None
+        self.curr_iter = None
+        self.tracing = False
+        self.trace_events = []
+        self.lock = threading.Lock()
+
+    def _sync(self):
+        if self.sync_cuda:
+            import torch
+            torch.cuda.synchronize()
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def add(self, name, start, end, args=None):
+        '''
+        Records a span from perf_counter times start to end
+        '''
+        duration_ms = (end - start) * 1000.
+        with self.lock:
+            self.span_ms[name].append(duration_ms)
+            self.curr_iter_ms[name] += duration_ms
+            if self.tracing:
+                self.trace_events.append((name, start, end, threading.get_ident(), args))
+
+    def iter_loader(self, loader, name='data_wait'):
+        '''
+        Iterates over a loader, timing the wait for each of its batches as a span
+        '''
+        iterator = iter(loader)
+        while True:
+            start = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            if self.enabled:
+                self.add(name, start, time.perf_counter())
+            yield batch
+
+    def _is_traced(self, curr_iter):
+        return self.trace_start_iter <= curr_iter < self.trace_start_iter + self.trace_num_iter
+
+    def start_iter(self, curr_iter):
+        '''
+        Marks the start of optimiser iteration curr_iter (spans before it are not part of an iteration)
+        '''
+        if not self.enabled:
+            return
+        self.curr_iter = curr_iter
+        self.iter_start = time.perf_counter()
+        self.tracing = self._is_traced(curr_iter)
+
+    def end_iter(self, curr_iter):
+        '''
+        Marks the end of optimiser iteration curr_iter and the start of the next one
+        '''
+        if not self.enabled:
+            return
+        end = time.perf_counter()
+        if self.iter_start is not None:
+            self.add('iteration', self.iter_start, end, args={'iter': curr_iter})
+        with self.lock:
+            for name in set(self.iter_ms.keys()) | set(self.curr_iter_ms.keys()):
+                self.iter_ms[name].append(self.curr_iter_ms.get(name, 0.))
+            self.curr_iter_ms.clear()
+            self.num_iter += 1
+        was_tracing = self.tracing
+        self.start_iter(curr_iter + 1)
+        if was_tracing and not self.tracing:
+            self.write_trace()
+
+    def get_iter_ms(self):
+        '''
+        :return: dict of the time (ms) of each phase so far in the current iteration
+        '''
+        with self.lock:
+            return dict(self.curr_iter_ms)
+
+    def get_stats(self):
+        '''
+        :return: list of dicts with, for each phase, the number of spans in the window, their mean,
+            p50 and p95 durations, and mean time per iteration and its share of the iteration
+        '''
+        with self.lock:
+            span_ms = {name: np.array(durations) for name, durations in self.span_ms.items()}
+            # phases first seen less than window iterations ago took no time in the iterations before
+            iter_ms = {name: float(np.sum(durations)) / min(self.num_iter, self.window)
+                       for name, durations in self.iter_ms.items()}
+        iteration_ms = iter_ms.get('iteration', 0.)
+        stats = []
+        for name, durations in span_ms.items():
+            if durations.size == 0:
+                continue
+            ms_per_iter = iter_ms.get(name, 0.)
+            stats.append({
+                'phase': name,
+                'count': int(durations.size),
+                'mean_ms': float(np.mean(durations)),
+                'p50_ms': float(np.percentile(durations, 50)),
+                'p95_ms': float(np.percentile(durations, 95)),
+                'ms_per_iter': ms_per_iter,
+                'share': ms_per_iter / iteration_ms if iteration_ms > 0 else 0.,
+            })
+        return stats
+
+    def format_stats(self):
+        return benchmarker.format_table(self.get_stats(), STATS_COLUMNS)
+
+    def get_trace(self):
+        '''
+        :return: recorded spans as a dict in the Chrome trace event format (complete events, in microseconds)
+        '''
+        with self.lock:
+            trace_events = list(self.trace_events)
+        thread_ids = {}
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': 'rank ' + str(self.pid)}}]
+        for name, start, end, thread_ident, args in trace_events:
+            event = {'name': name, 'cat': 'train', 'ph': 'X', 'pid': self.pid,
+                     'tid': thread_ids.setdefault(thread_ident, len(thread_ids)),
+                     'ts': (start - self.time_origin) * 1e6, 'dur': (end - start) * 1e6}
+            if args is not None:
+                event['args'] = args
+            events.append(event)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_trace(self, filepath=None):
+        filepath = self.trace_filepath if filepath is None else filepath
+        if filepath == '':
+            return
+        with open(filepath, 'w') as f:
+            json.dump(self.get_trace(), f)
+        if self.verbose:
+            print("\nWrote trace of iterations " + str(self.trace_start_iter) + " to " +
+                  str(self.trace_start_iter + self.trace_num_iter - 1) + ": " + os.path.abspath(filepath))
+        with self.lock:
+            self.trace_events = []
+
+    def close(self):
+        '''
+        Writes the spans recorded so far if training ended within the trace window
+        '''
+        if self.enabled and len(self.trace_events) > 0:
+            self.write_trace()
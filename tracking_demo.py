@@ -2,56 +2,66 @@
 # -i female_object/seq01/cam01/01/00000000 -r /home/paulo/SynthHands_Release/ --halnet /home/paulo/muellericcv2017/trainednets/trained_HALNet_1493752625_for_valid_38000.pth.tar --jornet /home/paulo/muellericcv2017/trainednets/trained_JORNet_1662451312_for_valid_70000.pth.tar
 # -i Fruits/color_on_depth/image_00000 -r /home/paulo/EgoDexter/data/ --halnet /home/paulo/muellericcv2017/trainednets/trained_HALNet_1493752625_.pth.tar --jornet /home/paulo/muellericcv2017/trainednets/trained_JORNet_1662451312_for_valid_30000.pth.tar
 
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
 import numpy as np
-
-import converter
-import trainer
+import torch
+import hand_tracker
+import inference_backends
+import pipeline
 import synthhands_handler
 import egodexter_handler
+import frame_ring
 import argparse
+import itertools
 import converter as conv
 import HALNet, JORNet
 import time
-import camera
-import visualize
-import io_image
-
-parser = argparse.ArgumentParser(description='Train a hand-tracking deep neural network')
-parser.add_argument('-i', dest='input_img_namebase', default='', type=str, required=False,
-                    help='Inpimport HALNet, JORNetut image file name base (e.g. female_noobject/seq01/cam01/01/00000000')
-parser.add_argument('-r', dest='dataset_folder', default='', type=str, required=True,
-                    help='Dataset folder')
-parser.add_argument('--halnet', dest='halnet_filepath', type=str, required=True,
-                    help='Filepath to trained HALNet checkpoint')
-parser.add_argument('--jornet', dest='jornet_filepath', type=str, required=True,
-                    help='Filepath to trained HALNet checkpoint')
-parser.add_argument('--cuda', dest='use_cuda', action='store_true', default=False,
-                    help='Whether to use cuda for training')
-parser.add_argument('-o', dest='output_filepath', default='',
-                    help='Output file for logging')
-args = parser.parse_args()
-
-dataset_name = args.dataset_folder.split('/')[-2]
 
-def print_time(str_, time_diff):
-    print(str_ + str(round(time_diff*1000)) + ' ms')
 
-# load nets
-start = time.time()
-halnet, _, _, _ = trainer.load_checkpoint(filename=args.halnet_filepath,
-                                          model_class=HALNet.HALNet,
-                                          use_cuda=args.use_cuda)
-print_time('HALNet loading: ', time.time() - start)
+def parse_args():
+    parser = argparse.ArgumentParser(description='Train a hand-tracking deep neural network')
+    parser.add_argument('-i', dest='input_img_namebase', default='', type=str, required=False,
+                        help='Input image file name base (e.g. female_noobject/seq01/cam01/01/00000000')
+    parser.add_argument('-r', dest='dataset_folder', default='', type=str, required=False,
+                        help='Dataset folder (required unless tracking from --ring)')
+    parser.add_argument('--halnet', dest='halnet_filepath', type=str, required=True,
+                        help='Filepath to trained HALNet checkpoint')
+    parser.add_argument('--jornet', dest='jornet_filepath', type=str, required=True,
+                        help='Filepath to trained HALNet checkpoint')
+    parser.add_argument('--cuda', dest='use_cuda', action='store_true', default=False,
+                        help='Whether to use cuda for training')
+    parser.add_argument('--backend', dest='backend', default='eager', choices=inference_backends.BACKENDS,
+                        help='Inference backend (default eager). For torchscript/onnx, --halnet and --jornet '
+                             'are the files written by exporter.py')
+    parser.add_argument('-o', dest='output_filepath', default='',
+                        help='Output file for logging')
+    parser.add_argument('--num_frames', dest='num_frames', type=int, default=100,
+                        help='Number of consecutive frames to track (default 100)')
+    parser.add_argument('--queue_size', dest='queue_size', type=int, default=4,
+                        help='Maximum number of frames waiting between pipeline stages (default 4)')
+    parser.add_argument('--num_threads', dest='num_threads', type=int, default=0,
+                        help='Number of torch CPU threads, shared by the HALNet and JORNet stages '
+                             '(default 0: torch default)')
+    parser.add_argument('--sequential', dest='sequential', action='store_true', default=False,
+                        help='Whether to run the stages one frame at a time instead of pipelined')
+    parser.add_argument('--ring', dest='ring_name', default='',
+                        help='Name of a shared-memory frame ring to track frames from (see frame_producer.py) '
+                             'instead of reading them from the dataset')
+    parser.add_argument('--ring_latest', dest='ring_latest', action='store_true', default=False,
+                        help='Whether to always track the newest frame in the ring, skipping older ones')
+    parser.add_argument('--no_plot', dest='plot', action='store_false', default=True,
+                        help='Whether to skip plotting the tracked frames')
+    args = parser.parse_args()
+    if not args.ring_name and not args.dataset_folder:
+        parser.error('-r is required unless tracking from --ring')
+    return args
+
 
-start = time.time()
-jornet, _, _, _ = trainer.load_checkpoint(filename=args.jornet_filepath,
-                                          model_class=JORNet.JORNet,
-                                          use_cuda=args.use_cuda)
-print_time('JORNet loading: ', time.time() - start)
+def print_time(str_, time_diff):
+    print(str_ + str(round(time_diff*1000)) + ' ms')
 
 def plot_joints(joints_colorspace, show_legend=True, linewidth=4):
+    from matplotlib import pyplot as plt
+    import matplotlib.patches as mpatches
     num_joints = joints_colorspace.shape[0]
     joints_colorspace = conv.numpy_swap_cols(joints_colorspace, 0, 1)
     plt.plot(joints_colorspace[0, 1], joints_colorspace[0, 0], 'ro', color='C0')
@@ -92,73 +102,119 @@ def get_image_as_data(dataset_folder, input_img_namebase, dataset_name, img_res)
         data = egodexter_handler.get_data(dataset_folder, input_img_namebase, img_res=img_res)
     return data
 
-def load_images_to_memory(num_images, dataset_folder, dataset_name, img_res):
+def load_images_to_memory(input_img_namebase, num_images, dataset_folder, dataset_name, img_res):
     images = []
     for i in range(num_images):
-        input_img_namebase = get_image_name(args.input_img_namebase, i, dataset_name)
-        data = get_image_as_data(dataset_folder, input_img_namebase, dataset_name, img_res)
+        image_namebase = get_image_name(input_img_namebase, i, dataset_name)
+        data = get_image_as_data(dataset_folder, image_namebase, dataset_name, img_res)
         images.append(data)
     return images
 
-start = time.time()
-images = load_images_to_memory(100, args.dataset_folder, dataset_name, (320, 240))
-print_time('Loading images to memory: ', time.time() - start)
-
-joints_colorspace = np.zeros((21, 2))
-
-for i in range(100):
-    start_beg = time.time()
-    print('--------------------------------------------------------------------------')
-    print(args.input_img_namebase)
-
-    start = time.time()
-    input_img_namebase = get_image_name(args.input_img_namebase, i, dataset_name)
-    print_time('Image reading: ', time.time() - start)
-
-    data = images[i]
-    img_numpy = data.data.numpy()
-
-    start = time.time()
-    output_halnet = halnet(conv.data_to_batch(data))
-    print_time('HALNet pass: ', time.time() - start)
-
-    start = time.time()
-    halnet_main_out = output_halnet[3][0].data.numpy()
-    handroot_colorspace = np.unravel_index(np.argmax(halnet_main_out[0]), halnet_main_out[0].shape)
-    handroot = camera.joint_color2depth(handroot_colorspace[0], handroot_colorspace[1],
-                                        300,
-                                        egodexter_handler.DEPTH_INTR_MTX_INV)
-    print('Handroot (colorspace):\t{}'.format(handroot_colorspace))
-    print('Handroot (colorspace), z:\t{}'.format(img_numpy[3, handroot_colorspace[0], handroot_colorspace[1]]))
-    print('Handroot (depthspace):\t{}'.format(handroot))
-    labels_colorspace = conv.heatmaps_to_joints_colorspace(halnet_main_out)
-
-    data_crop, _, _, _ = io_image.crop_image_get_labels(img_numpy, labels_colorspace, range(21))
-    batch_jornet = conv.data_to_batch(data_crop)
-    print_time('JORNet image conversion: ', time.time() - start)
 
+def get_tracking_stages(args, halnet, jornet, dataset_name, img_res=(320, 240)):
+    '''
+    :return: pipeline stages taking a frame index and giving a dict with the frame and its joints
+    '''
+    def decode(frame_ix):
+        image_namebase = get_image_name(args.input_img_namebase, frame_ix, dataset_name)
+        image = get_image_as_data(args.dataset_folder, image_namebase, dataset_name, img_res)
+        return {'image_namebase': image_namebase, 'image': conv._as_numpy(image), 'start': time.time()}
+
+    def read_ring(ring_frame):
+        # the frame stays a view of its ring slot: no copy between capture and inference
+        frame_number, image, timestamp = ring_frame
+        return {'image_namebase': 'frame ' + str(frame_number), 'frame_number': frame_number,
+                'image': image, 'start': timestamp}
+
+    def run_halnet(frame):
+        batch_halnet = conv.batch_to_device_float(torch.from_numpy(frame['image'][np.newaxis]),
+                                                  use_cuda=args.use_cuda)
+        halnet_heatmaps = halnet.forward_inference(batch_halnet)
+        frame['joints_colorspace'] = conv.batch_heatmaps_to_joints_colorspace(halnet_heatmaps)
+        return frame
+
+    def crop(frame):
+        frame['handroots'] = hand_tracker.get_handroots(frame['joints_colorspace'][:, 0],
+                                                        egodexter_handler.DEPTH_INTR_MTX_INV)
+        frame['crops'] = hand_tracker.crop_hands(frame['image'][np.newaxis], frame['joints_colorspace'])
+        return frame
+
+    def run_jornet(frame):
+        batch_jornet = conv.batch_to_device_float(torch.from_numpy(frame['crops']), use_cuda=args.use_cuda)
+        _, jornet_joints = jornet.forward_inference(batch_jornet)
+        joints_3d = hand_tracker.local_to_global_joints(conv._as_numpy(jornet_joints), frame['handroots'])
+        frame['joints_3d'] = joints_3d[0]
+        frame['joints_3d_colorspace'] = hand_tracker.project_joints(
+            joints_3d, egodexter_handler.DEPTH_INTR_MTX, img_res=img_res)[0]
+        return frame
+
+    if args.ring_name:
+        first_stage = pipeline.Stage('read', read_ring)
+    else:
+        first_stage = pipeline.Stage('decode', decode)
+    return [first_stage,
+            pipeline.Stage('halnet', run_halnet),
+            pipeline.Stage('crop', crop),
+            pipeline.Stage('jornet', run_jornet)]
+
+
+def main():
+    args = parse_args()
+    if args.num_threads > 0:
+        torch.set_num_threads(args.num_threads)
+    dataset_name = args.dataset_folder.split('/')[-2] if args.dataset_folder else ''
+
+    # load nets
     start = time.time()
-    output_jornet = jornet(batch_jornet)
-    print_time('JORNet pass: ', time.time() - start)
+    halnet = inference_backends.load_backend(args.backend, args.halnet_filepath,
+                                             model_class=HALNet.HALNet, use_cuda=args.use_cuda)
+    print_time('HALNet loading: ', time.time() - start)
 
     start = time.time()
-    jornet_joints_mainout = output_jornet[7][0].data.cpu().numpy()
-
-    jornet_joints_global = conv.jornet_local_to_global_joints(jornet_joints_mainout, handroot)
-    joints_colorspace = conv.joints_globaldepth_to_colorspace(jornet_joints_global, handroot, img_res=(320, 240))
-    mov_0 = labels_colorspace[0, 0] - joints_colorspace[0, 0]
-    mov_1 = labels_colorspace[0, 1] - joints_colorspace[0, 1]
-    for i in range(joints_colorspace.shape[0] ):
-        joints_colorspace[i, 0] += mov_0
-        joints_colorspace[i, 1] += mov_1
-    print_time('Plot image preparation: ', time.time() - start)
-
-    plt.imshow(conv.numpy_to_plottable_rgb(img_numpy))
-    plot_joints(labels_colorspace, show_legend=False)
-    total_elapsed_time = round(time.time() - start_beg, 2)
-    plt.title(input_img_namebase + ' : ' + str(total_elapsed_time) + ' ms')
-    plt.pause(0.001)
-    plt.clf()
-    print('--------------------------------------------------------------------------')
-
-plt.show()
\ No newline at end of file
+    jornet = inference_backends.load_backend(args.backend, args.jornet_filepath,
+                                             model_class=JORNet.JORNet, use_cuda=args.use_cuda)
+    print_time('JORNet loading: ', time.time() - start)
+
+    if args.plot:
+        from matplotlib import pyplot as plt
+    ring = None
+    if args.ring_name:
+        ring = frame_ring.FrameRing.attach(args.ring_name, timeout=10.)
+        reader = frame_ring.FrameReader(ring, latest=args.ring_latest)
+        inputs = itertools.islice(reader, args.num_frames) if args.num_frames > 0 else reader
+        print('Tracking frames from ring ' + args.ring_name + ' (' + str(ring.num_slots) + ' slots)')
+    else:
+        inputs = range(args.num_frames)
+    executor = pipeline.PipelineExecutor(get_tracking_stages(args, halnet, jornet, dataset_name),
+                                         queue_size=args.queue_size)
+    if args.sequential:
+        frames = executor.run_sequential(inputs)
+    else:
+        frames = executor.run(inputs)
+    num_overwritten = 0
+    for frame in frames:
+        if ring is not None and not ring.is_valid(frame['frame_number']):
+            # the producer lapped the tracker while the frame was in flight
+            num_overwritten += 1
+        total_elapsed_time = round((time.time() - frame['start']) * 1000)
+        print(frame['image_namebase'] + ': hand root (colorspace) ' + str(frame['joints_colorspace'][0, 0]) +
+              ', latency ' + str(total_elapsed_time) + ' ms')
+        if args.plot:
+            plt.imshow(conv.numpy_to_plottable_rgb(frame['image']))
+            plot_joints(frame['joints_colorspace'][0], show_legend=False)
+            plt.title(frame['image_namebase'] + ' : ' + str(total_elapsed_time) + ' ms')
+            plt.pause(0.001)
+            plt.clf()
+    executor.print_stats(title='Tracking ' + ('(sequential)' if args.sequential else '(pipelined)'))
+    if ring is not None:
+        print('Ring: tracked ' + str(reader.num_read) + ' frames, dropped ' + str(reader.num_dropped) +
+              ', overwritten while tracked ' + str(num_overwritten))
+        # release the last view into the ring before closing it
+        frame = None
+        ring.close()
+    if args.plot:
+        plt.show()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 import torch
 from torch.autograd import Variable
+import converter as conv
 import synthhands_handler
 import trainer
 import time
@@ -46,10 +47,10 @@ def train(train_loader, model, optimizer, train_vars, control_vars, verbose=True
         # start time counter
         start = time.time()
         # get data and targetas cuda variables
-        target_heatmaps, target_joints, _, target_prior = target
+        _, target_joints, target_heatmaps, _, target_prior = target
+        data = conv.batch_to_device_float(data, train_vars['use_cuda'])
         data, target_heatmaps, target_prior = Variable(data), Variable(target_heatmaps), Variable(target_prior)
         if train_vars['use_cuda']:
-            data = data.cuda()
             target_heatmaps = target_heatmaps.cuda()
             target_prior = target_prior.cuda()
         # visualize if debugging
@@ -114,7 +115,7 @@ def train(train_loader, model, optimizer, train_vars, control_vars, verbose=True
                 train_vars['best_loss_prior'] = train_vars['losses_prior'][-1]
             # log checkpoint
             if control_vars['curr_iter'] % control_vars['log_interval'] == 0:
-                trainer.print_log_info(model, optimizer, epoch, total_loss, train_vars, control_vars)
+                trainer.print_log_info(model, optimizer, control_vars['curr_epoch'], total_loss, train_vars, control_vars)
                 msg = ''
                 msg += print_verbose(
                     "-------------------------------------------------------------------------------------------",
@@ -145,7 +146,7 @@ def train(train_loader, model, optimizer, train_vars, control_vars, verbose=True
                                                  str(control_vars['curr_iter']) + '.pth.tar')
 
             # print time lapse
-            prefix = 'Training (Epoch #' + str(epoch) + ' ' + str(control_vars['curr_epoch_iter']) + '/' +\
+            prefix = 'Training (Epoch #' + str(control_vars['curr_epoch']) + ' ' + str(control_vars['curr_epoch_iter']) + '/' +\
                      str(control_vars['tot_iter']) + ')' + ', (Batch ' + str(control_vars['batch_idx']+1) +\
                      '(' + str(control_vars['iter_size']) + ')' + '/' +\
                      str(control_vars['num_batches']) + ')' + ', (Iter #' + str(control_vars['curr_iter']) +\
@@ -162,42 +163,50 @@ def train(train_loader, model, optimizer, train_vars, control_vars, verbose=True
 
     return train_vars, control_vars
 
-model, optimizer, control_vars, train_vars = trainer.get_vars(model_class=HALNet_prior)
-if train_vars['use_cuda']:
-    torch.set_default_tensor_type('torch.cuda.FloatTensor')
 
-train_loader = synthhands_handler.get_SynthHands_trainloader(root_folder=train_vars['root_folder'],
-                                                             joint_ixs=model.joint_ixs,
-                                                             heatmap_res=(320, 240),
-                                                             batch_size=control_vars['max_mem_batch'],
-                                                             verbose=control_vars['verbose'],
-                                                             dataset_type='prior')
-control_vars['num_batches'] = len(train_loader)
-control_vars['n_iter_per_epoch'] = int(len(train_loader) / control_vars['iter_size'])
+def main():
+    model, optimizer, train_vars = trainer.get_vars(model_class=HALNet_prior)
+    control_vars = train_vars
+    if train_vars['use_cuda']:
+        torch.set_default_tensor_type('torch.cuda.FloatTensor')
 
-control_vars['tot_iter'] = int(len(train_loader) / control_vars['iter_size'])
-control_vars['start_iter_mod'] = control_vars['start_iter'] % control_vars['tot_iter']
+    train_loader = synthhands_handler.get_SynthHands_trainloader(root_folder=train_vars['root_folder'],
+                                                                 joint_ixs=model.joint_ixs,
+                                                                 heatmap_res=(320, 240),
+                                                                 batch_size=control_vars['max_mem_batch'],
+                                                                 verbose=control_vars['verbose'],
+                                                                 dataset_type='prior')
+    control_vars['num_batches'] = len(train_loader)
+    control_vars['n_iter_per_epoch'] = int(len(train_loader) / control_vars['iter_size'])
 
-trainer.print_header_info(model, train_loader, control_vars)
+    control_vars['tot_iter'] = int(len(train_loader) / control_vars['iter_size'])
+    control_vars['start_iter_mod'] = control_vars['start_iter'] % control_vars['tot_iter']
 
-model.train()
-control_vars['curr_iter'] = 1
+    trainer.print_header_info(model, train_loader, control_vars)
 
-train_vars['best_loss_prior'] = 1e10
-train_vars['losses_prior'] = []
-train_vars['total_loss_prior'] = 0
-for epoch in range(control_vars['num_epochs']):
-    control_vars['curr_epoch_iter'] = 1
-    if epoch + 1 < control_vars['start_epoch']:
-        print_verbose("Advancing through epochs: " + str(epoch + 1), control_vars['verbose'], erase_line=True)
-        control_vars['curr_iter'] += control_vars['n_iter_per_epoch']
-        continue
-    train_vars['total_loss'] = 0
-    train_vars['total_pixel_loss'] = [0] * len(model.joint_ixs)
-    train_vars['total_pixel_loss_sample'] = [0] * len(model.joint_ixs)
-    optimizer.zero_grad()
-    # train model
-    train_vars, control_vars = train(train_loader, model, optimizer, train_vars, control_vars, control_vars['verbose'])
-    if control_vars['done_training']:
-        print_verbose("Done training.", control_vars['verbose'])
-        break
\ No newline at end of file
+    model.train()
+    control_vars['curr_iter'] = 1
+
+    train_vars['best_loss_prior'] = 1e10
+    train_vars['losses_prior'] = []
+    train_vars['total_loss_prior'] = 0
+    for epoch in range(control_vars['num_epochs']):
+        control_vars['curr_epoch_iter'] = 1
+        if epoch + 1 < control_vars['start_epoch']:
+            print_verbose("Advancing through epochs: " + str(epoch + 1), control_vars['verbose'], erase_line=True)
+            control_vars['curr_iter'] += control_vars['n_iter_per_epoch']
+            continue
+        train_vars['total_loss'] = 0
+        train_vars['total_pixel_loss'] = [0] * len(model.joint_ixs)
+        train_vars['total_pixel_loss_sample'] = [0] * len(model.joint_ixs)
+        optimizer.zero_grad()
+        # train model
+        control_vars['curr_epoch'] = epoch
+        train_vars, control_vars = train(train_loader, model, optimizer, train_vars, control_vars, control_vars['verbose'])
+        if control_vars['done_training']:
+            print_verbose("Done training.", control_vars['verbose'])
+            break
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,16 @@
 import torch
 from torch.autograd import Variable
+import converter as conv
 import synthhands_handler
 import trainer
+import distributed
 import time
 from magic import display_est_time_loop
 import losses as my_losses
 from debugger import print_verbose
 from JORNet import JORNet
+import tracing
+import train_logger
 from trainer import run_until_curr_iter, save_final_checkpoint
 import numpy as np
 import visualize
@@ -44,9 +48,20 @@ def get_batch(loader, batch_idx, batch_size):
     targets = (targets0, targets1, targets2)
     return data, targets
 
-def train(train_loader, model, optimizer, train_vars):
+def train(train_loader, model, optimizer, train_vars, ddp_model=None, tracer=None, logger=None):
+    '''
+    :param ddp_model: model wrapped for distributed training, used for the forward and backward passes
+    :param tracer: tracing.Tracer timing the phases of each training step
+    :param logger: train_logger.TrainLogger of the training records (default: console only)
+    '''
     verbose = train_vars['verbose']
-    for batch_idx, (data, target) in enumerate(train_loader):
+    net = model if ddp_model is None else ddp_model
+    if tracer is None:
+        tracer = tracing.Tracer(enabled=False)
+    if logger is None:
+        logger = train_logger.TrainLogger(formatters=trainer.LOG_FORMATTERS, verbose=verbose)
+    tracer.start_iter(train_vars['curr_iter'])
+    for batch_idx, (data, target) in enumerate(tracer.iter_loader(train_loader)):
         train_vars['batch_idx'] = batch_idx
         # print info about performing first iter
         if batch_idx < train_vars['iter_size']:
@@ -58,7 +73,7 @@ def train(train_loader, model, optimizer, train_vars):
             continue
         # save checkpoint after final iteration
         if train_vars['curr_iter'] - 1 == train_vars['num_iter']:
-            train_vars = trainer.save_final_checkpoint(train_vars, model, optimizer)
+            train_vars = trainer.save_final_checkpoint(train_vars, model, optimizer, logger=logger)
             break
         # start time counter
         start = time.time()
@@ -66,36 +81,44 @@ def train(train_loader, model, optimizer, train_vars):
         _, target_joints, target_heatmaps, target_joints_z = target
         # make target joints be relative
         target_joints = target_joints[:, 3:]
-        data, target_heatmaps = Variable(data), Variable(target_heatmaps)
-        if train_vars['use_cuda']:
-            data = data.cuda()
-            target_heatmaps = target_heatmaps.cuda()
-            target_joints = target_joints.cuda()
-            target_joints_z = target_joints_z.cuda()
-        # get model output
-        output = model(data)
-
-        # accumulate loss for sub-mini-batch
+        with tracer.span('to_device'):
+            data = conv.batch_to_device_float(data, train_vars['use_cuda'])
+            data, target_heatmaps = Variable(data), Variable(target_heatmaps)
+            if train_vars['use_cuda']:
+                target_heatmaps = target_heatmaps.cuda()
+                target_joints = target_joints.cuda()
+                target_joints_z = target_joints_z.cuda()
+        # get boolean variable stating whether a mini-batch has been completed
+        minibatch_completed = (batch_idx+1) % train_vars['iter_size'] == 0
         if train_vars['cross_entropy']:
             loss_func = my_losses.cross_entropy_loss_p_logq
         else:
             loss_func = my_losses.euclidean_loss
         weights_heatmaps_loss, weights_joints_loss = get_loss_weights(train_vars['curr_iter'])
-        loss, loss_heatmaps, loss_joints = my_losses.calculate_loss_JORNet(
-            loss_func, output, target_heatmaps, target_joints, train_vars['joint_ixs'],
-            weights_heatmaps_loss, weights_joints_loss, train_vars['iter_size'])
-        loss.backward()
+        # gradients are all-reduced across processes only on the last sub-mini-batch
+        with distributed.maybe_no_sync(net, minibatch_completed):
+            # get model output
+            with tracer.span('forward'):
+                output = net(data)
+            # accumulate loss for sub-mini-batch
+            with tracer.span('loss'):
+                loss, loss_heatmaps, loss_joints = my_losses.calculate_loss_JORNet(
+                    loss_func, output, target_heatmaps, target_joints, train_vars['joint_ixs'],
+                    weights_heatmaps_loss, weights_joints_loss, train_vars['iter_size'])
+            with tracer.span('backward'):
+                loss.backward()
         train_vars['total_loss'] += loss.item()
         train_vars['total_joints_loss'] += loss_joints.item()
         train_vars['total_heatmaps_loss'] += loss_heatmaps.item()
         # accumulate pixel dist loss for sub-mini-batch
-        train_vars['total_pixel_loss'] = my_losses.accumulate_pixel_dist_loss_multiple(
-            train_vars['total_pixel_loss'], output[3], target_heatmaps, train_vars['batch_size'])
-        if train_vars['cross_entropy']:
-            train_vars['total_pixel_loss_sample'] = my_losses.accumulate_pixel_dist_loss_from_sample_multiple(
-                train_vars['total_pixel_loss_sample'], output[3], target_heatmaps, train_vars['batch_size'])
-        else:
-            train_vars['total_pixel_loss_sample'] = [-1] * len(model.joint_ixs)
+        with tracer.span('pixel_metrics'):
+            train_vars['total_pixel_loss'] = my_losses.accumulate_pixel_dist_loss_multiple(
+                train_vars['total_pixel_loss'], output[3], target_heatmaps, train_vars['batch_size'])
+            if train_vars['cross_entropy']:
+                train_vars['total_pixel_loss_sample'] = my_losses.accumulate_pixel_dist_loss_from_sample_multiple(
+                    train_vars['total_pixel_loss_sample'], output[3], target_heatmaps, train_vars['batch_size'])
+            else:
+                train_vars['total_pixel_loss_sample'] = [-1] * len(model.joint_ixs)
 
         '''
         For debugging training
@@ -112,31 +135,32 @@ def train(train_loader, model, optimizer, train_vars):
             visualize.show()
         '''
 
-        # get boolean variable stating whether a mini-batch has been completed
-        minibatch_completed = (batch_idx+1) % train_vars['iter_size'] == 0
         if minibatch_completed:
             # visualize
             # ax, fig = visualize.plot_3D_joints(target_joints[0])
             # visualize.plot_3D_joints(target_joints[1], ax=ax, fig=fig)
-            if train_vars['curr_iter'] % train_vars['log_interval'] == 0:
-                fig, ax = visualize.plot_3D_joints(target_joints[0])
-                visualize.savefig('joints_GT_' + str(train_vars['curr_iter']) + '.png')
-                #visualize.plot_3D_joints(target_joints[1], fig=fig, ax=ax, color_root='C7')
-                #visualize.plot_3D_joints(output[7].data.cpu().numpy()[0], fig=fig, ax=ax, color_root='C7')
-                visualize.plot_3D_joints(output[7].data.cpu().numpy()[0])
-                visualize.savefig('joints_model_' + str(train_vars['curr_iter']) + '.png')
+            if train_vars['curr_iter'] % train_vars['log_interval'] == 0 and distributed.is_main_process():
+                with tracer.span('visualize'):
+                    fig, ax = visualize.plot_3D_joints(target_joints[0])
+                    visualize.savefig('joints_GT_' + str(train_vars['curr_iter']) + '.png')
+                    #visualize.plot_3D_joints(target_joints[1], fig=fig, ax=ax, color_root='C7')
+                    #visualize.plot_3D_joints(output[7].data.cpu().numpy()[0], fig=fig, ax=ax, color_root='C7')
+                    visualize.plot_3D_joints(output[7].data.cpu().numpy()[0])
+                    visualize.savefig('joints_model_' + str(train_vars['curr_iter']) + '.png')
                 #visualize.show()
                 #visualize.savefig('joints_' + str(train_vars['curr_iter']) + '.png')
             # change learning rate to 0.01 after 45000 iterations
             optimizer = change_learning_rate(optimizer, 0.01, train_vars['curr_iter'])
-            # optimise for mini-batch
-            optimizer.step()
-            # clear optimiser
-            optimizer.zero_grad()
+            with tracer.span('optimizer_step'):
+                # optimise for mini-batch
+                optimizer.step()
+                # clear optimiser
+                optimizer.zero_grad()
             # append total loss
-            train_vars['losses'].append(train_vars['total_loss'])
+            # (averaged over processes in distributed training)
+            train_vars['losses'].append(distributed.all_reduce_mean(train_vars['total_loss']))
             # erase total loss
-            total_loss = train_vars['total_loss']
+            total_loss = train_vars['losses'][-1]
             train_vars['total_loss'] = 0
             # append total joints loss
             train_vars['losses_joints'].append(train_vars['total_joints_loss'])
@@ -157,7 +181,7 @@ def train(train_loader, model, optimizer, train_vars):
             # check if loss is better
             if train_vars['losses'][-1] < train_vars['best_loss']:
                 train_vars['best_loss'] = train_vars['losses'][-1]
-                print_verbose("  This is a best loss found so far: " + str(train_vars['losses'][-1]), verbose)
+                logger.log('best_loss', iter=train_vars['curr_iter'], loss=train_vars['losses'][-1])
                 train_vars['best_model_dict'] = {
                     'model_state_dict': model.state_dict(),
                     'optimizer_state_dict': optimizer.state_dict(),
@@ -165,95 +189,108 @@ def train(train_loader, model, optimizer, train_vars):
                 }
             # log checkpoint
             if train_vars['curr_iter'] % train_vars['log_interval'] == 0:
-                trainer.print_log_info(model, optimizer, epoch, total_loss, train_vars, train_vars)
+                with tracer.span('log'):
+                    trainer.print_log_info(model, optimizer, train_vars['curr_epoch'], total_loss, train_vars,
+                                           train_vars, tracer=tracer, logger=logger)
                 aa1 = target_joints[0].data.cpu().numpy()
                 aa2 = output[7][0].data.cpu().numpy()
                 output_joint_loss = np.sum(np.abs(aa1 - aa2)) / 63
-                msg = ''
-                msg += print_verbose(
-                    "-------------------------------------------------------------------------------------------",
-                    verbose) + "\n"
-                msg += print_verbose('\tJoint Coord Avg Loss for first image of current mini-batch: ' +
-                                     str(output_joint_loss) + '\n', train_vars['verbose'])
-                msg += print_verbose(
-                    "-------------------------------------------------------------------------------------------",
-                    verbose) + "\n"
-                if not train_vars['output_filepath'] == '':
-                    with open(train_vars['output_filepath'], 'a') as f:
-                        f.write(msg + '\n')
+                logger.log('joint_coords', iter=train_vars['curr_iter'], joint_coords_loss=output_joint_loss)
+                trainer.print_trace_info(tracer, train_vars, logger=logger)
             if train_vars['curr_iter'] % train_vars['log_interval_valid'] == 0:
-                print_verbose("\nSaving model and checkpoint model for validation", verbose)
+                checkpoint_filepath = train_vars['checkpoint_filenamebase'] + 'for_valid_' + \
+                                      str(train_vars['curr_iter']) + '.pth.tar'
+                logger.log('valid_checkpoint', iter=train_vars['curr_iter'], filepath=checkpoint_filepath)
                 checkpoint_model_dict = {
                     'model_state_dict': model.state_dict(),
                     'optimizer_state_dict': optimizer.state_dict(),
                     'train_vars': train_vars,
                 }
-                trainer.save_checkpoint(checkpoint_model_dict,
-                                        filename=train_vars['checkpoint_filenamebase'] + 'for_valid_' +
-                                                 str(train_vars['curr_iter']) + '.pth.tar')
+                with tracer.span('checkpoint'):
+                    trainer.save_checkpoint(checkpoint_model_dict, filename=checkpoint_filepath)
 
             # print time lapse
-            prefix = 'Training (Epoch #' + str(epoch) + ' ' + str(train_vars['curr_epoch_iter']) + '/' +\
+            prefix = 'Training (Epoch #' + str(train_vars['curr_epoch']) + ' ' + str(train_vars['curr_epoch_iter']) + '/' +\
                      str(train_vars['tot_iter']) + ')' + ', (Batch ' + str(train_vars['batch_idx']+1) +\
                      '(' + str(train_vars['iter_size']) + ')' + '/' +\
                      str(train_vars['num_batches']) + ')' + ', (Iter #' + str(train_vars['curr_iter']) +\
                      '(' + str(train_vars['batch_size']) + ')' +\
                      ' - log every ' + str(train_vars['log_interval']) + ' iter): '
-            train_vars['tot_toc'] = display_est_time_loop(train_vars['tot_toc'] + time.time() - start,
-                                                            train_vars['curr_iter'], train_vars['num_iter'],
-                                                            prefix=prefix)
+            if distributed.is_main_process():
+                train_vars['tot_toc'] = display_est_time_loop(train_vars['tot_toc'] + time.time() - start,
+                                                                train_vars['curr_iter'], train_vars['num_iter'],
+                                                                prefix=prefix)
 
+            logger.log('iter', iter=train_vars['curr_iter'], epoch=train_vars['curr_epoch'], loss=total_loss,
+                       joints_loss=train_vars['losses_joints'][-1], heatmaps_loss=train_vars['losses_heatmaps'][-1],
+                       pixel_losses=train_vars['pixel_losses'][-1],
+                       pixel_losses_sample=train_vars['pixel_losses_sample'][-1],
+                       step_s=time.time() - start, phases_ms=tracer.get_iter_ms())
+            tracer.end_iter(train_vars['curr_iter'])
             train_vars['curr_iter'] += 1
             train_vars['start_iter'] = train_vars['curr_iter'] + 1
             train_vars['curr_epoch_iter'] += 1
     return train_vars
 
 
-model, optimizer, train_vars = trainer.get_vars(model_class=JORNet)
-if train_vars['use_cuda']:
-    torch.set_default_tensor_type('torch.cuda.FloatTensor')
+def main():
+    model, optimizer, train_vars = trainer.get_vars(model_class=JORNet)
+    if train_vars['use_cuda']:
+        torch.set_default_tensor_type('torch.cuda.FloatTensor')
+
+    train_loader = synthhands_handler.get_SynthHands_trainloader(root_folder=train_vars['root_folder'],
+                                                                 joint_ixs=model.joint_ixs,
+                                                                 heatmap_res=(128, 128),
+                                                                 batch_size=train_vars['max_mem_batch'],
+                                                                 verbose=train_vars['verbose'],
+                                                                 crop_hand=train_vars['crop_hand'],
+                                                                 cache_bytes=train_vars['cache_mb'] * 2**20,
+                                                                 num_workers=train_vars['num_workers'],
+                                                                 world_size=train_vars['world_size'],
+                                                                 rank=train_vars['rank'])
 
-train_loader = synthhands_handler.get_SynthHands_trainloader(root_folder=train_vars['root_folder'],
-                                                             joint_ixs=model.joint_ixs,
-                                                             heatmap_res=(128, 128),
-                                                             batch_size=train_vars['max_mem_batch'],
-                                                             verbose=train_vars['verbose'],
-                                                             crop_hand=train_vars['crop_hand'])
+    train_vars['num_batches'] = len(train_loader)
+    train_vars['n_iter_per_epoch'] = int(len(train_loader) / train_vars['iter_size'])
 
-train_vars['num_batches'] = len(train_loader)
-train_vars['n_iter_per_epoch'] = int(len(train_loader) / train_vars['iter_size'])
+    train_vars['tot_iter'] = int(len(train_loader) / train_vars['iter_size'])
+    train_vars['start_iter_mod'] = train_vars['start_iter'] % train_vars['tot_iter']
 
-train_vars['tot_iter'] = int(len(train_loader) / train_vars['iter_size'])
-train_vars['start_iter_mod'] = train_vars['start_iter'] % train_vars['tot_iter']
+    train_vars['start_epoch'] = int(train_vars['start_iter'] / train_vars['n_iter_per_epoch'])
 
-train_vars['start_epoch'] = int(train_vars['start_iter'] / train_vars['n_iter_per_epoch'])
+    logger = trainer.get_logger(train_vars)
+    trainer.print_header_info(model, train_loader, train_vars, logger=logger)
 
-trainer.print_header_info(model, train_loader, train_vars)
+    tracer = trainer.get_tracer(train_vars)
+    ddp_model = None
+    if train_vars['world_size'] > 1:
+        ddp_model = distributed.wrap_model(model, sync_bn=train_vars['sync_bn'], use_cuda=train_vars['use_cuda'])
+    model.train()
+    train_vars['curr_iter'] = 1
+
+    for epoch in range(train_vars['num_epochs']):
+        train_vars['curr_epoch_iter'] = 1
+        if epoch + 1 < train_vars['start_epoch']:
+            print_verbose("\nAdvancing through epochs: " + str(epoch + 1), train_vars['verbose'], erase_line=True)
+            logger.log('skip_epoch', epoch=epoch + 1)
+            train_vars['curr_iter'] += train_vars['n_iter_per_epoch']
+            continue
+        train_vars['total_loss'] = 0
+        train_vars['total_pixel_loss'] = [0] * len(model.joint_ixs)
+        train_vars['total_pixel_loss_sample'] = [0] * len(model.joint_ixs)
+        optimizer.zero_grad()
+        # train model
+        train_vars['curr_epoch'] = epoch
+        train_vars = train(train_loader, model, optimizer, train_vars, ddp_model=ddp_model, tracer=tracer,
+                           logger=logger)
+        if not train_loader.dataset.cache is None:
+            print_verbose(train_loader.dataset.cache.stats_str(), train_vars['verbose'])
+        if train_vars['done_training']:
+            logger.log('done', iter=train_vars['curr_iter'])
+            break
+    tracer.close()
+    logger.close()
+    distributed.cleanup()
 
-model.train()
-train_vars['curr_iter'] = 1
 
-msg = ''
-for epoch in range(train_vars['num_epochs']):
-    train_vars['curr_epoch_iter'] = 1
-    if epoch + 1 < train_vars['start_epoch']:
-        msg += print_verbose("\nAdvancing through epochs: " + str(epoch + 1), train_vars['verbose'], erase_line=True)
-        train_vars['curr_iter'] += train_vars['n_iter_per_epoch']
-        if not train_vars['output_filepath'] == '':
-            with open(train_vars['output_filepath'], 'a') as f:
-                f.write(msg + '\n')
-        continue
-    else:
-        msg = ''
-    train_vars['total_loss'] = 0
-    train_vars['total_pixel_loss'] = [0] * len(model.joint_ixs)
-    train_vars['total_pixel_loss_sample'] = [0] * len(model.joint_ixs)
-    optimizer.zero_grad()
-    # train model
-    train_vars = train(train_loader, model, optimizer, train_vars)
-    if train_vars['done_training']:
-        msg += print_verbose("Done training.", train_vars['verbose'])
-        if not train_vars['output_filepath'] == '':
-            with open(train_vars['output_filepath'], 'a') as f:
-                f.write(msg + '\n')
-        break
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 import torch
 from torch.autograd import Variable
+import converter as conv
 import synthhands_handler
 import trainer
 import time
@@ -60,10 +61,10 @@ def train(train_loader, model, optimizer, train_vars, control_vars, verbose=True
         start = time.time()
         # get data and targetas cuda variables
         target_heatmaps, target_joints, target_roothand = target
+        data = conv.batch_to_device_float(data, train_vars['use_cuda'])
         data, target_heatmaps, target_joints, target_roothand = Variable(data), Variable(target_heatmaps),\
                                                Variable(target_joints), Variable(target_roothand)
         if train_vars['use_cuda']:
-            data = data.cuda()
             target_heatmaps = target_heatmaps.cuda()
             target_joints = target_joints.cuda()
         # get model output
@@ -0,0 +1,118 @@
+import atexit
+import json
+import queue
+import threading
+import time
+
+_CLOSE = object()
+
+
+def _to_json(obj):
+    # numpy arrays and scalars, and torch tensors
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    return str(obj)
+
+
+def read_records(filepath, event=None):
+    '''
+    :param event: only return records of this event (default: all)
+    :return: list of the records of a JSON lines log
+    '''
+    records = []
+    with open(filepath, 'r') as f:
+        for line in f:
+            if line.strip() == '':
+                continue
+            record = json.loads(line)
+            if event is None or record['event'] == event:
+                records.append(record)
+    return records
+
+
+class TrainLogger:
+    '''
+    Structured training log: each call of log makes a record, a dict of its event, time and fields
+    (iteration, losses, per joint pixel errors, timings...), written as a line of JSON to json_filepath
+    The human-readable output of a record is rendered from it by the formatter of its event, printed when
+    verbose and written to text_filepath (records of events without a formatter only go to json_filepath)
+    In background mode lines are queued and written by a thread, which flushes the files every
+    flush_interval seconds and on close, so logging does not wait on the disk
+    '''
+    def __init__(self, json_filepath='', text_filepath='', formatters=None, verbose=True, background=True,
+                 flush_interval=5., append=True):
+        '''
+        :param formatters: dict of event to a function of a record returning its text
+        :param append: whether to append to the files, or to overwrite them
+        '''
+        self.formatters = {} if formatters is None else formatters
+        self.verbose = verbose
+        self.flush_interval = flush_interval
+        mode = 'a' if append else 'w'
+        self.json_file = None if json_filepath == '' else open(json_filepath, mode)
+        self.text_file = None if text_filepath == '' else open(text_filepath, mode)
+        self.closed = False
+        self.queue = None
+        self.thread = None
+        if background and (self.json_file is not None or self.text_file is not None):
+            self.queue = queue.Queue()
+            self.thread = threading.Thread(target=self._write_loop, name='train_logger', daemon=True)
+            self.thread.start()
+            # records of a run that crashes still reach the disk
+            atexit.register(self.close)
+
+    def _write_loop(self):
+        last_flush = time.time()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            if item is _CLOSE:
+                break
+            if item is not None:
+                f, line = item
+                f.write(line)
+            if time.time() - last_flush >= self.flush_interval:
+                self._flush()
+                last_flush = time.time()
+        self._flush()
+
+    def _write(self, f, line):
+        if f is None:
+            return
+        if self.queue is None:
+            f.write(line)
+            f.flush()
+        else:
+            self.queue.put((f, line))
+
+    def _flush(self):
+        for f in [self.json_file, self.text_file]:
+            if f is not None:
+                f.flush()
+
+    def log(self, event, **fields):
+        '''
+        :return: the record
+        '''
+        record = {'event': event, 'time': time.time()}
+        record.update(fields)
+        self._write(self.json_file, json.dumps(record, default=_to_json) + '\n')
+        if event in self.formatters:
+            text = self.formatters[event](record)
+            if self.verbose:
+                print(text)
+            self._write(self.text_file, text + '\n')
+        return record
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.thread is not None:
+            self.queue.put(_CLOSE)
+            self.thread.join()
+        for f in [self.json_file, self.text_file]:
+            if f is not None:
+                f.close()
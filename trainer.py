@@ -9,6 +9,11 @@ import optimizers as my_optimizers
 import synthhands_handler
 from random import randint
 import datetime
+import distributed
+import batch_autotuner
+import tracing
+import benchmarker
+import train_logger
 
 def load_checkpoint(filename, model_class, use_cuda=False):
     torch_file = torch.load(filename, map_location=lambda storage, loc: storage)
@@ -26,6 +31,7 @@ def load_checkpoint(filename, model_class, use_cuda=False):
     train_vars = torch_file['train_vars']
     params_dict = {}
     params_dict['heatmap_ixs'] = train_vars['heatmap_ixs']
+    params_dict['joint_ixs'] = train_vars['heatmap_ixs']
     params_dict['use_cuda'] = train_vars['use_cuda']
     params_dict['cross_entropy'] = train_vars['cross_entropy']
     if not use_cuda:
@@ -40,13 +46,8 @@ def load_checkpoint(filename, model_class, use_cuda=False):
     del optimizer_state_dict, model_state_dict
     return model, optimizer, train_vars, train_vars
 
-def save_final_checkpoint(train_vars, model, optimizer):
-    msg = ''
-    msg += print_verbose("\nReached final number of iterations: " + str(train_vars['num_iter']), train_vars['verbose'])
-    msg += print_verbose("\tSaving final model checkpoint...", train_vars['verbose'])
-    if not train_vars['output_filepath'] == '':
-        with open(train_vars['output_filepath'], 'a') as f:
-            f.write(msg + '\n')
+def save_final_checkpoint(train_vars, model, optimizer, logger=None):
+    log_record(logger, train_vars, 'final_checkpoint', num_iter=train_vars['num_iter'])
     final_model_dict = {
         'model_state_dict': model.state_dict(),
         'optimizer_state_dict': optimizer.state_dict(),
@@ -126,14 +127,58 @@ def parse_args(model_class, random_id=-1):
                         help='Whether to load RESNet weights onto the network when creating it')
     parser.add_argument('--max_mem_batch', type=int, dest='max_mem_batch', default=8,
                         help='Max size of batch given GPU memory (default 8)')
+    parser.add_argument('--autotune_batch', dest='autotune_batch', action='store_true', default=False,
+                        help='Whether to set max_mem_batch to the largest batch that fits in memory, found by '
+                             'probing training steps on synthetic inputs at startup (overrides --max_mem_batch)')
+    parser.add_argument('--memory_budget_mb', type=float, dest='memory_budget_mb', default=0.,
+                        help='Memory budget per process for --autotune_batch in MB (default 0: 80%% of available '
+                             'RAM, or of GPU memory with --cuda)')
     parser.add_argument('--batch_size', type=int, dest='batch_size', default=16,
                         help='Batch size for training (if larger than max memory batch, training will take '
                              'the required amount of iterations to complete a batch')
     parser.add_argument('--cross_entropy', dest='cross_entropy', action='store_true', default=False,
                         help='Whether to use cross entropy loss on HALNet')
     parser.add_argument('-r', dest='root_folder', default='', required=True, help='Root folder for dataset')
+    parser.add_argument('--cache_mb', type=int, dest='cache_mb', default=0,
+                        help='Size in MB of the shared-memory cache of decoded samples (default 0: no cache)')
+    parser.add_argument('--num_workers', type=int, dest='num_workers', default=0,
+                        help='Number of DataLoader worker processes (default 0)')
+    parser.add_argument('--checkpoint_stages', dest='checkpoint_stages', nargs='*', default=[],
+                        choices=['res2', 'res3', 'res4'],
+                        help='Stages of the network backbone to run under activation checkpointing, '
+                             'trading recomputation for memory to allow a larger max_mem_batch (default: none)')
+    parser.add_argument('--dist_backend', dest='dist_backend', default='gloo', choices=distributed.BACKENDS,
+                        help='Backend for distributed data-parallel training, when launched with several '
+                             'processes by torch.distributed.run (default gloo)')
+    parser.add_argument('--sync_bn', dest='sync_bn', action='store_true', default=False,
+                        help='Whether to synchronize batch norm statistics across processes '
+                             'in distributed training (needs cuda)')
+    parser.add_argument('--trace', dest='trace', action='store_true', default=False,
+                        help='Whether to time the phases of each training step (data loading wait, forward, '
+                             'loss, backward, pixel metrics, optimiser step, logging and checkpointing) and log '
+                             'their rolling p50/p95')
+    parser.add_argument('--trace_window', type=int, dest='trace_window', default=100,
+                        help='Number of last spans/iterations the logged phase stats are over (default 100)')
+    parser.add_argument('--trace_filepath', dest='trace_filepath', default='',
+                        help='Chrome trace JSON file to write the phases of some iterations to '
+                             '(implies --trace; default: none)')
+    parser.add_argument('--trace_start_iter', type=int, dest='trace_start_iter', default=10,
+                        help='First iteration written to the Chrome trace (default 10, after warmup)')
+    parser.add_argument('--trace_num_iter', type=int, dest='trace_num_iter', default=5,
+                        help='Number of iterations written to the Chrome trace (default 5)')
+    parser.add_argument('--log_filepath', dest='log_filepath', default='',
+                        help='JSON lines file of training records: header, logged losses and per joint pixel '
+                             'errors, and losses and timings of every iteration (default: output file with a '
+                             '.jsonl extension; none without an output file)')
+    parser.add_argument('--log_flush_interval', type=float, dest='log_flush_interval', default=5.,
+                        help='Seconds between flushes of the log files to disk (default 5)')
     args = parser.parse_args()
     args.heatmap_ixs = list(map(int, args.heatmap_ixs))
+    rank, world_size = distributed.init_distributed(args.dist_backend, args.use_cuda)
+    if rank > 0:
+        # only the main process logs
+        args.verbose = False
+        args.output_filepath = ''
 
     train_vars = initialize_train_vars(args)
 
@@ -152,8 +197,10 @@ def parse_args(model_class, random_id=-1):
         train_vars['cross_entropy'] = args.cross_entropy
         params_dict = {}
         params_dict['heatmap_ixs'] = args.heatmap_ixs
+        params_dict['joint_ixs'] = args.heatmap_ixs
         params_dict['use_cuda'] = args.use_cuda
         params_dict['cross_entropy'] = args.cross_entropy
+        params_dict['checkpoint_stages'] = args.checkpoint_stages
         model = model_class(params_dict)
         if args.load_resnet:
             model = load_resnet_weights_into_HALNet(model, args.verbose)
@@ -178,7 +225,56 @@ def parse_args(model_class, random_id=-1):
         train_vars['batch_size'] = args.batch_size
 
     train_vars['num_epochs'] = 100
-    train_vars['verbose'] = True
+    train_vars['verbose'] = args.verbose
+    train_vars['cache_mb'] = args.cache_mb
+    train_vars['num_workers'] = args.num_workers
+    # not part of the saved weights, so it can be changed when resuming from a checkpoint
+    model.checkpoint_stages = args.checkpoint_stages
+    train_vars['checkpoint_stages'] = args.checkpoint_stages
+    if len(args.checkpoint_stages) > 0:
+        print_verbose("Activation checkpointing of stages: " + ' '.join(args.checkpoint_stages), args.verbose)
+    train_vars['rank'] = rank
+    train_vars['world_size'] = world_size
+    train_vars['sync_bn'] = args.sync_bn
+    train_vars['trace'] = args.trace or not args.trace_filepath == ''
+    train_vars['trace_window'] = args.trace_window
+    train_vars['trace_filepath'] = args.trace_filepath
+    if world_size > 1 and not args.trace_filepath == '':
+        # one trace per process
+        train_vars['trace_filepath'] = args.trace_filepath + '.rank' + str(rank)
+    train_vars['trace_start_iter'] = args.trace_start_iter
+    train_vars['trace_num_iter'] = args.trace_num_iter
+    train_vars['log_filepath'] = args.log_filepath
+    train_vars['log_flush_interval'] = args.log_flush_interval
+    if rank > 0:
+        train_vars['output_filepath'] = ''
+        train_vars['log_filepath'] = ''
+    if args.autotune_batch:
+        autotune_info = None
+        if rank == 0:
+            _, autotune_info = batch_autotuner.autotune_max_mem_batch(
+                model_class.__name__.lower(), train_vars['batch_size'], memory_budget_mb=args.memory_budget_mb,
+                checkpoint_stages=args.checkpoint_stages, use_cuda=train_vars['use_cuda'], world_size=world_size,
+                verbose=args.verbose)
+        autotune_info = distributed.broadcast_object(autotune_info)
+        train_vars['max_mem_batch'] = autotune_info['max_mem_batch']
+        train_vars['autotune'] = autotune_info
+        print_verbose("Autotuned max memory batch size: " + str(train_vars['max_mem_batch']) +
+                      " (largest fitting " + str(autotune_info['max_batch_size']) + " examples in " +
+                      str(round(autotune_info['memory_budget_mb'])) + " MB, " +
+                      str(round(autotune_info['examples_per_s'], 2)) + " examples/s)", args.verbose)
+    # each process accumulates its share of the batch
+    train_vars['iter_size'] = distributed.get_iter_size(train_vars['batch_size'], train_vars['max_mem_batch'],
+                                                        world_size)
+    effective_batch_size = train_vars['iter_size'] * train_vars['max_mem_batch'] * world_size
+    if not effective_batch_size == train_vars['batch_size']:
+        print_verbose("Warning: batch size " + str(train_vars['batch_size']) + " is not a multiple of max memory "
+                      "batch size times number of processes; optimiser steps are taken every " +
+                      str(effective_batch_size) + " examples", args.verbose)
+    if world_size > 1:
+        print_verbose("Distributed training on " + str(world_size) + " processes (" + args.dist_backend +
+                      "), " + str(train_vars['iter_size']) + " accumulation steps of " +
+                      str(train_vars['max_mem_batch']) + " examples per process", args.verbose)
 
 
     if train_vars['cross_entropy']:
@@ -259,6 +355,9 @@ def load_resnet_weights_into_HALNet(halnet, verbose, n_tabs=1):
     return halnet
 
 def save_checkpoint(state, filename='checkpoint.pth.tar'):
+    # all processes hold the same weights in distributed training; only the main one saves them
+    if not distributed.is_main_process():
+        return
     print("\tSaving a checkpoint...")
     torch.save(state, filename)
 
@@ -292,164 +391,237 @@ def print_target_info(target):
     heatmap_sample_uv = (int(heatmap_sample_uv[0]), int(heatmap_sample_uv[1]))
     print("Heatmap sample: " + str(heatmap_sample_uv))
 
-def print_header_info(model, dataset_loader, train_vars):
-    msg = ''
-    msg += print_verbose("-----------------------------------------------------------", train_vars['verbose']) + "\n"
-    msg += print_verbose("Output filenamebase: " + train_vars['output_filepath'], train_vars['verbose']) + "\n"
-    msg += print_verbose("Model info", train_vars['verbose']) + "\n"
+def format_header_record(record):
+    lines = ["-----------------------------------------------------------",
+             "Output filenamebase: " + record['output_filepath'],
+             "Model info"]
+    if record['joint_ixs'] is None:
+        lines.append("Joints indexes: " + str(record['num_joints']))
+    else:
+        lines.append("Joints indexes: " + str(record['joint_ixs']))
+        lines.append("Number of joints: " + str(len(record['joint_ixs'])))
+    lines.append("-----------------------------------------------------------")
+    lines.append("Max memory batch size: " + str(record['max_mem_batch']))
+    if 'autotune' in record:
+        lines.append("\tAutotuned within " + str(round(record['autotune']['memory_budget_mb'])) +
+                     " MB (peak " + str(round(record['autotune']['peak_mb'])) + " MB, " +
+                     str(round(record['autotune']['examples_per_s'], 2)) + " examples/s)")
+    lines += ["Length of dataset (in max mem batch size): " + str(record['dataset_length']),
+              "Training batch size: " + str(record['batch_size']),
+              "Starting epoch: " + str(record['start_epoch']),
+              "Starting epoch iteration: " + str(record['start_iter_mod']),
+              "Starting overall iteration: " + str(record['start_iter']),
+              "-----------------------------------------------------------",
+              "Number of iterations per epoch: " + str(record['n_iter_per_epoch']),
+              "Number of iterations to train: " + str(record['num_iter']),
+              "Approximate number of epochs to train: " +
+              str(round(record['num_iter'] / record['n_iter_per_epoch'], 1)),
+              "-----------------------------------------------------------"]
+    return '\n'.join(lines)
+
+def format_trace_record(record):
+    return '\n'.join(["Training step phases (last " + str(record['window']) + " spans/iterations, in ms):",
+                      benchmarker.format_table(record['phases'], tracing.STATS_COLUMNS),
+                      "-------------------------------------------------------------------------------------------"])
+
+def format_train_record(record):
+    line = "-------------------------------------------------------------------------------------------"
+    log_interval = str(record['log_interval'])
+    lines = [line,
+             'Time: ' + datetime.datetime.fromtimestamp(record['time']).strftime("%Y-%m-%d %H:%M"),
+             line,
+             line,
+             'Training (Epoch #' + str(record['epoch']) + ' ' + str(record['epoch_iter']) + '/' +
+             str(record['tot_iter']) + ')' + ', (Batch ' + str(record['batch_idx'] + 1) +
+             '(' + str(record['iter_size']) + ')' + '/' + str(record['num_batches']) + ')' +
+             ', (Iter #' + str(record['iter']) + '(' + str(record['batch_size']) + ')' +
+             ' - log every ' + log_interval + ' iter): ',
+             line,
+             "Current loss: " + str(record['loss']),
+             "Best loss: " + str(record['best_loss']),
+             "Mean total loss: " + str(record['mean_loss']),
+             "Mean loss for last " + log_interval + " iterations (average total loss): " +
+             str(record['mean_loss_last'])]
+    for loss_name in ['joints', 'heatmaps']:
+        if not loss_name + '_loss' in record:
+            continue
+        lines += [line,
+                  "Current " + loss_name + " loss: " + str(record[loss_name + '_loss']),
+                  "Best " + loss_name + " loss: " + str(record['best_' + loss_name + '_loss']),
+                  "Mean total " + loss_name + " loss: " + str(record['mean_' + loss_name + '_loss']),
+                  "Mean " + loss_name + " loss for last " + log_interval +
+                  " iterations (average total " + loss_name + " loss): " +
+                  str(record['mean_' + loss_name + '_loss_last'])]
+    lines += [line, "Joint pixel losses:", line,
+              "\tTotal mean pixel loss: " + str(record['pixel_loss']),
+              line]
+    for joint_ix, joint in enumerate(record['joints']):
+        lines += ["\tJoint index: " + str(joint_ix),
+                  "\tTraining set mean error for last " + log_interval + " iterations (average pixel loss): " +
+                  str(joint['mean_last']),
+                  "\tTraining set stddev error for last " + log_interval + " iterations (average pixel loss): " +
+                  str(joint['std_last']),
+                  "\tThis is the last pixel dist loss: " + str(joint['last']),
+                  "\tTraining set mean error for last " + log_interval +
+                  " iterations (average pixel loss of sample): " + str(joint['sample_mean_last']),
+                  "\tTraining set stddev error for last " + log_interval +
+                  " iterations (average pixel loss of sample): " + str(joint['sample_std_last']),
+                  "\tThis is the last pixel dist loss of sample: " + str(joint['sample_last']),
+                  "\t" + line,
+                  line]
+    lines += [line,
+              "\tCurrent mean pixel loss: " + str(record['mean_pixel_loss_last']),
+              line,
+              line,
+              "\tTotal mean pixel loss: " + str(record['mean_pixel_loss']),
+              line]
+    return '\n'.join(lines)
+
+def format_joint_coords_record(record):
+    line = "-------------------------------------------------------------------------------------------"
+    return '\n'.join([line, '\tJoint Coord Avg Loss for first image of current mini-batch: ' +
+                      str(record['joint_coords_loss']) + '\n', line])
+
+# human-readable output of the records of each event (events missing here are only logged as JSON)
+LOG_FORMATTERS = {
+    'header': format_header_record,
+    'train': format_train_record,
+    'trace': format_trace_record,
+    'joint_coords': format_joint_coords_record,
+    'best_loss': lambda record: "  This is a best loss found so far: " + str(record['loss']),
+    'valid_checkpoint': lambda record: "\nSaving model and checkpoint model for validation",
+    'final_checkpoint': lambda record: "\nReached final number of iterations: " + str(record['num_iter']) +
+                                       "\n\tSaving final model checkpoint...",
+    'done': lambda record: "Done training.",
+}
+
+def get_logger(train_vars, background=True, append=False):
+    '''
+    :return: logger writing records to train_vars['log_filepath'] and their text to train_vars['output_filepath']
+    '''
+    return train_logger.TrainLogger(json_filepath=train_vars.get('log_filepath', ''),
+                                    text_filepath=train_vars['output_filepath'], formatters=LOG_FORMATTERS,
+                                    verbose=train_vars['verbose'], background=background,
+                                    flush_interval=train_vars.get('log_flush_interval', 5.), append=append)
+
+def log_record(logger, train_vars, event, append=True, **fields):
+    '''
+    Logs a record with logger or, for scripts without one, straight to the log files of train_vars
+    '''
+    if logger is not None:
+        return logger.log(event, **fields)
+    logger = get_logger(train_vars, background=False, append=append)
+    record = logger.log(event, **fields)
+    logger.close()
+    return record
+
+def print_header_info(model, dataset_loader, train_vars, logger=None):
     try:
-        heatmap_ixs = model.heatmap_ixs
-        msg += print_verbose("Joints indexes: " + str(heatmap_ixs), train_vars['verbose']) + "\n"
-        msg += print_verbose("Number of joints: " + str(len(heatmap_ixs)), train_vars['verbose']) + "\n"
+        joint_ixs = list(model.joint_ixs)
     except:
-        msg += print_verbose("Joints indexes: " + str(model.num_heatmaps), train_vars['verbose']) + "\n"
-    msg += print_verbose("-----------------------------------------------------------", train_vars['verbose']) + "\n"
-    msg += print_verbose("Max memory batch size: " + str(train_vars['max_mem_batch']), train_vars['verbose']) + "\n"
-    msg += print_verbose("Length of dataset (in max mem batch size): " + str(len(dataset_loader)),
-                         train_vars['verbose']) + "\n"
-    msg += print_verbose("Training batch size: " + str(train_vars['batch_size']), train_vars['verbose']) + "\n"
-    msg += print_verbose("Starting epoch: " + str(train_vars['start_epoch']), train_vars['verbose']) + "\n"
-    msg += print_verbose("Starting epoch iteration: " + str(train_vars['start_iter_mod']),
-                         train_vars['verbose']) + "\n"
-    msg += print_verbose("Starting overall iteration: " + str(train_vars['start_iter']),
-                         train_vars['verbose']) + "\n"
-    msg += print_verbose("-----------------------------------------------------------", train_vars['verbose']) + "\n"
-    msg += print_verbose("Number of iterations per epoch: " + str(train_vars['n_iter_per_epoch']),
-                         train_vars['verbose']) + "\n"
-    msg += print_verbose("Number of iterations to train: " + str(train_vars['num_iter']),
-                         train_vars['verbose']) + "\n"
-    msg += print_verbose("Approximate number of epochs to train: " +
-                         str(round(train_vars['num_iter'] / train_vars['n_iter_per_epoch'], 1)),
-                         train_vars['verbose']) + "\n"
-    msg += print_verbose("-----------------------------------------------------------", train_vars['verbose']) + "\n"
-
-    if not train_vars['output_filepath'] == '':
-        with open(train_vars['output_filepath'], 'w+') as f:
-            f.write(msg + '\n')
+        joint_ixs = None
+    fields = {
+        'output_filepath': train_vars['output_filepath'],
+        'joint_ixs': joint_ixs,
+        'num_joints': model.num_joints if joint_ixs is None else len(joint_ixs),
+        'max_mem_batch': train_vars['max_mem_batch'],
+        'dataset_length': len(dataset_loader),
+        'batch_size': train_vars['batch_size'],
+        'start_epoch': train_vars['start_epoch'],
+        'start_iter_mod': train_vars['start_iter_mod'],
+        'start_iter': train_vars['start_iter'],
+        'n_iter_per_epoch': train_vars['n_iter_per_epoch'],
+        'num_iter': train_vars['num_iter'],
+    }
+    if 'autotune' in train_vars:
+        fields['autotune'] = train_vars['autotune']
+    # starts the log files of a run
+    log_record(logger, train_vars, 'header', append=False, **fields)
 
-def print_log_info(model, optimizer, epoch, total_loss, vars, train_vars, save_best=True, save_a_checkpoint=True):
-    model_class_name = type(model).__name__
+def get_tracer(train_vars):
+    '''
+    :return: tracer of the training step phases (disabled unless --trace or --trace_filepath)
+    '''
+    return tracing.Tracer(enabled=train_vars['trace'], window=train_vars['trace_window'],
+                          trace_filepath=train_vars['trace_filepath'],
+                          trace_start_iter=train_vars['trace_start_iter'],
+                          trace_num_iter=train_vars['trace_num_iter'],
+                          sync_cuda=train_vars['use_cuda'], pid=train_vars['rank'], verbose=train_vars['verbose'])
+
+def print_trace_info(tracer, train_vars, logger=None):
+    if not tracer.enabled:
+        return
+    log_record(logger, train_vars, 'trace', window=tracer.window, phases=tracer.get_stats())
+
+def get_train_log_fields(model, epoch, total_loss, vars, train_vars):
+    '''
+    :return: fields of the record of print_log_info: losses and their means, overall and over the last
+        log interval, and per joint pixel errors
+    '''
+    log_interval = train_vars['log_interval']
+    fields = {
+        'model': type(model).__name__,
+        'epoch': epoch,
+        'epoch_iter': train_vars['curr_epoch_iter'],
+        'tot_iter': train_vars['tot_iter'],
+        'batch_idx': train_vars['batch_idx'],
+        'iter_size': train_vars['iter_size'],
+        'num_batches': train_vars['num_batches'],
+        'iter': train_vars['curr_iter'],
+        'batch_size': train_vars['batch_size'],
+        'log_interval': log_interval,
+        'loss': total_loss,
+        'best_loss': vars['best_loss'],
+        'mean_loss': np.mean(vars['losses']),
+        'mean_loss_last': np.mean(vars['losses'][-log_interval:]),
+    }
+    if fields['model'] == 'JORNet':
+        for loss_name in ['joints', 'heatmaps']:
+            losses = vars['losses_' + loss_name]
+            fields[loss_name + '_loss'] = losses[-1]
+            fields['best_' + loss_name + '_loss'] = vars['best_loss_' + loss_name]
+            fields['mean_' + loss_name + '_loss'] = np.mean(losses)
+            fields['mean_' + loss_name + '_loss_last'] = np.mean(losses[-log_interval:])
+    pixel_losses = np.array(vars['pixel_losses'])
+    pixel_losses_sample = np.array(vars['pixel_losses_sample'])
+    fields['pixel_loss'] = np.mean(pixel_losses)
+    fields['joints'] = []
+    for heatmap_ix in range(model.num_joints):
+        fields['joints'].append({
+            'mean_last': np.mean(pixel_losses[-log_interval:, heatmap_ix]),
+            'std_last': np.std(pixel_losses[-log_interval:, heatmap_ix]),
+            'mean': np.mean(pixel_losses[:, heatmap_ix]),
+            'last': vars['pixel_losses'][-1][heatmap_ix],
+            'sample_mean_last': np.mean(pixel_losses_sample[-log_interval:, heatmap_ix]),
+            'sample_std_last': np.std(pixel_losses_sample[-log_interval:, heatmap_ix]),
+            'sample_last': vars['pixel_losses_sample'][-1][heatmap_ix],
+        })
+    fields['mean_pixel_loss_last'] = sum(joint['mean_last'] for joint in fields['joints']) / len(model.joint_ixs)
+    fields['mean_pixel_loss'] = sum(joint['mean'] for joint in fields['joints']) / len(model.joint_ixs)
+    return fields
+
+def print_log_info(model, optimizer, epoch, total_loss, vars, train_vars, save_best=True, save_a_checkpoint=True,
+                   tracer=None, logger=None):
     verbose = train_vars['verbose']
+    if tracer is None:
+        tracer = tracing.Tracer(enabled=False)
     print_verbose("", verbose)
     print_verbose("-------------------------------------------------------------------------------------------", verbose)
-    if save_a_checkpoint:
-        print_verbose("Saving checkpoints:", verbose)
-        print_verbose("-------------------------------------------------------------------------------------------",  verbose)
-        checkpoint_model_dict = {
-            'model_state_dict': model.state_dict(),
-            'optimizer_state_dict': optimizer.state_dict(),
-            'train_vars': train_vars,
-        }
-        save_checkpoint(checkpoint_model_dict, filename=vars['checkpoint_filenamebase'] + '.pth.tar')
-    if save_best:
-        save_checkpoint(vars['best_model_dict'],
-                        filename=vars['checkpoint_filenamebase'] + 'best.pth.tar')
-    msg = ''
-    msg += print_verbose("-------------------------------------------------------------------------------------------",
-                         verbose) + "\n"
-    now = datetime.datetime.now()
-    msg += print_verbose('Time: ' + now.strftime("%Y-%m-%d %H:%M"), verbose) + "\n"
-
-    msg += print_verbose("-------------------------------------------------------------------------------------------",
-                         verbose) + "\n"
-
-    msg += print_verbose("-------------------------------------------------------------------------------------------",
-                         verbose) + "\n"
-    msg += print_verbose('Training (Epoch #' + str(epoch) + ' ' + str(train_vars['curr_epoch_iter']) + '/' + \
-                         str(train_vars['tot_iter']) + ')' + ', (Batch ' + str(train_vars['batch_idx'] + 1) + \
-                         '(' + str(train_vars['iter_size']) + ')' + '/' + \
-                         str(train_vars['num_batches']) + ')' + ', (Iter #' + str(train_vars['curr_iter']) + \
-                         '(' + str(train_vars['batch_size']) + ')' + \
-                         ' - log every ' + str(train_vars['log_interval']) + ' iter): ', verbose) + '\n'
-    msg += print_verbose("-------------------------------------------------------------------------------------------",
-                         verbose) + "\n"
-    msg += print_verbose("Current loss: " + str(total_loss), verbose) + "\n"
-    msg += print_verbose("Best loss: " + str(vars['best_loss']), verbose) + "\n"
-    msg += print_verbose("Mean total loss: " + str(np.mean(vars['losses'])), verbose) + "\n"
-    msg += print_verbose("Mean loss for last " + str(train_vars['log_interval']) +
-                         " iterations (average total loss): " + str(
-        np.mean(vars['losses'][-train_vars['log_interval']:])), verbose) + "\n"
-    if model_class_name == 'JORNet':
-        msg += print_verbose("-------------------------------------------------------------------------------------------",
-                             verbose) + "\n"
-        msg += print_verbose("Current joints loss: " + str(vars['losses_joints'][-1]), verbose) + "\n"
-        msg += print_verbose("Best joints loss: " + str(vars['best_loss_joints']), verbose) + "\n"
-        msg += print_verbose("Mean total joints loss: " + str(np.mean(vars['losses_joints'])), verbose) + "\n"
-        msg += print_verbose("Mean joints loss for last " + str(train_vars['log_interval']) +
-                             " iterations (average total joints loss): " + str(
-            np.mean(vars['losses_joints'][-train_vars['log_interval']:])), verbose) + "\n"
-        msg += print_verbose("-------------------------------------------------------------------------------------------",
-                             verbose) + "\n"
-        msg += print_verbose("Current heatmaps loss: " + str(vars['losses_heatmaps'][-1]), verbose) + "\n"
-        msg += print_verbose("Best heatmaps loss: " + str(vars['best_loss_heatmaps']), verbose) + "\n"
-        msg += print_verbose("Mean total heatmaps loss: " + str(np.mean(vars['losses_heatmaps'])), verbose) + "\n"
-        msg += print_verbose("Mean heatmaps loss for last " + str(train_vars['log_interval']) +
-                             " iterations (average total heatmaps loss): " + str(
-            np.mean(vars['losses_heatmaps'][-train_vars['log_interval']:])), verbose) + "\n"
-    msg += print_verbose("-------------------------------------------------------------------------------------------",
-                         verbose) + "\n"
-    msg += print_verbose("Joint pixel losses:", verbose) + "\n"
-    msg += print_verbose("-------------------------------------------------------------------------------------------",
-                         verbose) + "\n"
-    joint_loss_avg = 0
-    aa = np.mean(np.array(vars['pixel_losses']))
-    msg += print_verbose("\tTotal mean pixel loss: " + str(aa), verbose) + '\n'
-    msg += print_verbose("-------------------------------------------------------------------------------------------",
-                         verbose) + "\n"
-    tot_joint_loss_avg = 0
-    for heatmap_ix in range(model.num_heatmaps):
-        msg += print_verbose("\tJoint index: " + str(heatmap_ix), verbose) + "\n"
-        mean_joint_pixel_loss = np.mean(
-                                 np.array(vars['pixel_losses'])
-                                 [-train_vars['log_interval']:, heatmap_ix])
-        joint_loss_avg += mean_joint_pixel_loss
-        tot_mean_joint_pixel_loss = np.mean(np.array(vars['pixel_losses'])[:, heatmap_ix])
-        tot_joint_loss_avg += tot_mean_joint_pixel_loss
-        msg += print_verbose("\tTraining set mean error for last " + str(train_vars['log_interval']) +
-                             " iterations (average pixel loss): " +
-                             str(mean_joint_pixel_loss),
-                             verbose) + "\n"
-        msg += print_verbose("\tTraining set stddev error for last " + str(train_vars['log_interval']) +
-                             " iterations (average pixel loss): " +
-                             str(np.std(
-                                 np.array(vars['pixel_losses'])[-train_vars['log_interval']:, heatmap_ix])),
-                             verbose) + "\n"
-        msg += print_verbose("\tThis is the last pixel dist loss: " + str(vars['pixel_losses'][-1][heatmap_ix]),
-                             verbose) + "\n"
-        msg += print_verbose("\tTraining set mean error for last " + str(train_vars['log_interval']) +
-                             " iterations (average pixel loss of sample): " +
-                             str(np.mean(np.array(vars['pixel_losses_sample'])[-train_vars['log_interval']:,
-                                         heatmap_ix])), verbose) + "\n"
-        msg += print_verbose("\tTraining set stddev error for last " + str(train_vars['log_interval']) +
-                             " iterations (average pixel loss of sample): " +
-                             str(np.std(np.array(vars['pixel_losses_sample'])[-train_vars['log_interval']:,
-                                        heatmap_ix])), verbose) + "\n"
-        msg += print_verbose(
-            "\tThis is the last pixel dist loss of sample: " + str(vars['pixel_losses_sample'][-1][heatmap_ix]),
-            verbose) + "\n"
-        msg += print_verbose(
-            "\t-------------------------------------------------------------------------------------------",
-            verbose) + "\n"
-        msg += print_verbose(
-            "-------------------------------------------------------------------------------------------",
-            verbose) + "\n"
-    joint_loss_avg /= len(model.heatmap_ixs)
-    tot_joint_loss_avg /= len(model.heatmap_ixs)
-    msg += print_verbose("-------------------------------------------------------------------------------------------",
-                         verbose) + "\n"
-    msg += print_verbose("\tCurrent mean pixel loss: " + str(joint_loss_avg), verbose) + '\n'
-    msg += print_verbose("-------------------------------------------------------------------------------------------",
-                         verbose) + "\n"
-    msg += print_verbose("-------------------------------------------------------------------------------------------",
-                         verbose) + "\n"
-    msg += print_verbose("\tTotal mean pixel loss: " + str(tot_joint_loss_avg), verbose) + '\n'
-    msg += print_verbose("-------------------------------------------------------------------------------------------",
-                         verbose) + "\n"
-    if not train_vars['output_filepath'] == '':
-        with open(train_vars['output_filepath'], 'a') as f:
-            f.write(msg + '\n')
-
-    return tot_joint_loss_avg
+    with tracer.span('checkpoint'):
+        if save_a_checkpoint:
+            print_verbose("Saving checkpoints:", verbose)
+            print_verbose("-------------------------------------------------------------------------------------------",  verbose)
+            checkpoint_model_dict = {
+                'model_state_dict': model.state_dict(),
+                'optimizer_state_dict': optimizer.state_dict(),
+                'train_vars': train_vars,
+            }
+            save_checkpoint(checkpoint_model_dict, filename=vars['checkpoint_filenamebase'] + '.pth.tar')
+        if save_best:
+            save_checkpoint(vars['best_model_dict'],
+                            filename=vars['checkpoint_filenamebase'] + 'best.pth.tar')
+    record = log_record(logger, train_vars, 'train', **get_train_log_fields(model, epoch, total_loss, vars, train_vars))
+    return record['mean_pixel_loss']
 
 
 def get_vars(model_class):
@@ -460,6 +632,8 @@ def get_vars(model_class):
         output_split_name = train_vars['output_filepath'].split('.')
         train_vars['output_filepath'] = output_split_name[0] + '_' + str(model_class.__name__) + '_' +\
                                           str(RANDOM_ID) + '.' + output_split_name[1]
+    if train_vars['log_filepath'] == '' and not train_vars['output_filepath'] == '':
+        train_vars['log_filepath'] = os.path.splitext(train_vars['output_filepath'])[0] + '.jsonl'
     if model_class.__name__ == 'JORNet':
         train_vars['crop_hand'] = True
     else:
@@ -469,21 +643,16 @@ def get_vars(model_class):
 
 def run_until_curr_iter(batch_idx, train_vars):
     if train_vars['curr_epoch_iter'] < train_vars['start_iter_mod']:
-        msg = ''
+        # progress only goes to the console, not to the log files
         if batch_idx % train_vars['iter_size'] == 0:
-            msg += print_verbose("\rGoing through iterations to arrive at last one saved... " +
-                                 str(int(train_vars['curr_epoch_iter'] * 100.0 / train_vars[
-                                     'start_iter_mod'])) + "% of " +
-                                 str(train_vars['start_iter_mod']) + " iterations (" +
-                                 str(train_vars['curr_epoch_iter']) + "/" + str(train_vars['start_iter_mod']) + ")",
-                                 train_vars['verbose'], n_tabs=0, erase_line=True)
+            print_verbose("\rGoing through iterations to arrive at last one saved... " +
+                          str(int(train_vars['curr_epoch_iter'] * 100.0 / train_vars[
+                              'start_iter_mod'])) + "% of " +
+                          str(train_vars['start_iter_mod']) + " iterations (" +
+                          str(train_vars['curr_epoch_iter']) + "/" + str(train_vars['start_iter_mod']) + ")",
+                          train_vars['verbose'], n_tabs=0, erase_line=True)
             train_vars['curr_epoch_iter'] += 1
             train_vars['curr_iter'] += 1
             train_vars['curr_epoch_iter'] += 1
-        if not train_vars['output_filepath'] == '':
-            with open(train_vars['output_filepath'], 'a') as f:
-                f.write(msg + '\n')
         return False, train_vars
     return True, train_vars
-
-
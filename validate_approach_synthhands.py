@@ -2,27 +2,31 @@
 # -i female_object/seq01/cam01/01/00000000 -r /home/paulo/SynthHands_Release/ --halnet /home/paulo/muellericcv2017/trainednets/trained_HALNet_1493752625_for_valid_38000.pth.tar --jornet /home/paulo/muellericcv2017/trainednets/trained_JORNet_1662451312_for_valid_70000.pth.tar
 # -i Fruits/color_on_depth/image_00000 -r /home/paulo/EgoDexter/data/ --halnet /home/paulo/muellericcv2017/trainednets/trained_HALNet_1493752625_.pth.tar --jornet /home/paulo/muellericcv2017/trainednets/trained_JORNet_1662451312_for_valid_30000.pth.tar
 
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
 import numpy as np
+import torch
 import io_image
-import trainer
+import inference_backends
 import synthhands_handler
 import argparse
 import converter as conv
 import HALNet, JORNet
+import metrics
 import time
 import camera
-import visualize
+from magic import display_est_time_loop
 
 
 MAX_NUM_EXAMPLES = 30
 IMG_RES = (320, 240)
+JORNET_RES = (128, 128)
+NUM_JOINTS = 21
 
 def print_time(str_, time_diff):
     print(str_ + str(round(time_diff*1000)) + ' ms')
 
 def plot_joints(joints_colorspace, show_legend=True, linewidth=4):
+    from matplotlib import pyplot as plt
+    import matplotlib.patches as mpatches
     num_joints = joints_colorspace.shape[0]
     joints_colorspace = conv.numpy_swap_cols(joints_colorspace, 0, 1)
     plt.plot(joints_colorspace[0, 1], joints_colorspace[0, 0], 'ro', color='C0')
@@ -63,16 +67,6 @@ def get_image_as_data(dataset_folder, input_img_namebase, dataset_name, img_res)
         data = egodexter_handler.get_data(dataset_folder, input_img_namebase, img_res=img_res)
     return data
 
-def load_examples_to_memory(num_labels, dataset):
-    data = []
-    img_paths = []
-    for i in range(num_labels):
-        img_paths.append(dataset.filenamebases[i])
-        img_data, img_labels = dataset[i]
-        labels_colorspace, labels_jointvec, _, handroot_groundtruth = img_labels
-        data.append((img_data, (labels_colorspace, labels_jointvec, handroot_groundtruth)))
-    return data, img_paths
-
 def parse_args():
     parser = argparse.ArgumentParser(description='Train a hand-tracking deep neural network')
     parser.add_argument('-r', dest='dataset_folder', default='', type=str, required=True,
@@ -83,256 +77,174 @@ def parse_args():
                         help='Filepath to trained HALNet checkpoint')
     parser.add_argument('--cuda', dest='use_cuda', action='store_true', default=False,
                         help='Whether to use cuda for training')
+    parser.add_argument('--backend', dest='backend', default='eager', choices=inference_backends.BACKENDS,
+                        help='Inference backend (default eager). For torchscript/onnx, --halnet and --jornet '
+                             'are the files written by exporter.py')
     parser.add_argument('-o', dest='output_filepath', default='',
                         help='Output file for logging')
+    parser.add_argument('-n', dest='num_examples', type=int, default=MAX_NUM_EXAMPLES,
+                        help='Number of examples to process (default ' + str(MAX_NUM_EXAMPLES) + ')')
+    parser.add_argument('--batch_size', dest='batch_size', type=int, default=1,
+                        help='Number of examples per HALNet/JORNet pass (default 1; larger batches pay off on GPU)')
+    parser.add_argument('--num_workers', dest='num_workers', type=int, default=0,
+                        help='Number of data loader worker processes (default 0)')
+    parser.add_argument('-v', dest='verbose', action='store_true', default=False,
+                        help='Whether to display progress')
     return parser.parse_args()
 
 def print_divisor(num=100):
     print('-' * num)
 
-args = parse_args()
-dataset_name = args.dataset_folder.split('/')[-2]
-
-synthhands = synthhands_handler.SynthHandsDataset(root_folder=args.dataset_folder, type_='full', heatmap_res=IMG_RES)
-num_examples = min(MAX_NUM_EXAMPLES, len(synthhands))
-
-print_divisor()
-print('Arguments')
-print('\tDataset root: {}'.format(args.dataset_folder))
-print('\tHALNet filepath: {}'.format(args.halnet_filepath))
-print('\tJORNet filepath: {}'.format(args.jornet_filepath))
-print('\tUsing CUDA: {}'.format(args.use_cuda))
-print_divisor()
-print('Dataset: ')
-print('\tSize of dataset: {}'.format(len(synthhands)))
-print('\tNumber of examples to process: {}'.format(num_examples))
-start = time.time()
-dataset_data, img_paths = load_examples_to_memory(num_examples, synthhands)
-print_time('\tLoaded examples to memory: ', time.time() - start)
-print_divisor()
-
-print('Neural networks: ')
-# load nets
-start = time.time()
-halnet, _, _, _ = trainer.load_checkpoint(filename=args.halnet_filepath,
-                                          model_class=HALNet.HALNet,
-                                          use_cuda=args.use_cuda)
-print_time('\tHALNet loaded: ', time.time() - start)
-
-start = time.time()
-jornet, _, _, _ = trainer.load_checkpoint(filename=args.jornet_filepath,
-                                          model_class=JORNet.JORNet,
-                                          use_cuda=args.use_cuda)
-print_time('\tJORNet loaded: ', time.time() - start)
-print_divisor()
-
-losses_halnet_per_joints = np.zeros((num_examples, 21))
-losses_halnet_joints_tot = []
-losses_jornet_per_joints = np.zeros((num_examples, 21))
-losses_jornet_joints_tot = []
-losses_jornet_per_joints_depth = np.zeros((num_examples, 21))
-losses_jornet_depth_tot = []
-num_valid_loss_iter = 0
-tot_loss = 0
-for example_ix in range(num_examples):
-    start_beg = time.time()
-
-    print('Processing example #{}: {}'.format(example_ix, img_paths[example_ix]))
-    dataset_datum = dataset_data[example_ix]
-    img_data, img_labels = dataset_datum
-    img_numpy = img_data.data.numpy()
-    img_labels_2D, img_labels_3D, handroot_groundtruth = img_labels
-    img_labels_3D = img_labels_3D.data.numpy().reshape((21, 3))
-
-    print('\tHALNet:')
-    start = time.time()
-    halnet_input = conv.data_to_batch(img_data)
-    print_time('\t\tHALNet image convertion: ', time.time() - start)
 
-    start = time.time()
-    output_halnet = halnet(halnet_input)
-    print_time('\t\tHALNet pass: ', time.time() - start)
-
-    halnet_main_out = output_halnet[3][0].data.numpy()
-    halnet_handroot = np.array(np.unravel_index(np.argmax(halnet_main_out[0]), IMG_RES))
-    print('\t\t\tHALNet hand root:\t{}'.format(halnet_handroot))
-
-    # get halnet joints in colorspace from heatmaps
-    halnet_joints_colorspace = conv.heatmaps_to_joints_colorspace(halnet_main_out)
-
-    print('\tHALNet joint pixel loss:')
-    num_valid_loss = 0
-    loss_halnet_joints = 0
-    for i in range(21):
-        curr_loss = np.linalg.norm(img_labels_2D[i, :] - halnet_joints_colorspace[i, :])
-        loss_halnet_joints += curr_loss
-        losses_halnet_per_joints[example_ix, i] = curr_loss
-        print('\t\t\tJoint {}: {}\t{} : {}'.format(i, img_labels_2D[i, :], halnet_joints_colorspace[i, :], curr_loss))
-    losses_halnet_joints_tot.append(loss_halnet_joints / 21)
-    print('\t\tAverage loss for HALNet joints: {}'.format(losses_halnet_joints_tot[-1]))
-    print_divisor()
+def process_batch(halnet, jornet, data, labels_2D, labels_3D, handroots, use_cuda=False):
+    '''
+    Runs HALNet on a batch, then JORNet on the hand crops around HALNet's joints
+    :return: (N, NUM_JOINTS) arrays of the joint errors of HALNet (pixels), JORNet (pixels, in its crop)
+        and JORNet (mm)
+    '''
+    data_numpy = data.numpy()
+    labels_2D = labels_2D.numpy()
+
+    output_halnet = halnet.forward_inference(conv.batch_to_device_float(data, use_cuda))
+    halnet_joints_colorspace = conv.batch_heatmaps_to_joints_colorspace(output_halnet)
+    halnet_errors = metrics.get_joint_errors(halnet_joints_colorspace, labels_2D)
+
+    data_crops = np.zeros((data_numpy.shape[0], 4) + JORNET_RES, dtype=np.float32)
+    labels_2D_cropped = np.zeros(labels_2D.shape)
+    for i in range(data_numpy.shape[0]):
+        data_crops[i], crop_coords = io_image.crop_hand_rgbd(halnet_joints_colorspace[i], data_numpy[i],
+                                                             crop_res=JORNET_RES)
+        _, labels_2D_cropped[i] = io_image.get_labels_cropped_heatmaps(
+            labels_2D[i], joint_ixs=range(NUM_JOINTS), crop_coords=crop_coords, heatmap_res=JORNET_RES)
+    output_jornet = jornet.forward_inference(conv.batch_to_device_float(torch.from_numpy(data_crops), use_cuda))
+    jornet_joints_colorspace = conv.batch_heatmaps_to_joints_colorspace(output_jornet[0])
+    jornet_errors = metrics.get_joint_errors(jornet_joints_colorspace, labels_2D_cropped)
+
+    # regressed joints are relative to the (ground truth) hand root, without it
+    handroots = handroots.numpy().reshape((-1, 1, 3))
+    jornet_joints = output_jornet[1].detach().cpu().numpy().reshape((-1, 20, 3))
+    jornet_joints_global = np.concatenate((handroots, jornet_joints + handroots), axis=1)
+    jornet_depth_errors = metrics.get_joint_errors(jornet_joints_global,
+                                                   labels_3D.numpy().reshape((-1, NUM_JOINTS, 3)))
+    return halnet_errors, jornet_errors, jornet_depth_errors
+
+def get_bar_chart_values(joint_metrics):
+    '''
+    :return: per joint means and errors (half stds) for plot_per_joint_bar_chart, with the mean and std of the
+        per example errors added last
+    '''
+    means_per_joint = [float(mean) for mean in joint_metrics['mean']] + [joint_metrics['frame_mean']]
+    err_per_joint = [float(std) / 2. for std in joint_metrics['std']] + [joint_metrics['frame_std']]
+    return means_per_joint, err_per_joint
+
+def print_metrics(name, joint_metrics):
+    print('\t' + name)
+    print(metrics.format_metrics(joint_metrics))
+    print('\t\tAverage loss: {}'.format(joint_metrics['frame_mean']))
+    print('\t\tStddev loss: {}'.format(joint_metrics['frame_std']))
+    print('\t\tAUC of the percentage of frames under each threshold: {}'.format(joint_metrics['auc_frames']))
+
+
+def main():
+    args = parse_args()
+    # plotting only; imported here so the helpers above can be imported headless
+    import visualize
+
+    synthhands = synthhands_handler.SynthHandsDataset(root_folder=args.dataset_folder, type_='full', heatmap_res=IMG_RES)
+    examples = torch.utils.data.Subset(synthhands, range(min(args.num_examples, len(synthhands))))
+    loader = torch.utils.data.DataLoader(examples, batch_size=args.batch_size, shuffle=False,
+                                         num_workers=args.num_workers)
+    num_examples = len(examples)
 
-    #fig = visualize.plot_image(img_numpy)
-    #visualize.plot_joints(halnet_joints_colorspace, fig=fig)
-    #visualize.show()
+    print_divisor()
+    print('Arguments')
+    print('\tDataset root: {}'.format(args.dataset_folder))
+    print('\tHALNet filepath: {}'.format(args.halnet_filepath))
+    print('\tJORNet filepath: {}'.format(args.jornet_filepath))
+    print('\tUsing CUDA: {}'.format(args.use_cuda))
+    print_divisor()
+    print('Dataset: ')
+    print('\tSize of dataset: {}'.format(len(synthhands)))
+    print('\tNumber of examples to process: {}'.format(num_examples))
+    print_divisor()
 
-    print('\tJORNet:')
+    print('Neural networks: ')
+    # load nets
     start = time.time()
-    data_crop, crop_coords, _, _ = io_image.crop_image_get_labels(img_numpy, halnet_joints_colorspace)
-    batch_jornet = conv.data_to_batch(data_crop)
-    print_time('\t\tJORNet image conversion: ', time.time() - start)
-
+    halnet = inference_backends.load_backend(args.backend, args.halnet_filepath,
+                                             model_class=HALNet.HALNet, use_cuda=args.use_cuda)
+    print_time('\tHALNet loaded: ', time.time() - start)
 
     start = time.time()
-    output_jornet = jornet(batch_jornet)
-    print_time('\t\tJORNet pass: ', time.time() - start)
-
-    _, img_labels_2D_cropped = io_image.get_labels_cropped_heatmaps(
-        img_labels_2D, joint_ixs=range(21), crop_coords=crop_coords, heatmap_res=(128, 128))
-
-    print('\tImage labels (2D cropped to (128, 128)):')
-    for i in range(21):
-        depth_const = img_numpy[3, int(img_labels_2D_cropped[i, 0]), int(img_labels_2D_cropped[i, 1])]
-        print('\t\tFinger tip {}: {}'.format(i, img_labels_2D_cropped[i, :]))
+    jornet = inference_backends.load_backend(args.backend, args.jornet_filepath,
+                                             model_class=JORNet.JORNet, use_cuda=args.use_cuda)
+    print_time('\tJORNet loaded: ', time.time() - start)
     print_divisor()
 
-    print('\tJORNet joint pixel loss:')
-    output_jornet_heatmaps_main = output_jornet[3][0].data.numpy()
-    jornet_joints_colorspace = conv.heatmaps_to_joints_colorspace(output_jornet_heatmaps_main)
-    num_valid_loss = 0
-    loss_jornet_joints = 0
-    for i in range(21):
-        curr_loss = np.linalg.norm(img_labels_2D_cropped[i, :] - jornet_joints_colorspace[i, :])
-        loss_jornet_joints += curr_loss
-        losses_jornet_per_joints[example_ix, i] = curr_loss
-        print('\t\t\tJoint {}: {}\t{} : {}'.format(i, img_labels_2D_cropped[i, :], jornet_joints_colorspace[i, :], curr_loss))
-    losses_jornet_joints_tot.append(loss_jornet_joints / 21)
-    print('\t\tAverage loss for HALNet joints: {}'.format(losses_jornet_joints_tot[-1]))
-    print_divisor()
-
-    #fig = visualize.plot_image(data_crop)
-    #visualize.plot_joints(img_labels_2D_cropped, fig=fig)
-    #visualize.plot_joints(jornet_joints_colorspace, fig=fig)
-    #visualize.show()
-
-    output_jornet_joints_main = output_jornet[7][0].data.cpu().numpy().reshape((20, 3))
-    #handroot = camera.joint_color2depth(halnet_joints_colorspace[0, 0],
-    #                                    halnet_joints_colorspace[0, 1],
-    #                                    200,
-    #                                    synthhands_handler.DEPTH_INTR_MTX_INV)
-    handroot = handroot_groundtruth
-    jornet_joints_global = conv.jornet_local_to_global_joints(output_jornet_joints_main, handroot)
-
-
-    #fig, ax = visualize.plot_3D_joints(jornet_joints_global)
-    #visualize.plot_3D_joints(img_labels_3D, fig=fig, ax=ax)
-    #visualize.show()
-
-    print('\tJORNet joint depth loss:')
-    num_valid_loss = 0
-    loss_jornet_depth = 0
-    for i in range(21):
-        curr_loss = np.linalg.norm(img_labels_3D[i, :] - jornet_joints_global[i, :])
-        losses_jornet_per_joints_depth[example_ix, i] = curr_loss
-        loss_jornet_depth += curr_loss
-        print('\t\t\tFinger tip {}: {}\t{} : {}'.format(i, img_labels_3D[i, :],
-                                                        jornet_joints_global[i, :],
-                                                        curr_loss))
-    loss_jornet_depth /= 21
-    losses_jornet_depth_tot.append(loss_jornet_depth)
-    print('\t\tAverage loss for JORNet depth: {}'.format(loss_jornet_depth))
+    halnet_errors = metrics.ErrorAccumulator(NUM_JOINTS)
+    jornet_errors = metrics.ErrorAccumulator(NUM_JOINTS)
+    jornet_depth_errors = metrics.ErrorAccumulator(NUM_JOINTS)
+    tot_toc = 0
+    start = time.time()
+    for batch_idx, (data, labels) in enumerate(loader):
+        labels_2D, labels_3D, _, handroots = labels
+        halnet_batch_errors, jornet_batch_errors, jornet_batch_depth_errors = \
+            process_batch(halnet, jornet, data, labels_2D, labels_3D, handroots, use_cuda=args.use_cuda)
+        halnet_errors.add_batch(halnet_batch_errors)
+        jornet_errors.add_batch(jornet_batch_errors)
+        jornet_depth_errors.add_batch(jornet_batch_depth_errors)
+        if args.verbose:
+            tot_toc = display_est_time_loop(tot_toc + time.time() - start, batch_idx + 1, len(loader),
+                                            prefix='Processing batch ' + str(batch_idx + 1) + '/' +
+                                                   str(len(loader)) + ': ')
+            start = time.time()
+
+    pixel_thresholds = metrics.get_thresholds(30, 30)
+    mm_thresholds = metrics.get_thresholds(60, 60)
+    halnet_metrics = halnet_errors.get_metrics(pixel_thresholds)
+    jornet_metrics = jornet_errors.get_metrics(pixel_thresholds)
+    jornet_depth_metrics = jornet_depth_errors.get_metrics(mm_thresholds)
+
+    print('\tLosses per joint (pixels for HALNet and JORNet, mm for JORNet depth):')
+    print_metrics('HALNet', halnet_metrics)
+    print_metrics('JORNet', jornet_metrics)
+    print_metrics('JORNet depth', jornet_depth_metrics)
     print_divisor()
 
-    print('\tLosses:')
-    print('\tHALNet')
-    print('\t\tAverage joint loss: {}'.format(np.mean(losses_halnet_joints_tot)))
-    print('\t\tStddev joint loss: {}'.format(np.std(losses_halnet_joints_tot)))
-    print('\t\tPer joint loss (average ; std):')
-    halnet_means_per_joint = [0.] * 22
-    halnet_err_per_joint = [0.] * 22
-    for joint_ix in range(21):
-        halnet_means_per_joint[joint_ix] = float(np.mean(losses_halnet_per_joints[:, joint_ix]))
-        halnet_err_per_joint[joint_ix] = float(np.std(losses_halnet_per_joints[:, joint_ix])) / 2.
-        print('\t\t\tJoint\t{}:\t{}\t;\t{}'.
-              format(joint_ix,
-                     halnet_means_per_joint[joint_ix],
-                     np.std(losses_halnet_per_joints[:, joint_ix])))
-    halnet_means_per_joint[-1] = np.mean(losses_halnet_joints_tot)
-    halnet_err_per_joint[-1] = np.std(losses_halnet_joints_tot)
-    print('\tJORNet')
-    print('\t\tPer joint loss (average ; std):')
-    jornet_means_per_joint = [0.] * 22
-    jornet_err_per_joint = [0.] * 22
-    for joint_ix in range(21):
-        jornet_means_per_joint[joint_ix] = float(np.mean(losses_jornet_per_joints[:, joint_ix]))
-        jornet_err_per_joint[joint_ix] = float(np.std(losses_jornet_per_joints[:, joint_ix])) / 2.
-        print('\t\t\tJoint\t{}:\t{}\t;\t{}'.
-              format(joint_ix,
-                     jornet_means_per_joint[joint_ix],
-                     np.std(losses_jornet_per_joints[:, joint_ix])))
-    jornet_means_per_joint[-1] = np.mean(losses_jornet_joints_tot)
-    jornet_err_per_joint[-1] = np.std(losses_jornet_joints_tot)
-
-    print('\t\tPer joint loss depth (average ; std):')
-    jornet_means_per_joint_depth = [0.] * 22
-    jornet_err_per_joint_depth = [0.] * 22
-    for joint_ix in range(21):
-        jornet_means_per_joint_depth[joint_ix] = float(np.mean(losses_jornet_per_joints_depth[:, joint_ix]))
-        jornet_err_per_joint_depth[joint_ix] = float(np.std(losses_jornet_per_joints_depth[:, joint_ix])) / 2.
-        print('\t\t\tJoint\t{}:\t{}\t;\t{}'.
-              format(joint_ix,
-                     jornet_means_per_joint_depth[joint_ix],
-                     np.std(losses_jornet_per_joints_depth[:, joint_ix])))
-    jornet_means_per_joint_depth[-1] = np.mean(losses_jornet_depth_tot)
-    jornet_err_per_joint_depth[-1] = np.std(losses_jornet_depth_tot)
-
-    print('\t\tAverage depth loss: {}'.format(np.mean(losses_jornet_depth_tot)))
-    print('\t\tStddev depth loss: {}'.format(np.std(losses_jornet_depth_tot)))
+    print('Percentage of frames under each JORNet error threshold (pixels):')
+    print(jornet_metrics['pck_frames'] * 100)
     print_divisor()
 
-num_ranges = 30
-max_range = 30
-frames_per_mm_range = np.zeros((num_ranges, 1))
-losses_jornet_joints_tot_array = np.array(losses_jornet_joints_tot)
-for i in range(num_ranges):
-    ixs = np.array(losses_jornet_joints_tot_array < i * (max_range/num_ranges))
-    frames_per_mm_range[i] = (np.sum(ixs) / len(losses_jornet_joints_tot)) * 100
-    print(frames_per_mm_range[i])
-print_divisor()
-
-visualize.plot_line(frames_per_mm_range, xlabel='Error threshold (pixels)', ylabel='Percentage of frames',
-                    fontsize=30, tickwidth=10, linewidth=10)
-visualize.show()
-
-num_mm_ranges = 60
-max_range = 60
-frames_per_mm_range = np.zeros((num_mm_ranges, 1))
-losses_jornet_depth_tot_array = np.array(losses_jornet_depth_tot)
-for i in range(num_mm_ranges):
-    ixs = np.array(losses_jornet_depth_tot_array < i * (max_range/num_mm_ranges))
-    frames_per_mm_range[i] = (np.sum(ixs) / len(losses_jornet_depth_tot)) * 100
-    print(frames_per_mm_range[i])
-print_divisor()
-
-visualize.plot_line(frames_per_mm_range, xlabel='Error threshold (mm)', ylabel='Percentage of frames',
-                    fontsize=30, tickwidth=10, linewidth=10)
-visualize.show()
+    visualize.plot_line(jornet_metrics['pck_frames'] * 100, xlabel='Error threshold (pixels)',
+                        ylabel='Percentage of frames', fontsize=30, tickwidth=10, linewidth=10)
+    visualize.show()
 
+    print('Percentage of frames under each JORNet error threshold (mm):')
+    print(jornet_depth_metrics['pck_frames'] * 100)
+    print_divisor()
 
+    visualize.plot_line(jornet_depth_metrics['pck_frames'] * 100, xlabel='Error threshold (mm)',
+                        ylabel='Percentage of frames', fontsize=30, tickwidth=10, linewidth=10)
+    visualize.show()
 
-visualize.plot_per_joint_bar_chart(halnet_means_per_joint, halnet_err_per_joint, added_avg_value=True,
-                                   horizontal=True, xlabel='Joint dist loss (pixels)',
-                                   ylabel='Joint name', title='SynthHands : HALNet: Loss per Joint (pixels)')
-visualize.show()
+    halnet_means_per_joint, halnet_err_per_joint = get_bar_chart_values(halnet_metrics)
+    visualize.plot_per_joint_bar_chart(halnet_means_per_joint, halnet_err_per_joint, added_avg_value=True,
+                                       horizontal=True, xlabel='Joint dist loss (pixels)',
+                                       ylabel='Joint name', title='SynthHands : HALNet: Loss per Joint (pixels)')
+    visualize.show()
 
-visualize.plot_per_joint_bar_chart(jornet_means_per_joint, jornet_err_per_joint, added_avg_value=True,
-                                   horizontal=True, xlabel='Joint dist loss (pixels)',
-                                   ylabel='Joint name', title='SynthHands : JORNet: Loss per Joint (pixels)')
-visualize.show()
+    jornet_means_per_joint, jornet_err_per_joint = get_bar_chart_values(jornet_metrics)
+    visualize.plot_per_joint_bar_chart(jornet_means_per_joint, jornet_err_per_joint, added_avg_value=True,
+                                       horizontal=True, xlabel='Joint dist loss (pixels)',
+                                       ylabel='Joint name', title='SynthHands : JORNet: Loss per Joint (pixels)')
+    visualize.show()
 
-visualize.plot_per_joint_bar_chart(jornet_means_per_joint_depth, jornet_err_per_joint_depth, added_avg_value=True,
-                                   horizontal=True, xlabel='Joint dist loss (mm)',
-                                   ylabel='Joint name', title='SynthHands : JORNet: Loss per Joint (depth)')
-visualize.show()
+    jornet_means_per_joint_depth, jornet_err_per_joint_depth = get_bar_chart_values(jornet_depth_metrics)
+    visualize.plot_per_joint_bar_chart(jornet_means_per_joint_depth, jornet_err_per_joint_depth, added_avg_value=True,
+                                       horizontal=True, xlabel='Joint dist loss (mm)',
+                                       ylabel='Joint name', title='SynthHands : JORNet: Loss per Joint (depth)')
+    visualize.show()
 
 
+if __name__ == '__main__':
+    main()
@@ -26,9 +26,9 @@ def validate(valid_loader, model, optimizer, valid_vars, control_vars, verbose=T
         start = time.time()
         # get data and targetas cuda variables
         target_heatmaps, target_joints, target_joints_z = target
+        data = conv.batch_to_device_float(data, valid_vars['use_cuda'])
         data, target_heatmaps = Variable(data), Variable(target_heatmaps)
         if valid_vars['use_cuda']:
-            data = data.cuda()
             target_heatmaps = target_heatmaps.cuda()
         # visualize if debugging
         # get model output
@@ -123,29 +123,37 @@ def validate(valid_loader, model, optimizer, valid_vars, control_vars, verbose=T
 
     return valid_vars, control_vars
 
-model, optimizer, control_vars, valid_vars, train_control_vars = validator.parse_args(model_class=HALNet)
-if valid_vars['use_cuda']:
-    torch.set_default_tensor_type('torch.cuda.FloatTensor')
 
-valid_loader = synthhands_handler.get_SynthHands_testloader(root_folder=valid_vars['root_folder'],
-                                                             joint_ixs=model.joint_ixs,
-                                                             heatmap_res=(320, 240),
-                                                             batch_size=control_vars['max_mem_batch'],
-                                                             verbose=control_vars['verbose'])
-control_vars['num_batches'] = len(valid_loader)
-control_vars['n_iter_per_epoch'] = int(len(valid_loader) / control_vars['iter_size'])
-control_vars['num_iter'] = len(valid_loader)
+def main():
+    model, optimizer, control_vars, valid_vars, train_control_vars = validator.parse_args(model_class=HALNet)
+    if valid_vars['use_cuda']:
+        torch.set_default_tensor_type('torch.cuda.FloatTensor')
 
-control_vars['tot_iter'] = int(len(valid_loader) / control_vars['iter_size'])
-control_vars['start_iter_mod'] = control_vars['start_iter'] % control_vars['tot_iter']
+    valid_loader = synthhands_handler.get_SynthHands_testloader(root_folder=valid_vars['root_folder'],
+                                                                 joint_ixs=model.joint_ixs,
+                                                                 heatmap_res=(320, 240),
+                                                                 batch_size=control_vars['max_mem_batch'],
+                                                                 verbose=control_vars['verbose'],
+                                                                 cache_bytes=control_vars['cache_mb'] * 2**20,
+                                                                 num_workers=control_vars['num_workers'])
+    control_vars['num_batches'] = len(valid_loader)
+    control_vars['n_iter_per_epoch'] = int(len(valid_loader) / control_vars['iter_size'])
+    control_vars['num_iter'] = len(valid_loader)
 
-trainer.print_header_info(model, valid_loader, control_vars)
+    control_vars['tot_iter'] = int(len(valid_loader) / control_vars['iter_size'])
+    control_vars['start_iter_mod'] = control_vars['start_iter'] % control_vars['tot_iter']
 
-control_vars['curr_iter'] = 1
-control_vars['curr_epoch_iter'] = 1
+    trainer.print_header_info(model, valid_loader, control_vars)
 
-valid_vars['total_loss'] = 0
-valid_vars['total_pixel_loss'] = [0] * len(model.joint_ixs)
-valid_vars['total_pixel_loss_sample'] = [0] * len(model.joint_ixs)
+    control_vars['curr_iter'] = 1
+    control_vars['curr_epoch_iter'] = 1
 
-valid_vars, control_vars = validate(valid_loader, model, optimizer, valid_vars, control_vars, control_vars['verbose'])
\ No newline at end of file
+    valid_vars['total_loss'] = 0
+    valid_vars['total_pixel_loss'] = [0] * len(model.joint_ixs)
+    valid_vars['total_pixel_loss_sample'] = [0] * len(model.joint_ixs)
+
+    valid_vars, control_vars = validate(valid_loader, model, optimizer, valid_vars, control_vars, control_vars['verbose'])
+
+
+if __name__ == '__main__':
+    main()
@@ -24,9 +24,9 @@ def validate(valid_loader, model, optimizer, valid_vars, control_vars, verbose=T
         start = time.time()
         # get data and targetas cuda variables
         target_2D, target_heatmaps = target
+        data = conv.batch_to_device_float(data, valid_vars['use_cuda'])
         data, target_heatmaps = Variable(data), Variable(target_heatmaps)
         if valid_vars['use_cuda']:
-            data = data.cuda()
             target_heatmaps = target_heatmaps.cuda()
         # visualize if debugging
         # get model output
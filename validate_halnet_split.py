@@ -31,9 +31,9 @@ def validate(valid_loader, model, optimizer, valid_vars, control_vars, dataset_n
             _, target_heatmaps = target
         else:
             target_heatmaps, _, _ = target
+        data = conv.batch_to_device_float(data, valid_vars['use_cuda'])
         data, target_heatmaps = Variable(data), Variable(target_heatmaps)
         if valid_vars['use_cuda']:
-            data = data.cuda()
             target_heatmaps = target_heatmaps.cuda()
         # visualize if debugging
         #losses_main get model output
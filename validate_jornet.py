@@ -34,9 +34,9 @@ def validate(valid_loader, model, optimizer, valid_vars, control_vars, verbose=T
         target_heatmaps, target_joints, target_handroot = target
         # make target joints be relative
         target_joints = target_joints[:, 3:]
+        data = conv.batch_to_device_float(data, valid_vars['use_cuda'])
         data, target_heatmaps = Variable(data), Variable(target_heatmaps)
         if valid_vars['use_cuda']:
-            data = data.cuda()
             target_joints = target_joints.cuda()
             target_heatmaps = target_heatmaps.cuda()
             target_handroot = target_handroot.cuda()
@@ -167,42 +167,50 @@ def validate(valid_loader, model, optimizer, valid_vars, control_vars, verbose=T
 
     return valid_vars, control_vars
 
-model, optimizer, control_vars, valid_vars, train_control_vars = validator.parse_args(model_class=JORNet)
 
-if valid_vars['use_cuda']:
-    torch.set_default_tensor_type('torch.cuda.FloatTensor')
+def main():
+    model, optimizer, control_vars, valid_vars, train_control_vars = validator.parse_args(model_class=JORNet)
 
-'''
-visualize.plot_line(valid_vars['losses'], 'Main loss')
-visualize.show()
+    if valid_vars['use_cuda']:
+        torch.set_default_tensor_type('torch.cuda.FloatTensor')
 
-visualize.plot_line(valid_vars['losses_heatmaps'], 'batch_halnetHeatmap loss')
-visualize.show()
+    '''
+    visualize.plot_line(valid_vars['losses'], 'Main loss')
+    visualize.show()
 
-visualize.plot_line(valid_vars['losses_joints'], 'Joint loss')
-visualize.show()
-'''
+    visualize.plot_line(valid_vars['losses_heatmaps'], 'batch_halnetHeatmap loss')
+    visualize.show()
 
-valid_loader = synthhands_handler.get_SynthHands_validloader(root_folder=valid_vars['root_folder'],
-                                                             joint_ixs=model.joint_ixs,
-                                                             heatmap_res=(128, 128),
-                                                             batch_size=control_vars['max_mem_batch'],
-                                                             verbose=control_vars['verbose'],
-                                                             crop_hand=True)
-control_vars['num_batches'] = len(valid_loader)
-control_vars['n_iter_per_epoch'] = int(len(valid_loader) / control_vars['iter_size'])
-control_vars['num_iter'] = len(valid_loader)
+    visualize.plot_line(valid_vars['losses_joints'], 'Joint loss')
+    visualize.show()
+    '''
 
-control_vars['tot_iter'] = int(len(valid_loader) / control_vars['iter_size'])
-control_vars['start_iter_mod'] = control_vars['start_iter'] % control_vars['tot_iter']
+    valid_loader = synthhands_handler.get_SynthHands_validloader(root_folder=valid_vars['root_folder'],
+                                                                 joint_ixs=model.joint_ixs,
+                                                                 heatmap_res=(128, 128),
+                                                                 batch_size=control_vars['max_mem_batch'],
+                                                                 verbose=control_vars['verbose'],
+                                                                 crop_hand=True,
+                                                                 cache_bytes=control_vars['cache_mb'] * 2**20,
+                                                                 num_workers=control_vars['num_workers'])
+    control_vars['num_batches'] = len(valid_loader)
+    control_vars['n_iter_per_epoch'] = int(len(valid_loader) / control_vars['iter_size'])
+    control_vars['num_iter'] = len(valid_loader)
 
-trainer.print_header_info(model, valid_loader, control_vars)
+    control_vars['tot_iter'] = int(len(valid_loader) / control_vars['iter_size'])
+    control_vars['start_iter_mod'] = control_vars['start_iter'] % control_vars['tot_iter']
 
-control_vars['curr_iter'] = 1
-control_vars['curr_epoch_iter'] = 1
+    trainer.print_header_info(model, valid_loader, control_vars)
 
-valid_vars['total_loss'] = 0
-valid_vars['total_pixel_loss'] = [0] * len(model.joint_ixs)
-valid_vars['total_pixel_loss_sample'] = [0] * len(model.joint_ixs)
+    control_vars['curr_iter'] = 1
+    control_vars['curr_epoch_iter'] = 1
 
-valid_vars, control_vars = validate(valid_loader, model, optimizer, valid_vars, control_vars, control_vars['verbose'])
\ No newline at end of file
+    valid_vars['total_loss'] = 0
+    valid_vars['total_pixel_loss'] = [0] * len(model.joint_ixs)
+    valid_vars['total_pixel_loss_sample'] = [0] * len(model.joint_ixs)
+
+    valid_vars, control_vars = validate(valid_loader, model, optimizer, valid_vars, control_vars, control_vars['verbose'])
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 import torch
 from torch.autograd import Variable
+import converter as conv
 import synthhands_handler
 import egodexter_handler
 import trainer
@@ -35,9 +36,9 @@ def validate(valid_loader, model, optimizer, valid_vars, control_vars, verbose=T
         target_heatmaps, target_joints, target_handroot = target
         # make target joints be relative
         target_joints = target_joints[:, 3:]
+        data = conv.batch_to_device_float(data, valid_vars['use_cuda'])
         data, target_heatmaps = Variable(data), Variable(target_heatmaps)
         if valid_vars['use_cuda']:
-            data = data.cuda()
             target_joints = target_joints.cuda()
             target_heatmaps = target_heatmaps.cuda()
             target_handroot = target_handroot.cuda()
@@ -72,6 +72,10 @@ def parse_args(model_class):
                         help='Whether to use cuda for training')
     parser.add_argument('--split_filename', default='', required=False,
                         help='Split filename for the file with dataset splits')
+    parser.add_argument('--cache_mb', type=int, dest='cache_mb', default=0,
+                        help='Size in MB of the shared-memory cache of decoded samples (default 0: no cache)')
+    parser.add_argument('--num_workers', type=int, dest='num_workers', default=0,
+                        help='Number of DataLoader worker processes (default 0)')
     args = parser.parse_args()
 
     control_vars, valid_vars = initialize_vars(args)
@@ -102,6 +106,8 @@ def parse_args(model_class):
 
     control_vars['num_epochs'] = 100
     control_vars['verbose'] = True
+    control_vars['cache_mb'] = args.cache_mb
+    control_vars['num_workers'] = args.num_workers
 
     if valid_vars['cross_entropy']:
         print_verbose("Using cross entropy loss", args.verbose)